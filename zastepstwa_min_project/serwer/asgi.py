@@ -2,4 +2,5 @@
 import os
 from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'serwer.settings')
+# serwer ASGI (np. `uvicorn serwer.asgi:application`) obsługuje też strumień SSE api/events/stream
 application = get_asgi_application()
@@ -17,6 +17,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'zastepstwa.metrics.MetricsMiddleware',  # pierwszy: mierzy całe żądanie; wyłączony = pomijany
+    'zastepstwa.routers.ReplicaRoutingMiddleware',  # GET-y na replikę; bez repliki = pomijany
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -50,8 +52,29 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # połączenie trwałe: jedno na wątek, sprawdzane przed ponownym użyciem (zamiast nowego co żądanie)
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        # testy współbieżności (zastepstwa/tests.py) potrzebują blokad pliku – baza w pamięci ich nie oddaje
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
+# Replika do odczytów (zastepstwa/routers.py) – np. lokalnie druga baza SQLite jako kopia db.sqlite3,
+# w testach 'TEST': {'MIRROR': 'default'}:
+# DATABASES['replica'] = {
+#     'ENGINE': 'django.db.backends.sqlite3',
+#     'NAME': BASE_DIR / 'db-replica.sqlite3',
+#     'CONN_MAX_AGE': 60,
+#     'CONN_HEALTH_CHECKS': True,
+# }
+DATABASE_ROUTERS = ['zastepstwa.routers.PrimaryReplicaRouter']
+# PostgreSQL (zakresy tstzrange + ograniczenie wykluczające, zob. zastepstwa/pgranges.py):
+# DATABASES = {
+#     'default': {
+#         'ENGINE': 'django.db.backends.postgresql',
+#         'NAME': 'zastepstwa', 'USER': 'zastepstwa', 'PASSWORD': '', 'HOST': 'localhost', 'PORT': 5432,
+#     }
+# }
 
 LANGUAGE_CODE = 'pl-pl'
 TIME_ZONE = 'Europe/Warsaw'
@@ -60,3 +83,11 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Metryki per widok (zastepstwa/metrics.py): /metrics dla Prometheusa, /metrics/summary/ dla obsługi
+ZASTEPSTWA_METRICS = False
+ZASTEPSTWA_SLOW_QUERY_MS = 200
+ZASTEPSTWA_ASYNC_API = False   # True: async wersje api/events i api/substitutions* (pod ASGI)
+ZASTEPSTWA_PG_RANGES = True   # na PostgreSQL: zapytania po kolumnach span (GiST) zamiast start/end
+ZASTEPSTWA_REPLICA_DB = 'replica'          # alias z DATABASES; brak aliasu = wszystko na 'default'
+ZASTEPSTWA_REPLICA_STICKY_SECONDS = 10     # po zapisie klient tyle czyta z bazy głównej
@@ -1,11 +1,15 @@
 from django.contrib import admin
-from .models import Subject, Lecturer, ClassSession, Substitution
+from .adminlist import AutocompleteFilter, KeysetAdminMixin
+from .models import (
+    Subject, Lecturer, LecturerUnavailability, ClassSession, Substitution, RecurringSession, RecurrenceException,
+)
 
 
 @admin.register(Subject)
 class SubjectAdmin(admin.ModelAdmin):
     list_display = ("code", "name")
     search_fields = ("code", "name")
+    ordering = ("code",)  # stała kolejność stron wyszukiwarki (autocomplete)
 
 
 @admin.register(Lecturer)
@@ -13,21 +17,57 @@ class LecturerAdmin(admin.ModelAdmin):
     list_display = ("first_name", "last_name", "email",
                     "max_substitutions_per_week", "max_hours_per_week")
     search_fields = ("first_name", "last_name", "email")
+    ordering = ("last_name", "first_name", "id")
     filter_horizontal = ("subjects",)  # przedmioty = „uprawnienia”
 
 
+# duże tabele (zastepstwa/adminlist.py): select_related pod __str__ w list_display, filtry
+# z wyszukiwarką zamiast list wszystkich wykładowców, stronicowanie po kluczu bez COUNT(*) całości
+
 @admin.register(ClassSession)
-class ClassSessionAdmin(admin.ModelAdmin):
+class ClassSessionAdmin(KeysetAdminMixin, admin.ModelAdmin):
     list_display = ("subject", "lecturer", "start", "end", "needs_substitution")
-    list_filter = ("needs_substitution", "lecturer", "subject")
+    list_filter = ("needs_substitution", ("lecturer", AutocompleteFilter), ("subject", AutocompleteFilter))
+    list_select_related = ("subject", "lecturer")
+    date_hierarchy = "start"  # indeks session_range_idx (start, end)
+    ordering = ("-start", "-id")
     search_fields = ("subject__code", "subject__name",
                      "lecturer__first_name", "lecturer__last_name")
     autocomplete_fields = ("subject", "lecturer")
 
 
 @admin.register(Substitution)
-class SubstitutionAdmin(admin.ModelAdmin):
+class SubstitutionAdmin(KeysetAdminMixin, admin.ModelAdmin):
     list_display = ("session", "substitute_lecturer", "created_at")
+    list_filter = (("substitute_lecturer", AutocompleteFilter),)
+    # ClassSession.__str__ sięga po przedmiot i wykładowcę
+    list_select_related = ("session__subject", "session__lecturer", "substitute_lecturer")
+    ordering = ("-id",)
     search_fields = ("session__subject__code", "session__subject__name",
                      "substitute_lecturer__first_name", "substitute_lecturer__last_name")
     autocomplete_fields = ("session", "substitute_lecturer")
+
+
+@admin.register(LecturerUnavailability)
+class LecturerUnavailabilityAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    list_display = ("lecturer", "start", "end", "reason")
+    list_filter = (("lecturer", AutocompleteFilter),)
+    list_select_related = ("lecturer",)
+    ordering = ("-start", "-id")
+    search_fields = ("lecturer__first_name", "lecturer__last_name", "reason")
+    autocomplete_fields = ("lecturer",)
+
+
+class RecurrenceExceptionInline(admin.TabularInline):
+    model = RecurrenceException
+    extra = 0
+
+
+@admin.register(RecurringSession)
+class RecurringSessionAdmin(KeysetAdminMixin, admin.ModelAdmin):
+    list_display = ("subject", "lecturer", "start", "end", "freq", "interval", "until")
+    list_filter = ("freq", ("lecturer", AutocompleteFilter), ("subject", AutocompleteFilter))
+    list_select_related = ("subject", "lecturer")
+    ordering = ("-id",)
+    autocomplete_fields = ("subject", "lecturer")
+    inlines = [RecurrenceExceptionInline]
@@ -0,0 +1,185 @@
+"""
+Listy w panelu admina dla tabel po kilkaset tysięcy wierszy (zajęcia, zastępstwa).
+
+- AutocompleteFilter – filtr po kluczu obcym z wyszukiwarką (widok autocomplete admina)
+  zamiast listy wszystkich wykładowców/przedmiotów w panelu filtrów,
+- ApproximateCountPaginator – bez filtrów na PostgreSQL liczba wierszy ze statystyk
+  (pg_class.reltuples) zamiast COUNT(*) przy każdej stronie,
+- KeysetAdminMixin – stronicowanie po kluczu (`?after=<wartości ostatniego wiersza>`) dla
+  domyślnego sortowania: kolejna strona to sonda po indeksie, a nie OFFSET przez całą tabelę.
+  Po kliknięciu w nagłówek kolumny (inne sortowanie) lista wraca do zwykłych numerów stron.
+  date_hierarchy na poziomie lat i miesięcy bierze zakres z MIN/MAX (indeks) zamiast DISTINCT
+  po wszystkich wierszach.
+"""
+from datetime import date
+
+from django.contrib import admin
+from django.contrib.admin import widgets
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.templatetags.admin_list import date_hierarchy
+from django.contrib.admin.views.main import ALL_VAR, ORDER_VAR, ChangeList
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min
+from django.forms import Media
+from django.utils import formats, timezone
+from django.utils.functional import cached_property
+from django.utils.text import capfirst
+from django.utils.translation import gettext
+
+from .listing import CURSOR_VAR, InvalidCursor, keyset_page
+
+APPROXIMATE_FROM = 10000  # poniżej statystyki bywają nieaktualne, a COUNT(*) i tak jest tani
+
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Filtr po kluczu obcym z polem wyszukiwania (select2 jak w autocomplete_fields).
+    Admin modelu docelowego musi mieć search_fields. Użycie: list_filter = [("lecturer", AutocompleteFilter)]
+    (ModelAdmin z KeysetAdminMixin dołącza skrypty select2).
+    """
+
+    template = "admin/zastepstwa/autocomplete_filter.html"
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.attname}__exact"
+        self.lookup_val = params.get(self.lookup_kwarg)
+        self.app_label, self.model_name = model._meta.app_label, model._meta.model_name
+        super().__init__(field, request, params, model, model_admin, field_path)
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    @cached_property
+    def selected_label(self):
+        if not self.lookup_val:
+            return ""
+        try:
+            obj = self.field.remote_field.model._default_manager.filter(pk=self.lookup_val).first()
+        except (ValueError, ValidationError):
+            return ""
+        return str(obj) if obj is not None else ""
+
+    def choices(self, changelist):
+        yield {
+            "selected": self.lookup_val is None,
+            "query_string": changelist.get_query_string(remove=[self.lookup_kwarg]),
+            "display": "Wszystkie",
+        }
+
+
+class ApproximateCountPaginator(Paginator):
+    """Paginator z przybliżoną liczbą wierszy niefiltrowanej tabeli (PostgreSQL, po ANALYZE)."""
+
+    @cached_property
+    def count(self):
+        qs = self.object_list
+        connection = connections[qs.db]
+        if connection.vendor == "postgresql" and not qs.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                               [qs.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= APPROXIMATE_FROM:
+                return row[0]
+        return qs.count()
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList ze stronicowaniem po kluczu dla domyślnego sortowania (ModelAdmin.ordering)."""
+
+    def __init__(self, request, *args, **kwargs):
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+        # kursor nie jest filtrem – linki filtrów i sortowania mają wracać na pierwszą stronę
+        self.params.pop(CURSOR_VAR, None)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    @cached_property
+    def keyset_ordering(self):
+        ordering = self.model_admin.ordering or ()
+        if not ordering or ORDER_VAR in self.params or ALL_VAR in self.params:
+            return None
+        return list(ordering)
+
+    @cached_property
+    def date_hierarchy_links(self):
+        """
+        Kontekst szablonu admin/date_hierarchy.html. Lata i miesiące – z zakresu MIN/MAX (dwie sondy po
+        indeksie; w zakresie mogą trafić się puste), dni jednego miesiąca – jak w adminie (DISTINCT).
+        """
+        field = self.date_hierarchy
+        year_field, month_field = f"{field}__year", f"{field}__month"
+        year = self.params.get(year_field)
+        if self.params.get(month_field):
+            return date_hierarchy(self)
+        span = self.queryset.aggregate(first=Min(field), last=Max(field))
+        if span["first"] is None:
+            return {"show": True, "back": None, "choices": []}
+        first, last = (timezone.localtime(v) if timezone.is_aware(v) else v for v in (span["first"], span["last"]))
+        if not year and (first.year, first.month) == (last.year, last.month):
+            return date_hierarchy(self)  # jeden miesiąc – admin sam przejdzie do dni
+
+        def link(filters):
+            return self.get_query_string(filters, [f"{field}__"])
+
+        if year or first.year == last.year:
+            year = int(year or first.year)
+            return {
+                "show": True,
+                "back": {"link": link({}), "title": gettext("All dates")},
+                "choices": [
+                    {"link": link({year_field: year, month_field: month}),
+                     "title": capfirst(formats.date_format(date(year, month, 1), "YEAR_MONTH_FORMAT"))}
+                    for month in range(first.month, last.month + 1)
+                ],
+            }
+        return {
+            "show": True,
+            "back": None,
+            "choices": [{"link": link({year_field: str(y)}), "title": str(y)}
+                        for y in range(first.year, last.year + 1)],
+        }
+
+    def get_results(self, request):
+        if self.keyset_ordering is None:
+            return super().get_results(request)
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        cursor = request.GET.get(CURSOR_VAR)
+        try:
+            rows, self.next_cursor = keyset_page(self.queryset, self.keyset_ordering, cursor, self.list_per_page)
+        except InvalidCursor as e:
+            raise IncorrectLookupParameters(e)
+
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = bool(cursor or self.next_cursor)
+        self.paginator = paginator
+        self.keyset_first_url = self.get_query_string(remove=[CURSOR_VAR]) if cursor else None
+        self.keyset_next_url = (self.get_query_string({CURSOR_VAR: self.next_cursor})
+                                if self.next_cursor else None)
+
+
+class KeysetAdminMixin:
+    """ModelAdmin dla dużych tabel: keyset + przybliżony licznik + skrypty AutocompleteFilter."""
+
+    change_list_template = "admin/zastepstwa/keyset_change_list.html"
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    @property
+    def media(self):
+        select2 = widgets.AutocompleteSelect(None, self.admin_site).media
+        return super().media + select2 + Media(js=["zastepstwa/admin_filters.js"])
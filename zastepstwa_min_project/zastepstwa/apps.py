@@ -5,3 +5,10 @@ class ZastepstwaConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'zastepstwa'
     verbose_name = 'Zastępstwa (prosta wersja)'
+
+    def ready(self):
+        from . import signals  # noqa: F401  (rejestracja odbiorników)
+        from .metrics import install_wrapper, metrics_enabled
+        if metrics_enabled():
+            from django.db.backends.signals import connection_created
+            connection_created.connect(install_wrapper, dispatch_uid="zastepstwa.metrics")
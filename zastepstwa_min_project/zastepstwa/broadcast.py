@@ -0,0 +1,68 @@
+"""
+Rozgłaszanie zmian do otwartych kalendarzy (Server-Sent Events).
+
+Domyślny `InProcessBroadcaster` działa w obrębie jednego procesu ASGI (wystarcza lokalnie
+i w testach). Przy kilku procesach podmień go w ustawieniach na implementację opartą
+o brokera (Redis pub/sub itp.) – wystarczy klasa z metodami subscribe/unsubscribe/publish:
+
+    ZASTEPSTWA_BROADCASTER = "moj_modul.RedisBroadcaster"
+"""
+import asyncio
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class InProcessBroadcaster:
+    QUEUE_SIZE = 32
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # queue -> pętla zdarzeń, w której żyje subskrybent
+
+    def subscribe(self) -> asyncio.Queue:
+        """Rejestruje subskrybenta w bieżącej pętli asyncio (wołać z widoku async)."""
+        queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[queue] = asyncio.get_running_loop()
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.pop(queue, None)
+
+    def publish(self, message: dict):
+        """Bezpieczne wątkowo – można wołać z kodu synchronicznego (sygnały, on_commit)."""
+        with self._lock:
+            targets = list(self._subscribers.items())
+        for queue, loop in targets:
+            try:
+                loop.call_soon_threadsafe(self._put, queue, message)
+            except RuntimeError:
+                # pętla już zamknięta – subskrybent zniknął bez wypisania się
+                self.unsubscribe(queue)
+
+    @staticmethod
+    def _put(queue, message):
+        if queue.full():
+            # wolny klient: zostawiamy najnowsze (i tak liczy się tylko ostatnia wersja)
+            queue.get_nowait()
+        queue.put_nowait(message)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                path = getattr(settings, "ZASTEPSTWA_BROADCASTER", None)
+                _broadcaster = import_string(path)() if path else InProcessBroadcaster()
+    return _broadcaster
@@ -0,0 +1,85 @@
+"""
+Indeks zajętości wykładowców w pamięci – do zadań wsadowych (planer, import), które pytają
+„czy [start, end) nachodzi na coś u wykładowcy X?” tysiące razy.
+
+Dla każdego wykładowcy trzymamy scalone, rozłączne i posortowane przedziały, więc zapytanie
+to jedno wyszukiwanie binarne (O(log n)); wstawienie scala z sąsiadami. Indeks ładuje się
+jednym zapytaniem na okno dat (`IntervalIndex.load`) albo z gotowych wierszy.
+"""
+import bisect
+from collections import defaultdict
+
+from .services import busy_intervals
+
+
+class Intervals:
+    """Scalone przedziały półotwarte [start, end) jednego wykładowcy."""
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, intervals=()):
+        self.starts, self.ends = [], []
+        for start, end in sorted(intervals):
+            if self.ends and start < self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def overlaps(self, start, end) -> bool:
+        # rozłączne przedziały: wystarczy ostatni zaczynający się przed `end`
+        i = bisect.bisect_left(self.starts, end)
+        return bool(i) and self.ends[i - 1] > start
+
+    def add(self, start, end):
+        """Wstawia przedział, scalając go z nachodzącymi sąsiadami."""
+        lo = bisect.bisect_left(self.ends, start)   # pierwszy kończący się po `start`
+        hi = bisect.bisect_left(self.starts, end)   # pierwszy zaczynający się od `end`
+        if lo < hi:
+            start = min(start, self.starts[lo])
+            end = max(end, self.ends[hi - 1])
+        self.starts[lo:hi] = [start]
+        self.ends[lo:hi] = [end]
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+
+class IntervalIndex:
+    """{lecturer_id: Intervals} z zapytaniami po wykładowcy."""
+
+    def __init__(self, rows=()):
+        """`rows`: iterowalne (start, end, lecturer_id)."""
+        grouped = defaultdict(list)
+        for start, end, lecturer_id in rows:
+            grouped[lecturer_id].append((start, end))
+        self._by_lecturer = {lid: Intervals(items) for lid, items in grouped.items()}
+
+    @classmethod
+    def load(cls, start, end, lecturer_ids=None, exclude_session_ids=()):
+        """Zajęcia realnie prowadzone i nieobecności w [start, end) – jedno zapytanie."""
+        return cls(busy_intervals(start, end, lecturer_ids, exclude_session_ids))
+
+    def overlaps(self, lecturer_id, start, end) -> bool:
+        intervals = self._by_lecturer.get(lecturer_id)
+        return intervals is not None and intervals.overlaps(start, end)
+
+    def is_free(self, lecturer_id, start, end) -> bool:
+        return not self.overlaps(lecturer_id, start, end)
+
+    def add(self, lecturer_id, start, end):
+        intervals = self._by_lecturer.get(lecturer_id)
+        if intervals is None:
+            intervals = self._by_lecturer[lecturer_id] = Intervals()
+        intervals.add(start, end)
+
+    def busy_ids(self, start, end, lecturer_ids=None):
+        """Odpowiednik busy_lecturer_ids() bez zapytania do bazy."""
+        ids = self._by_lecturer if lecturer_ids is None else lecturer_ids
+        return {lid for lid in ids if self.overlaps(lid, start, end)}
+
+    def __getitem__(self, lecturer_id):
+        return self._by_lecturer.get(lecturer_id) or Intervals()
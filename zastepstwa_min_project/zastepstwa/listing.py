@@ -0,0 +1,81 @@
+"""
+Listy bez ładowania całych tabel: stronicowanie po kluczu i wyszukiwanie po prefiksie.
+
+Strona po kluczu (`?after=<wartości ostatniego wiersza>`) to warunek „za tym wierszem” w kolejności
+sortowania + LIMIT – sonda po indeksie sortowania zamiast OFFSET, więc każda strona kosztuje tyle
+samo. Kolejność musi być jednoznaczna (na końcu unikalne pole, np. id). Kursor to lista JSON
+tych wartości w base64 (URL-safe) – dowolne znaki w nazwiskach czy kodach nie psują podziału.
+
+Wyszukiwanie: każde słowo zapytania ma być początkiem któregoś z pól (istartswith). Na PostgreSQL
+migracja 0014 zakłada indeksy trigramowe GIN na UPPER(pole), więc `UPPER(pole) LIKE 'KOW%'` nie
+przegląda całej tabeli; na SQLite to skan kilku tysięcy krótkich wierszy.
+"""
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+CURSOR_VAR = "after"
+MAX_TERMS = 5
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def after_q(model, ordering, cursor):
+    """Warunek „za wierszem o wartościach z kursora” dla `ordering` (np. ["last_name", "id"], "-" = malejąco)."""
+    values = _decode(cursor)
+    if len(values) != len(ordering):
+        raise InvalidCursor(cursor)
+    condition, equal = Q(), {}
+    for name, value in zip(ordering, values):
+        field = name.lstrip("-")
+        try:
+            value = model._meta.get_field(field).to_python(value)
+        except ValidationError as e:
+            raise InvalidCursor(cursor) from e
+        condition |= Q(**equal, **{f"{field}__{'lt' if name.startswith('-') else 'gt'}": value})
+        equal[field] = value
+    return condition
+
+
+def cursor_of(obj, ordering):
+    """Kursor wskazujący na `obj` (wartości pól sortowania; daty w ISO)."""
+    values = [obj._meta.get_field(name.lstrip("-")).value_from_object(obj) for name in ordering]
+    values = [v.isoformat() if hasattr(v, "isoformat") else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode().rstrip("=")
+
+
+def _decode(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):  # także UnicodeDecodeError i błędy JSON
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+def keyset_page(qs, ordering, cursor=None, per_page=50):
+    """(wiersze, kursor następnej strony albo None) – jedno zapytanie z LIMIT per_page + 1."""
+    qs = qs.order_by(*ordering)
+    if cursor:
+        qs = qs.filter(after_q(qs.model, ordering, cursor))
+    rows = list(qs[:per_page + 1])
+    if len(rows) <= per_page:
+        return rows, None
+    rows = rows[:per_page]
+    return rows, cursor_of(rows[-1], ordering)
+
+
+def prefix_q(query, fields):
+    """Każde słowo `query` jest początkiem któregoś z `fields` (bez słów = bez ograniczeń)."""
+    condition = Q()
+    for term in query.split()[:MAX_TERMS]:
+        condition &= reduce(or_, (Q(**{f"{field}__istartswith": term}) for field in fields))
+    return condition
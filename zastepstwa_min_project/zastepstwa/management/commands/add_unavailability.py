@@ -0,0 +1,99 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_time
+
+from zastepstwa.models import Lecturer, LecturerUnavailability
+
+
+class Command(BaseCommand):
+    help = (
+        "Masowe wprowadzanie nieobecności / stałych blokad wykładowcy, np. etat częściowy:\n"
+        "  add_unavailability kowalska@uczelnia.pl --from 2025-10-01 --until 2026-01-31 "
+        "--weekdays 1,3 --start 08:00 --end 12:00 --reason 'etat 1/2'"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("lecturer", help="id, e-mail albo \"Imię Nazwisko\"")
+        parser.add_argument("--from", dest="date_from", required=True, help="pierwszy dzień (YYYY-MM-DD)")
+        parser.add_argument("--until", dest="date_until", help="ostatni dzień włącznie (domyślnie = --from)")
+        parser.add_argument("--weekdays", default="1,2,3,4,5,6,7",
+                            help="dni tygodnia 1=pon … 7=ndz, po przecinku (domyślnie wszystkie)")
+        parser.add_argument("--every", type=int, default=1, help="co ile tygodni (domyślnie 1)")
+        parser.add_argument("--start", help="godzina początku (domyślnie cały dzień)")
+        parser.add_argument("--end", help="godzina końca")
+        parser.add_argument("--reason", default="")
+        parser.add_argument("--replace", action="store_true",
+                            help="usuń wcześniejsze blokady tego wykładowcy nachodzące na zakres")
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        lecturer = self._lecturer(options["lecturer"])
+        first = parse_date(options["date_from"] or "")
+        last = parse_date(options["date_until"] or "") if options["date_until"] else first
+        if not first or not last or last < first:
+            raise CommandError("Nieprawidłowy zakres dat.")
+        try:
+            weekdays = {int(d) for d in options["weekdays"].split(",") if d.strip()}
+        except ValueError:
+            raise CommandError("--weekdays: liczby 1–7 po przecinku.")
+        if not weekdays or not weekdays <= set(range(1, 8)):
+            raise CommandError("--weekdays: liczby 1–7 po przecinku.")
+
+        t_start = parse_time(options["start"]) if options["start"] else time(0, 0)
+        t_end = parse_time(options["end"]) if options["end"] else None
+        if t_start is None or (options["end"] and t_end is None):
+            raise CommandError("Nieprawidłowa godzina.")
+        if t_end is not None and t_end <= t_start:
+            raise CommandError("--end musi być po --start.")
+
+        tz = timezone.get_current_timezone()
+        first_monday = first - timedelta(days=first.weekday())
+        blocks = []
+        day = first
+        while day <= last:
+            week_no = (day - first_monday).days // 7
+            if day.isoweekday() in weekdays and week_no % max(1, options["every"]) == 0:
+                start = timezone.make_aware(datetime.combine(day, t_start), tz)
+                end = timezone.make_aware(
+                    datetime.combine(day, t_end) if t_end else datetime.combine(day + timedelta(days=1), time(0, 0)),
+                    tz,
+                )
+                blocks.append(LecturerUnavailability(lecturer=lecturer, start=start, end=end,
+                                                     reason=options["reason"]))
+            day += timedelta(days=1)
+
+        if options["dry_run"]:
+            for b in blocks[:10]:
+                self.stdout.write(f"  {timezone.localtime(b.start):%Y-%m-%d %a %H:%M} – "
+                                  f"{timezone.localtime(b.end):%H:%M}")
+            self.stdout.write(f"{len(blocks)} blokad dla {lecturer} (--dry-run, bez zapisu).")
+            return
+
+        with transaction.atomic():
+            removed = 0
+            if options["replace"] and blocks:
+                removed, _ = LecturerUnavailability.objects.filter(
+                    lecturer=lecturer, start__lt=blocks[-1].end, end__gt=blocks[0].start
+                ).delete()
+            LecturerUnavailability.objects.bulk_create(blocks)
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Dodano {len(blocks)} blokad dla {lecturer}" + (f" (usunięto {removed})." if removed else ".")
+        ))
+
+    def _lecturer(self, ref):
+        ref = ref.strip()
+        if ref.isdigit():
+            qs = Lecturer.objects.filter(id=int(ref))
+        elif "@" in ref:
+            qs = Lecturer.objects.filter(email__iexact=ref)
+        else:
+            first, _, last = ref.partition(" ")
+            qs = Lecturer.objects.filter(Q(first_name__iexact=first, last_name__iexact=last.strip()))
+        found = list(qs[:2])
+        if len(found) != 1:
+            raise CommandError(f"Nie znaleziono jednoznacznie wykładowcy {ref!r}.")
+        return found[0]
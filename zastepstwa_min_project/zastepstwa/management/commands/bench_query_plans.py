@@ -0,0 +1,108 @@
+import time as _time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from zastepstwa import synthetic
+from zastepstwa.models import ClassSession, Substitution
+from zastepstwa.services import (
+    busy_lecturer_ids, compute_loads, week_bounds, week_loads, week_start_of, _duration,
+)
+
+INDEXES = ("session_lecturer_range_idx", "session_range_idx", "subst_lecturer_session_idx",
+           "unavail_lecturer_range_idx")
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Plany zapytań (EXPLAIN) i czasy gorących ścieżek z indeksami i bez nich. "
+        "Opcjonalnie generuje syntetyczne dane (UWAGA: zapisuje do bieżącej bazy)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--generate", type=int, default=0,
+                            help="ile syntetycznych zajęć dodać przed pomiarem (np. 500000)")
+        parser.add_argument("--lecturers", type=int, default=0,
+                            help="liczba wykładowców dla --generate (domyślnie sesje/500)")
+        parser.add_argument("--repeat", type=int, default=5, help="powtórzenia pomiaru czasu")
+        parser.add_argument("--no-compare", action="store_true",
+                            help="nie porównuj z planem bez indeksów")
+
+    def handle(self, *args, **options):
+        if options["generate"]:
+            self._generate(options["generate"], options["lecturers"])
+
+        sample = ClassSession.objects.order_by("id").values("id", "lecturer_id", "start", "end").last()
+        if not sample:
+            self.stderr.write("Brak zajęć w bazie – użyj --generate.")
+            return
+
+        self.stdout.write(f"Baza: {connection.vendor}, zajęć: {ClassSession.objects.count()}")
+        self.stdout.write(self.style.MIGRATE_HEADING("== Z indeksami =="))
+        self._report(sample, options["repeat"])
+
+        if options["no_compare"]:
+            return
+        # DROP INDEX w transakcji, którą na końcu wycofujemy (SQLite i PostgreSQL mają transakcyjny DDL)
+        self.stdout.write(self.style.MIGRATE_HEADING("== Bez indeksów (wycofane po pomiarze) =="))
+        connection.close()  # świeże połączenie = brak zapamiętanych planów (cache instrukcji sqlite3)
+        try:
+            with transaction.atomic():
+                with connection.cursor() as cur:
+                    for name in INDEXES:
+                        cur.execute(f"DROP INDEX {connection.ops.quote_name(name)}")
+                self._report(sample, options["repeat"])
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    # -------------------- pomiary --------------------
+
+    def _queries(self, s):
+        start, end = s["start"], s["end"]
+        week_start, week_end = week_bounds(start)
+        window_end = start + timedelta(days=7)
+        return [
+            ("api_events (zakres tygodnia)",
+             ClassSession.objects.filter(start__lt=window_end, end__gt=start), None),
+            ("kolizja wykładowcy (exists)",
+             ClassSession.objects.filter(lecturer_id=s["lecturer_id"], start__lt=end, end__gt=start), None),
+            ("zastępstwa wykładowcy w tygodniu",
+             Substitution.objects.filter(substitute_lecturer_id=s["lecturer_id"],
+                                         session__start__gte=week_start, session__start__lt=week_end), None),
+            ("stats_view (miesiąc)",
+             ClassSession.objects.filter(start__gte=start - timedelta(days=30), start__lt=start,
+                                         substitution__substitute_lecturer__isnull=False)
+             .values("substitution__substitute_lecturer_id").annotate(dur=Sum(_duration())), None),
+            ("busy_lecturer_ids", None, lambda: busy_lecturer_ids(start, end)),
+            ("compute_loads (tydzień od zera)", None, lambda: compute_loads(week_start, week_end)),
+            ("week_loads (LecturerWeekLoad)", None,
+             lambda: week_loads(week_start_of(start), [s["lecturer_id"]])),
+        ]
+
+    def _report(self, sample, repeat):
+        for label, qs, fn in self._queries(sample):
+            self.stdout.write(self.style.SQL_KEYWORD(f"-- {label}"))
+            if qs is not None:
+                self.stdout.write(qs.explain())
+                fn = (lambda qs=qs: list(qs[:1000]))
+            timings = []
+            for _ in range(max(1, repeat)):
+                t0 = _time.perf_counter()
+                fn()
+                timings.append((_time.perf_counter() - t0) * 1000)
+            timings.sort()
+            self.stdout.write(f"   czas: min {timings[0]:.2f} ms, mediana {timings[len(timings) // 2]:.2f} ms")
+
+    # -------------------- dane syntetyczne --------------------
+
+    def _generate(self, n_sessions, n_lecturers):
+        n_lecturers = n_lecturers or max(20, n_sessions // 500)
+        self.stdout.write(f"Generuję {n_lecturers} wykładowców i {n_sessions} zajęć…")
+        synthetic.generate(lecturers=n_lecturers, sessions=n_sessions, progress=self.stdout.write)
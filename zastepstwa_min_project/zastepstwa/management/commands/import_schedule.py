@@ -0,0 +1,383 @@
+import csv
+import time as _time
+from contextlib import nullcontext
+from itertools import chain, islice
+from datetime import datetime, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime, parse_time
+
+from zastepstwa import pgranges
+from zastepstwa.intervals import IntervalIndex
+from zastepstwa.models import ClassSession, Lecturer, Subject
+from zastepstwa.recurrence import virtual_occurrences
+from zastepstwa.services import bump_data_version, local_date, refresh_loads
+
+MAX_REPORTED = 20
+CSV_FIELDS = ("subject", "lecturer", "date", "start", "end", "needs_substitution")
+
+
+class Row:
+    __slots__ = ("source", "subject", "lecturer", "start", "end", "needs_substitution", "subject_id", "lecturer_id")
+
+    def __init__(self, source, subject, lecturer, start, end, needs_substitution=False):
+        self.source = source
+        self.subject, self.lecturer = subject, lecturer
+        self.start, self.end = start, end
+        self.needs_substitution = needs_substitution
+        self.subject_id = self.lecturer_id = None
+
+
+def _aware(dt):
+    return timezone.make_aware(dt, timezone.get_current_timezone()) if timezone.is_naive(dt) else dt
+
+
+def _key(text):
+    return " ".join((text or "").split()).casefold()
+
+
+# -------------------- CSV --------------------
+
+def _lecturer_keys(text):
+    """Klucze wyszukiwania prowadzącego: "Imię Nazwisko", e-mail albo "Imię Nazwisko <e-mail>"."""
+    name, _, email = (text or "").partition("<")
+    return [_key(k) for k in (email.rstrip(">"), name) if _key(k)]
+
+
+def _truthy(value):
+    return _key(value) in ("1", "true", "tak", "t", "yes", "y", "x")
+
+
+def read_csv(path, errors):
+    """
+    Kolumny: subject (kod lub nazwa), lecturer (e-mail albo "Imię Nazwisko"), start, end
+    (ISO, np. 2025-10-06 08:15) albo date + start/end jako same godziny; opcjonalnie needs_substitution.
+    Separator (, ; tab) wykrywany automatycznie.
+    """
+    with open(path, newline="", encoding="utf-8-sig") as fh:
+        sample = fh.read(4096)
+        fh.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(fh, dialect=dialect)
+        reader.fieldnames = [_key(f) for f in reader.fieldnames or []]
+        missing = {"subject", "lecturer", "start", "end"} - set(reader.fieldnames)
+        if missing:
+            raise CommandError(f"{path}: brak kolumn {', '.join(sorted(missing))}")
+        for record in reader:
+            where = f"{path}:{reader.line_num}"
+            # za krótki wiersz ma w brakujących kolumnach None
+            field = {name: (record.get(name) or "").strip() for name in CSV_FIELDS}
+            try:
+                day = parse_date(field["date"]) if field["date"] else None
+                if day:
+                    start = datetime.combine(day, parse_time(field["start"]))
+                    end = datetime.combine(day, parse_time(field["end"]))
+                else:
+                    start, end = parse_datetime(field["start"]), parse_datetime(field["end"])
+                if start is None or end is None:
+                    raise ValueError
+            except (TypeError, ValueError):
+                errors.append((where, "nieprawidłowa data/godzina"))
+                continue
+            yield Row(where, field["subject"], field["lecturer"], _aware(start), _aware(end),
+                      _truthy(field["needs_substitution"]))
+
+
+# -------------------- iCalendar --------------------
+
+def _unfolded(fh):
+    # RFC 5545: linia zaczynająca się spacją/tabulatorem jest kontynuacją poprzedniej
+    buf, start = None, 0
+    for n, raw in enumerate(fh, 1):
+        line = raw.rstrip("\r\n")
+        if line[:1] in (" ", "\t") and buf is not None:
+            buf += line[1:]
+            continue
+        if buf is not None:
+            yield start, buf
+        buf, start = line, n
+    if buf is not None:
+        yield start, buf
+
+
+def _split(line):
+    head, _, value = line.partition(":")
+    name, *params = head.split(";")
+    return name.upper(), dict(p.partition("=")[::2] for p in params), value
+
+
+def _unescape(text):
+    return (text.replace("\\n", "\n").replace("\\N", "\n").replace("\\,", ",")
+            .replace("\\;", ";").replace("\\\\", "\\"))
+
+
+def _ics_datetime(value, params):
+    if params.get("VALUE") == "DATE" or "T" not in value:
+        return None  # wydarzenia całodniowe nie są zajęciami
+    dt = datetime.strptime(value.rstrip("Z"), "%Y%m%dT%H%M%S")
+    if value.endswith("Z"):
+        return dt.replace(tzinfo=dt_timezone.utc)
+    tzid = params.get("TZID", "").strip('"')
+    try:
+        return dt.replace(tzinfo=ZoneInfo(tzid)) if tzid else _aware(dt)
+    except (ZoneInfoNotFoundError, ValueError):
+        return _aware(dt)
+
+
+def read_ics(path, errors):
+    """
+    VEVENT-y: przedmiot z X-SUBJECT, CATEGORIES albo SUMMARY; prowadzący z X-LECTURER albo
+    ORGANIZER (CN lub mailto:). Reguły powtarzania (RRULE) nie są rozwijane – takie wpisy są pomijane.
+    """
+    with open(path, encoding="utf-8-sig") as fh:
+        event = None
+        for n, line in _unfolded(fh):
+            name, params, value = _split(line)
+            if name == "BEGIN" and value.upper() == "VEVENT":
+                event = {"line": n}
+            elif name == "END" and value.upper() == "VEVENT" and event is not None:
+                where = f"{path}:{event['line']}"
+                if "RRULE" in event:
+                    errors.append((where, "wydarzenie cykliczne (RRULE) – pominięte"))
+                elif not event.get("DTSTART") or not event.get("DTEND"):
+                    errors.append((where, "brak DTSTART/DTEND lub wydarzenie całodniowe"))
+                else:
+                    subject = event.get("X-SUBJECT") or event.get("CATEGORIES", "").split(",")[0] \
+                        or event.get("SUMMARY", "")
+                    lecturer = event.get("X-LECTURER") or event.get("ORGANIZER", "")
+                    yield Row(where, subject, lecturer, event["DTSTART"], event["DTEND"])
+                event = None
+            elif event is not None:
+                try:
+                    if name in ("DTSTART", "DTEND"):
+                        event[name] = _ics_datetime(value, params)
+                    elif name == "ORGANIZER":
+                        email = value[7:] if value.lower().startswith("mailto:") else ""
+                        cn = params.get("CN", "").strip('"')
+                        event[name] = f"{cn} <{email}>" if cn and email else cn or email
+                    else:
+                        event[name] = _unescape(value)
+                except ValueError:
+                    event[name] = None
+
+
+# -------------------- Komenda --------------------
+
+def _batches(rows, size):
+    rows = iter(rows)
+    return iter(lambda: list(islice(rows, size)), [])
+
+
+def _unique_code(text, taken, max_length=20):
+    """Kod nowego przedmiotu z jego nazwy; przy kolizji (np. ten sam początek długiej nazwy) z sufiksem -2, -3…"""
+    code, n = text[:max_length].strip(), 1
+    while _key(code) in taken:
+        n += 1
+        suffix = f"-{n}"
+        code = text[:max_length - len(suffix)].strip() + suffix
+    return code
+
+
+class Command(BaseCommand):
+    help = (
+        "Import planu zajęć z plików CSV/ICS: pliki czytane strumieniowo partiami, słowniki w pamięci, "
+        "kontrola kolizji prowadzącego przez przegląd posortowanych terminów, zapis bulk_create "
+        "partia po partii (każda w transakcji)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="+", help="pliki .csv lub .ics")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--create-missing", action="store_true",
+                            help="utwórz nieznane przedmioty i wykładowców zamiast odrzucać wiersze")
+        parser.add_argument("--dry-run", action="store_true", help="tylko walidacja, bez zapisu")
+        parser.add_argument("--strict", action="store_true",
+                            help="nie importuj niczego, jeśli którykolwiek wiersz jest błędny")
+
+    def handle(self, *args, **options):
+        errors = []
+        dry_run, strict = options["dry_run"], options["strict"]
+        create_missing = options["create_missing"] and not dry_run
+        subjects, lecturers = self._dictionaries()
+        # zapisane partie widzi już zapytanie o istniejące terminy; bez zapisu kolizje między
+        # partiami łapie indeks przyjętych wierszy trzymany przez cały import
+        imported = IntervalIndex()
+        read = accepted = 0
+        t0 = _time.perf_counter()
+
+        # --strict: całość w jednej transakcji – błąd w dowolnej partii wycofuje wcześniejsze
+        # (także przedmioty/wykładowców z --create-missing)
+        with transaction.atomic() if strict else nullcontext():
+            for batch in _batches(self._read(options["files"], errors), max(1, options["batch_size"])):
+                read += len(batch)
+                with transaction.atomic():
+                    if create_missing:
+                        self._create_missing(batch, subjects, lecturers)
+                    rows = self._resolve(batch, errors, subjects, lecturers)
+                    rows = self._sweep_collisions(rows, errors, imported if dry_run else IntervalIndex())
+                    if strict and errors:
+                        break
+                    if not dry_run:
+                        rows = self._insert(rows, errors)
+                accepted += len(rows)
+                if not dry_run:
+                    elapsed = _time.perf_counter() - t0
+                    self.stdout.write(f"  {accepted}/{read}  ({accepted / elapsed:.0f} zajęć/s)")
+            self._report_errors(errors)
+            if strict and errors:
+                raise CommandError(f"{len(errors)} błędnych wierszy – nic nie zaimportowano (--strict).")
+
+        elapsed = _time.perf_counter() - t0
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS(
+                f"✓ Poprawnych wierszy: {accepted} z {read} (--dry-run, bez zapisu)."
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Zaimportowano {accepted} z {read} wierszy w {elapsed:.2f} s"
+            + (f" ({accepted / elapsed:.0f}/s)." if elapsed else ".")
+        ))
+
+    def _read(self, paths, errors):
+        for path in paths:
+            reader = read_ics if path.lower().endswith((".ics", ".ical")) else read_csv
+            try:
+                yield from reader(path, errors)
+            except OSError as exc:
+                raise CommandError(f"{path}: {exc}")
+
+    # -------------------- słowniki --------------------
+
+    def _dictionaries(self):
+        subjects = {}
+        for sid, code, name in Subject.objects.values_list("id", "code", "name"):
+            subjects.setdefault(_key(name), sid)
+            subjects[_key(code)] = sid  # kod ma pierwszeństwo przed nazwą
+        lecturers = {}
+        for lid, first, last, email in Lecturer.objects.values_list("id", "first_name", "last_name", "email"):
+            lecturers.setdefault(_key(f"{first} {last}"), lid)
+            if email:
+                lecturers[_key(email)] = lid
+        return subjects, lecturers
+
+    def _resolve(self, rows, errors, subjects, lecturers):
+        resolved = []
+        for row in rows:
+            row.subject_id = subjects.get(_key(row.subject))
+            row.lecturer_id = next((lecturers[k] for k in _lecturer_keys(row.lecturer) if k in lecturers), None)
+            if row.subject_id is None:
+                errors.append((row.source, f"nieznany przedmiot {row.subject!r}"))
+            elif row.lecturer_id is None:
+                errors.append((row.source, f"nieznany prowadzący {row.lecturer!r}"))
+            elif row.end <= row.start:
+                errors.append((row.source, "koniec zajęć musi być po początku"))
+            else:
+                resolved.append(row)
+        return resolved
+
+    def _create_missing(self, rows, subjects, lecturers):
+        new_subjects, new_lecturers = {}, {}
+        for row in rows:
+            sk, lks = _key(row.subject), _lecturer_keys(row.lecturer)
+            if sk and sk not in subjects:
+                new_subjects.setdefault(sk, row.subject.strip())
+            if lks and not any(k in lecturers for k in lks):
+                new_lecturers.setdefault(lks[0], row.lecturer.strip())
+
+        codes = {_key(c) for c in Subject.objects.values_list("code", flat=True)} if new_subjects else set()
+        for sk, text in new_subjects.items():
+            code = _unique_code(text, codes)
+            codes.add(_key(code))
+            subjects[sk] = Subject.objects.create(code=code, name=text[:120]).id
+        for lk, text in new_lecturers.items():
+            name, _, email = text.partition("<")
+            name, email = name.strip(), email.rstrip(">").strip()
+            if not email and "@" in name:
+                name, email = name.split("@")[0], name
+            first, _, last = name.partition(" ")
+            lecturer = Lecturer.objects.create(first_name=first[:80], last_name=last[:80], email=email)
+            for k in _lecturer_keys(text):
+                lecturers[k] = lecturer.id
+        if new_subjects or new_lecturers:
+            transaction.on_commit(lambda: self.stdout.write(
+                f"Utworzono {len(new_subjects)} przedmiotów i {len(new_lecturers)} wykładowców."
+            ))
+
+    # -------------------- kolizje --------------------
+
+    def _sweep_collisions(self, rows, errors, imported):
+        """
+        Kolizje własnych zajęć prowadzącego (jak ClassSessionForm.clean), bez zapytania na wiersz:
+        jedno zapytanie o istniejące terminy w zakresie partii (+ terminy cykli) do indeksu, potem
+        wyszukiwanie binarne dla każdego wiersza – osobno względem bazy i przyjętych już wierszy
+        (`imported`, uzupełniany o wiersze tej partii).
+        """
+        if not rows:
+            return rows
+        lecturer_ids = {r.lecturer_id for r in rows}
+        span = (min(r.start for r in rows), max(r.end for r in rows))
+        existing = IntervalIndex(chain(
+            ClassSession.objects
+            .filter(lecturer_id__in=lecturer_ids, start__lt=span[1], end__gt=span[0])
+            .values_list("start", "end", "lecturer_id"),
+            ((o.start, o.end, o.series.lecturer_id) for o in virtual_occurrences(*span, lecturer_ids=lecturer_ids)),
+        ))
+        accepted = []
+        for row in sorted(rows, key=lambda r: (r.start, r.end)):
+            if existing.overlaps(row.lecturer_id, row.start, row.end):
+                errors.append((row.source, "prowadzący ma już inne zajęcia w tym czasie"))
+            elif imported.overlaps(row.lecturer_id, row.start, row.end):
+                errors.append((row.source, "kolizja z innym wierszem importu"))
+            else:
+                imported.add(row.lecturer_id, row.start, row.end)
+                accepted.append(row)
+        return accepted
+
+    # -------------------- zapis --------------------
+
+    def _insert(self, rows, errors):
+        """Zapisuje partię i zwraca wiersze faktycznie zapisane."""
+        # bulk_create pomija sygnały – wersję i obciążenia ustawiamy sami, raz na partię
+        version = bump_data_version()
+        objs = [
+            ClassSession(subject_id=r.subject_id, lecturer_id=r.lecturer_id, start=r.start, end=r.end,
+                         needs_substitution=r.needs_substitution, version=version)
+            for r in rows
+        ]
+        try:
+            with transaction.atomic():
+                ClassSession.objects.bulk_create(objs)
+        except IntegrityError as exc:
+            # PostgreSQL: ktoś zajął termin po kontroli kolizji – wiersz po wierszu, kolidujące odrzucamy
+            if not pgranges.is_exclusion_violation(exc):
+                raise
+            rows = [r for r, obj in zip(rows, objs) if self._insert_one(r, obj, errors)]
+        refresh_loads({(r.lecturer_id, local_date(r.start)) for r in rows})
+        return rows
+
+    @staticmethod
+    def _insert_one(row, obj, errors):
+        try:
+            with transaction.atomic():
+                ClassSession.objects.bulk_create([obj])
+        except IntegrityError as exc:
+            if not pgranges.is_exclusion_violation(exc):
+                raise
+            errors.append((row.source, "prowadzący ma już inne zajęcia w tym czasie"))
+            return False
+        return True
+
+    def _report_errors(self, errors):
+        if not errors:
+            return
+        self.stderr.write(self.style.WARNING(f"Odrzucone wiersze: {len(errors)}"))
+        for where, message in errors[:MAX_REPORTED]:
+            self.stderr.write(f"  {where}: {message}")
+        if len(errors) > MAX_REPORTED:
+            self.stderr.write(f"  … i {len(errors) - MAX_REPORTED} więcej")
@@ -0,0 +1,190 @@
+import asyncio
+import http.client
+import importlib
+import time as _time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.urls import clear_url_caches, reverse
+from django.utils import timezone
+
+from zastepstwa.management.commands.run_benchmarks import percentile
+from zastepstwa.models import ClassSession, Lecturer
+from zastepstwa.services import week_bounds
+
+ENDPOINTS = ("events", "preview", "candidates")
+
+
+class Command(BaseCommand):
+    help = (
+        "Test obciążeniowy endpointów JSON (api/events, podgląd i ranking kandydatów): N współbieżnych "
+        "klientów, przepustowość i percentyle czasu. Z --url – przeciw działającemu serwerowi, np.\n"
+        "  uvicorn serwer.asgi:application --workers 1   (ZASTEPSTWA_ASYNC_API = True / False)\n"
+        "  manage.py load_test --url http://127.0.0.1:8000 --concurrency 64\n"
+        "Bez --url – w procesie, przez handler ASGI Django, kolejno wersje sync i async widoków. "
+        "Tylko odczyty – baza nie jest modyfikowana."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="", help="adres serwera (domyślnie: w procesie)")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument("--requests", type=int, default=1000, help="łącznie, na wariant")
+        parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="podzbiór " + ",".join(ENDPOINTS))
+        parser.add_argument("--variant", choices=("both", "sync", "async"), default="both",
+                            help="w procesie: które widoki (ZASTEPSTWA_ASYNC_API) mierzyć")
+
+    def handle(self, *args, **opts):
+        endpoints = [e.strip() for e in opts["endpoints"].split(",") if e.strip()]
+        if not endpoints or not set(endpoints) <= set(ENDPOINTS):
+            raise CommandError("--endpoints: " + ",".join(ENDPOINTS))
+        if opts["concurrency"] < 1 or opts["requests"] < 1:
+            raise CommandError("--concurrency i --requests muszą być > 0")
+        paths = self._paths(endpoints)
+        work = [paths[i % len(paths)] for i in range(opts["requests"])]
+
+        if opts["url"]:
+            self._report(opts["url"], *asyncio.run(self._run_http(opts["url"], work, opts["concurrency"])))
+            return
+        variants = ("sync", "async") if opts["variant"] == "both" else (opts["variant"],)
+        for variant in variants:
+            with self._urls(async_api=variant == "async"):
+                self._report(f"w procesie, {variant}", *asyncio.run(self._run_asgi(work, opts["concurrency"])))
+
+    # -------------------- scenariusz --------------------
+
+    def _paths(self, endpoints):
+        """(nazwa, ścieżka) – zajęcia i kandydat z okolic bieżącego tygodnia."""
+        now = timezone.now()
+        session = (ClassSession.objects.filter(start__gte=now).order_by("start").first()
+                   or ClassSession.objects.order_by("-start").first())
+        if session is None:
+            raise CommandError("Brak zajęć – najpierw seed_synthetic.")
+        lecturer = Lecturer.objects.exclude(id=session.lecturer_id).order_by("id").first() or session.lecturer
+        week_start, week_end = week_bounds(session.start)
+        urls = {
+            "events": reverse("zastepstwa:api_events") + "?" + urlencode(
+                {"start": week_start.isoformat(), "end": week_end.isoformat()}),
+            "preview": reverse("zastepstwa:api_substitution_preview") + "?" + urlencode(
+                {"session_id": session.id, "lecturer_id": lecturer.id}),
+            "candidates": reverse("zastepstwa:api_substitution_candidates") + "?" + urlencode(
+                {"session_id": session.id}),
+        }
+        return [(name, urls[name]) for name in endpoints]
+
+    @staticmethod
+    def _urls(async_api):
+        """Ustawienie + przeładowanie URLconfu (wybór widoków zapada przy imporcie zastepstwa.urls)."""
+        class Swap:
+            def __enter__(self):
+                self.override = override_settings(ZASTEPSTWA_ASYNC_API=async_api)
+                self.override.enable()
+                self._reload()
+
+            def __exit__(self, *exc):
+                self.override.disable()
+                self._reload()
+
+            @staticmethod
+            def _reload():
+                importlib.reload(importlib.import_module("zastepstwa.urls"))
+                importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+                clear_url_caches()
+
+        return Swap()
+
+    # -------------------- klienci --------------------
+
+    async def _run_asgi(self, work, concurrency):
+        client = AsyncClient()
+
+        async def fetch(path):
+            response = await client.get(path)
+            if response.streaming:
+                if hasattr(response.streaming_content, "__aiter__"):
+                    async for _ in response.streaming_content:
+                        pass
+                else:
+                    for _ in response.streaming_content:
+                        pass
+            return response.status_code
+
+        return await self._drive(work, concurrency, lambda: fetch)
+
+    async def _run_http(self, base, work, concurrency):
+        parts = urlsplit(base)
+        if parts.scheme != "http" or not parts.hostname:
+            raise CommandError("--url: http://host[:port]")
+        loop = asyncio.get_running_loop()
+        # http.client jest blokujący – każdy klient czeka na odpowiedź we własnym wątku puli
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        opened = []
+
+        def connection():
+            # jedno połączenie keep-alive na klienta; po zamknięciu przez serwer http.client otwiera nowe
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+            opened.append(conn)
+
+            def get(path):
+                try:
+                    conn.request("GET", path, headers={"Accept": "application/json"})
+                    response = conn.getresponse()
+                    response.read()
+                    return response.status
+                except (OSError, http.client.HTTPException):
+                    conn.close()  # następne żądanie połączy się od nowa
+                    raise
+
+            async def fetch(path):
+                return await loop.run_in_executor(pool, get, path)
+
+            return fetch
+
+        try:
+            return await self._drive(work, concurrency, connection)
+        finally:
+            pool.shutdown()
+            for conn in opened:
+                conn.close()
+
+    @staticmethod
+    async def _drive(work, concurrency, make_fetch):
+        queue = asyncio.Queue()
+        for item in work:
+            queue.put_nowait(item)
+        timings, statuses = {}, Counter()
+
+        async def worker():
+            fetch = make_fetch()
+            while not queue.empty():
+                name, path = queue.get_nowait()
+                t0 = _time.perf_counter()
+                try:
+                    status = await fetch(path)
+                except (OSError, http.client.HTTPException) as exc:
+                    status = f"błąd:{type(exc).__name__}"
+                timings.setdefault(name, []).append((_time.perf_counter() - t0) * 1000)
+                statuses[(name, status)] += 1
+
+        t0 = _time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return timings, statuses, _time.perf_counter() - t0
+
+    # -------------------- raport --------------------
+
+    def _report(self, label, timings, statuses, elapsed):
+        total = sum(len(t) for t in timings.values())
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"== {label}: {total} żądań w {elapsed:.2f} s = {total / elapsed:.0f} req/s =="
+        ))
+        for name, values in timings.items():
+            values.sort()
+            codes = ", ".join(f"{status}×{n}" for (n_name, status), n in sorted(statuses.items(), key=str)
+                              if n_name == name)
+            self.stdout.write(
+                f"   {name:<12} p50 {percentile(values, 50):>8.1f}  p95 {percentile(values, 95):>8.1f}  "
+                f"p99 {percentile(values, 99):>8.1f} ms   {codes}"
+            )
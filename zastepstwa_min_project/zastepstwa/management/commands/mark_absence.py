@@ -0,0 +1,68 @@
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from zastepstwa.management.commands.add_unavailability import Command as AddUnavailability
+from zastepstwa.planner import PlanConflict, commit_plan, plan_absence
+
+
+class Command(BaseCommand):
+    help = (
+        "Nieobecność wykładowcy w zakresie dni: wszystkie jego zajęcia dostają needs_substitution "
+        "(jednym UPDATE), zapisuje blokadę LecturerUnavailability i wypisuje propozycje zastępców "
+        "z rankingiem kandydatów. --commit od razu zapisuje proponowane zastępstwa:\n"
+        "  mark_absence kowalska@uczelnia.pl --from 2025-11-03 --until 2025-11-07 --reason L4"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("lecturer", help="id, e-mail albo \"Imię Nazwisko\"")
+        parser.add_argument("--from", dest="date_from", required=True, help="pierwszy dzień (YYYY-MM-DD)")
+        parser.add_argument("--until", dest="date_until", help="ostatni dzień włącznie (domyślnie = --from)")
+        parser.add_argument("--reason", default="")
+        parser.add_argument("--no-unavailability", action="store_true",
+                            help="nie zapisuj blokady LecturerUnavailability (tylko oznacz zajęcia)")
+        parser.add_argument("--top", type=int, default=3, help="ilu kandydatów wypisać przy zajęciach")
+        parser.add_argument("--commit", action="store_true", help="zapisz proponowane zastępstwa")
+
+    _lecturer = AddUnavailability._lecturer
+
+    def handle(self, *args, **options):
+        lecturer = self._lecturer(options["lecturer"])
+        first = parse_date(options["date_from"] or "")
+        last = parse_date(options["date_until"] or "") if options["date_until"] else first
+        if not first or not last or last < first:
+            raise CommandError("Nieprawidłowy zakres dat.")
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.combine(first, time(0, 0)), tz)
+        end = timezone.make_aware(datetime.combine(last + timedelta(days=1), time(0, 0)), tz)
+
+        try:
+            result = plan_absence(lecturer.id, start, end, reason=options["reason"],
+                                  record_unavailability=not options["no_unavailability"], top=max(0, options["top"]))
+        except PlanConflict as exc:
+            raise CommandError("Nie oznaczono nieobecności: " + "; ".join(f"{k}: {r}" for k, r in exc.problems))
+        for row in result["sessions"]:
+            when = f"{timezone.localtime(datetime.fromisoformat(row['start'])):%Y-%m-%d %a %H:%M}"
+            if row["status"] == "covered":
+                self.stdout.write(f"  {when}  {row['subject']}: już zastępuje {row['substitute_name']}")
+                continue
+            if row["status"] == "proposed":
+                self.stdout.write(f"  {when}  {row['subject']}: → {row['substitute_name']}")
+            else:
+                self.stdout.write(self.style.WARNING(f"  {when}  {row['subject']}: {row['reason']}"))
+            if row["candidates"]:
+                self.stdout.write("      kandydaci: " + ", ".join(
+                    f"{c['name']} ({c['cost']})" for c in row["candidates"]
+                ))
+        proposed = len(result["assignments"])
+        self.stdout.write(f"{lecturer}: {len(result['sessions'])} zajęć w zakresie, nowo oznaczonych "
+                          f"{result['flagged']}, propozycji {proposed}.")
+
+        if options["commit"] and proposed:
+            try:
+                saved = commit_plan([(a["session_id"], a["lecturer_id"]) for a in result["assignments"]])
+            except PlanConflict as exc:
+                raise CommandError("Nie zapisano planu: " + "; ".join(f"{sid}: {r}" for sid, r in exc.problems))
+            self.stdout.write(self.style.SUCCESS(f"✓ Zapisano {saved} zastępstw."))
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection, transaction
+
+from zastepstwa import pgranges
+
+
+class Command(BaseCommand):
+    help = (
+        "Stan trybu PostgreSQL (zakresy tstzrange, ograniczenie session_teacher_no_overlap): czy jest "
+        "aktywny, czy ograniczenie jest założone i które zajęcia się nakładają. Po usunięciu kolizji "
+        "--install-constraint zakłada ograniczenie ponownie (np. po ręcznym usunięciu)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=50, help="ile kolizji wypisać")
+        parser.add_argument("--install-constraint", action="store_true")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "postgresql":
+            self.stdout.write(f"Baza {connection.vendor}: tryb zakresów niedostępny, zapytania po start/end.")
+            return
+        self.stdout.write("Zapytania po zakresach: " + ("tak" if pgranges.range_mode() else
+                                                         "nie (ZASTEPSTWA_PG_RANGES = False)"))
+        installed = pgranges.constraint_installed()
+        self.stdout.write(f"Ograniczenie {pgranges.CONSTRAINT_NAME}: " + ("jest" if installed else "BRAK"))
+
+        clashes = pgranges.double_bookings(limit=options["limit"])
+        for teacher_id, a, b in clashes:
+            self.stdout.write(self.style.WARNING(f"  wykładowca {teacher_id}: zajęcia {a} i {b} nakładają się"))
+        if not clashes:
+            self.stdout.write("Brak nakładających się zajęć.")
+
+        if options["install_constraint"] and not installed:
+            if clashes:
+                raise CommandError("Najpierw usuń kolizje (lista powyżej).")
+            try:
+                with transaction.atomic():
+                    with connection.cursor() as cursor:
+                        cursor.execute(pgranges.ADD_CONSTRAINT_SQL)
+            except DatabaseError as exc:
+                raise CommandError(f"Nie założono ograniczenia: {exc}")
+            self.stdout.write(self.style.SUCCESS(f"✓ Założono {pgranges.CONSTRAINT_NAME}."))
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from zastepstwa.services import rebuild_loads
+
+
+class Command(BaseCommand):
+    help = "Odbudowuje od zera tabele obciążeń wykładowców (LecturerWeekLoad i LecturerDayLoad)."
+
+    def handle(self, *args, **options):
+        t0 = time.perf_counter()
+        counts = rebuild_loads()
+        summary = ", ".join(f"{name}: {n}" for name, n in counts.items())
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Odbudowano kubełki obciążeń ({summary}) w {time.perf_counter() - t0:.2f} s."
+        ))
@@ -0,0 +1,251 @@
+import json
+import platform
+import subprocess
+import time as _time
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from zastepstwa import synthetic
+from zastepstwa.models import ClassSession
+from zastepstwa.planner import propose_plan, sessions_needing_cover
+from zastepstwa.services import (
+    EligibilityEngine, busy_lecturer_ids, compute_loads, local_date, period_loads, week_bounds,
+)
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentile(sorted_values, p):
+    """Percentyl metodą najbliższej rangi (dla kilkudziesięciu próbek wystarcza)."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark endpointów i funkcji serwisowych na syntetycznych danych w kilku rozmiarach: "
+        "percentyle czasu (p50/p95/p99) i liczba zapytań ORM, wynik w JSON. Pracuje na osobnej "
+        "bazie testowej (jak manage.py test) – bieżąca baza nie jest modyfikowana."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,50000",
+                            help="liczby zajęć, oddzielone przecinkami (domyślnie 1000,10000,50000)")
+        parser.add_argument("--sessions-per-lecturer", type=int, default=100)
+        parser.add_argument("--repeat", type=int, default=30, help="pomiary na przypadek")
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--only", default="", help="tylko przypadki zawierające ten tekst")
+        parser.add_argument("--output", default="", help="plik JSON (domyślnie bench-<commit>.json)")
+        parser.add_argument("--compare", default="", help="JSON z poprzedniego przebiegu do porównania (regresja = błąd komendy)")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="o ile wolniejsze p95 uznać za regresję (domyślnie 0.2 = 20%%)")
+
+    def handle(self, *args, **opts):
+        try:
+            sizes = [int(x) for x in opts["sizes"].split(",") if x.strip()]
+        except ValueError:
+            raise CommandError("--sizes: liczby oddzielone przecinkami")
+        baseline = self._load(opts["compare"]) if opts["compare"] else None
+
+        commit = self._git_commit()
+        report = {
+            "meta": {
+                "commit": commit,
+                "created": timezone.now().isoformat(),
+                "vendor": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "repeat": opts["repeat"],
+                "warmup": opts["warmup"],
+                "seed": opts["seed"],
+            },
+            "runs": [],
+        }
+
+        # DEBUG wyłączony jak w testach: bez logowania każdego zapytania (narzut i pełny bufor 9000 wpisów)
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            for size in sizes:
+                call_command("flush", interactive=False, verbosity=0)
+                lecturers = max(20, size // max(1, opts["sessions_per_lecturer"]))
+                self.stdout.write(self.style.MIGRATE_HEADING(f"== {size} zajęć, {lecturers} wykładowców =="))
+                t0 = _time.perf_counter()
+                data = synthetic.generate(lecturers=lecturers, sessions=size, seed=opts["seed"])
+                self.stdout.write(f"   dane: {_time.perf_counter() - t0:.1f} s")
+                cases = {}
+                for name, fn in self._cases():
+                    if opts["only"] and opts["only"] not in name:
+                        continue
+                    cases[name] = self._measure(fn, opts["repeat"], opts["warmup"])
+                    self._print_case(name, cases[name])
+                report["runs"].append({"size": size, "data": data, "cases": cases})
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        path = opts["output"] or f"bench-{commit[:10] if commit else 'local'}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        self.stdout.write(self.style.SUCCESS(f"✓ Zapisano {path}"))
+
+        if baseline is not None:
+            self._compare(baseline, report, opts["threshold"])
+
+    # -------------------- przypadki --------------------
+
+    def _cases(self):
+        """(nazwa, funkcja) – dane wejściowe wybrane raz, z okolic bieżącego tygodnia."""
+        now = timezone.now()
+        # najbliższe zajęcia czekające na zastępcę (planer i ranking mają wtedy realną pracę)
+        session = (
+            sessions_needing_cover(now, now + timedelta(days=365)).first()
+            or ClassSession.objects.filter(start__gte=now).order_by("start")
+            .select_related("subject", "lecturer").first()
+        )
+        if session is None:
+            raise CommandError("Brak zajęć w przyszłości – zwiększ rozmiar danych.")
+        ranked = EligibilityEngine(session).rank()
+        candidate = next((c for c in ranked if c["ok"]), ranked[0] if ranked else None)
+        candidate_id = candidate["lecturer_id"] if candidate else session.lecturer_id
+
+        week_start, week_end = week_bounds(session.start)
+        day = local_date(session.start)
+        client = Client()
+        events = reverse("zastepstwa:api_events")
+        staff = Client()
+        staff.force_login(User.objects.create_superuser("bench", "bench@example.com", None))
+
+        def get(url, client=client, **params):
+            def call():
+                response = client.get(url, params)
+                if response.status_code != 200:
+                    raise CommandError(f"{url} → {response.status_code}")
+                if response.streaming:  # api_events strumieniuje – mierzymy całą odpowiedź
+                    b"".join(response.streaming_content)
+            return call
+
+        def post_substitution():
+            # zapis i wycofanie – każde powtórzenie startuje z tego samego stanu
+            try:
+                with transaction.atomic():
+                    response = client.post(
+                        reverse("zastepstwa:api_substitutions"),
+                        json.dumps({"session_id": session.id, "lecturer_id": candidate_id}),
+                        content_type="application/json",
+                    )
+                    if response.status_code != 200:
+                        raise CommandError(f"api_substitutions → {response.status_code}")
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+        return [
+            ("api_events (tydzień)", get(events, start=week_start.isoformat(), end=week_end.isoformat())),
+            ("api_events (tydzień, wykładowca)",
+             get(events, start=week_start.isoformat(), end=week_end.isoformat(), lecturer_id=session.lecturer_id)),
+            ("api_substitution_preview",
+             get(reverse("zastepstwa:api_substitution_preview"), session_id=session.id, lecturer_id=candidate_id)),
+            ("api_substitution_candidates",
+             get(reverse("zastepstwa:api_substitution_candidates"), session_id=session.id)),
+            ("api_substitutions (zapis + rollback)", post_substitution),
+            ("api_plan_propose (dzień)", get(reverse("zastepstwa:api_plan_propose"), start=day.isoformat())),
+            ("stats_view (miesiąc)", get(reverse("zastepstwa:stats"), period="month")),
+            ("stats_view (cały okres)", get(reverse("zastepstwa:stats"), period="all")),
+            # listy admina: liczba zapytań nie może rosnąć z liczbą wierszy na stronie
+            ("admin: zajęcia", get(reverse("admin:zastepstwa_classsession_changelist"), client=staff)),
+            ("admin: zajęcia (wykładowca)", get(reverse("admin:zastepstwa_classsession_changelist"), client=staff,
+                                                lecturer__id__exact=session.lecturer_id)),
+            ("admin: zastępstwa", get(reverse("admin:zastepstwa_substitution_changelist"), client=staff)),
+            ("busy_lecturer_ids", lambda: busy_lecturer_ids(session.start, session.end)),
+            ("compute_loads (tydzień)", lambda: compute_loads(week_start, week_end)),
+            ("period_loads (30 dni)", lambda: list(period_loads(day - timedelta(days=30), day))),
+            ("EligibilityEngine.rank", lambda: EligibilityEngine(session).rank()),
+            ("propose_plan (tydzień)", lambda: propose_plan(week_start, week_end)),
+        ]
+
+    # -------------------- pomiar --------------------
+
+    def _measure(self, fn, repeat, warmup):
+        for _ in range(warmup):
+            fn()
+        # liczbę zapytań bierzemy z osobnego wywołania – przechwytywanie SQL zawyża czasy
+        with CaptureQueriesContext(connection) as captured:
+            fn()
+        queries = len(captured)  # leniwe – kolejne żądania czyszczą log zapytań (request_started)
+        timings = []
+        for _ in range(max(1, repeat)):
+            t0 = _time.perf_counter()
+            fn()
+            timings.append((_time.perf_counter() - t0) * 1000)
+        timings.sort()
+        return {
+            "queries": queries,
+            "p50_ms": round(percentile(timings, 50), 3),
+            "p95_ms": round(percentile(timings, 95), 3),
+            "p99_ms": round(percentile(timings, 99), 3),
+            "mean_ms": round(sum(timings) / len(timings), 3),
+            "min_ms": round(timings[0], 3),
+            "max_ms": round(timings[-1], 3),
+        }
+
+    def _print_case(self, name, r):
+        self.stdout.write(
+            f"   {name:<40} p50 {r['p50_ms']:>9.2f}  p95 {r['p95_ms']:>9.2f}  "
+            f"p99 {r['p99_ms']:>9.2f} ms  zapytań {r['queries']:>3}"
+        )
+
+    # -------------------- porównanie --------------------
+
+    def _load(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Nie da się wczytać {path}: {exc}")
+
+    def _compare(self, baseline, report, threshold):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"== Porównanie z {baseline['meta'].get('commit') or '?'} =="
+        ))
+        old_runs = {run["size"]: run["cases"] for run in baseline.get("runs", [])}
+        regressions = 0
+        for run in report["runs"]:
+            old_cases = old_runs.get(run["size"], {})
+            for name, new in run["cases"].items():
+                old = old_cases.get(name)
+                if old is None:
+                    continue
+                ratio = new["p95_ms"] / old["p95_ms"] if old["p95_ms"] else 1.0
+                worse = ratio > 1 + threshold or new["queries"] > old["queries"]
+                regressions += worse
+                line = (f"   {run['size']:>7} {name:<40} p95 {old['p95_ms']:.2f} → {new['p95_ms']:.2f} ms "
+                        f"({ratio:.2f}×), zapytań {old['queries']} → {new['queries']}")
+                self.stdout.write(self.style.ERROR(line + "  REGRESJA") if worse else line)
+        if regressions:
+            # kod wyjścia != 0 – CI ma się na tym zatrzymać
+            raise CommandError(f"Regresji: {regressions} (p95 > {1 + threshold:.2f}× albo więcej zapytań)")
+
+    @staticmethod
+    def _git_commit():
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return ""
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from zastepstwa import synthetic
+
+
+class Command(BaseCommand):
+    help = (
+        "Generuje syntetyczne dane do testów wydajności: wykładowcy, przedmioty, kwalifikacje, "
+        "zajęcia i zastępstwa (deterministycznie dla danego --seed). UWAGA: zapisuje do bieżącej bazy."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lecturers", type=int, default=200)
+        parser.add_argument("--sessions", type=int, default=20000)
+        parser.add_argument("--subjects", type=int, default=0, help="domyślnie wykładowcy/2")
+        parser.add_argument("--qualifications", type=int, default=0, help="domyślnie wykładowcy/10")
+        parser.add_argument("--weeks", type=int, default=0,
+                            help="rozpiętość planu wokół bieżącego tygodnia (domyślnie ~10 zajęć/os./tydz.)")
+        parser.add_argument("--absence-rate", type=float, default=0.03,
+                            help="odsetek dni wykładowcy z nieobecnością (wszystkie zajęcia do zastąpienia)")
+        parser.add_argument("--cover-rate", type=float, default=0.7,
+                            help="odsetek zajęć nieobecnych, które mają już zastępcę")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--clear", action="store_true",
+                            help="najpierw usuń wcześniej wygenerowane dane syntetyczne")
+
+    def handle(self, *args, **opts):
+        if opts["lecturers"] < 1 or opts["sessions"] < 0:
+            raise CommandError("--lecturers musi być > 0, --sessions >= 0")
+        if opts["clear"]:
+            self.stdout.write(f"Usunięto {synthetic.clear()} syntetycznych zajęć.")
+        try:
+            made = synthetic.generate(
+                lecturers=opts["lecturers"], sessions=opts["sessions"],
+                subjects=opts["subjects"] or None, qualifications=opts["qualifications"] or None,
+                weeks=opts["weeks"] or None, absence_rate=opts["absence_rate"],
+                cover_rate=opts["cover_rate"], seed=opts["seed"], progress=self.stdout.write,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(
+            "✓ Dane syntetyczne: " + ", ".join(f"{k}={v}" for k, v in made.items())
+        ))
@@ -0,0 +1,195 @@
+import os
+import queue
+import random
+import tempfile
+import threading
+import time as _time
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from zastepstwa import synthetic
+from zastepstwa.models import ClassSession, Lecturer, LecturerWeekLoad, Substitution
+from zastepstwa.services import (
+    EligibilityEngine, book_substitution, busy_intervals, compute_loads, take_write_lock, week_bounds, week_start_of,
+    with_conflict_retries,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Test obciążeniowy rezerwacji zastępstw: wiele wątków naraz rezerwuje tych samych, "
+        "„gorących” zastępców na jeden tydzień, po czym sprawdzamy limity tygodniowe i kolizje. "
+        "Pracuje na osobnej bazie testowej (SQLite: plik tymczasowy)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--attempts", type=int, default=400, help="łączna liczba prób rezerwacji")
+        parser.add_argument("--hot", type=int, default=3, help="ilu zastępców dzielą między sobą wątki")
+        parser.add_argument("--limit", type=int, default=2, help="limit zastępstw/tydzień gorących zastępców")
+        parser.add_argument("--lecturers", type=int, default=30)
+        parser.add_argument("--sessions", type=int, default=1500)
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--unsafe", action="store_true",
+                            help="dawna ścieżka bez transakcji i blokad (do porównania – powinna łamać limity)")
+
+    def handle(self, *args, **opts):
+        setup_test_environment(debug=False)
+        test_settings = connection.settings_dict.setdefault("TEST", {})
+        if connection.vendor == "sqlite" and not test_settings.get("NAME"):
+            # baza w pamięci (shared cache) nie oddaje zachowania blokad pliku – bierzemy plik
+            test_settings["NAME"] = os.path.join(tempfile.gettempdir(), "zastepstwa_stress.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            synthetic.generate(lecturers=opts["lecturers"], sessions=opts["sessions"], seed=opts["seed"])
+            week_start, week_end, hot, pairs = self._scenario(opts)
+            before = self._snapshot(hot, week_start, week_end)
+            outcomes, elapsed = self._run(pairs, opts)
+            after = self._snapshot(hot, week_start, week_end)
+            violations = self._check(hot, before, after, week_start, week_end)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        total = sum(outcomes.values())
+        self.stdout.write(
+            f"{total} prób w {elapsed:.2f} s ({total / elapsed:.0f}/s, {opts['threads']} wątków): "
+            + ", ".join(f"{k}={v}" for k, v in sorted(outcomes.items()))
+        )
+        for line in violations:
+            self.stdout.write(self.style.ERROR(f"  ✗ {line}"))
+        errors = sum(n for k, n in outcomes.items() if k.startswith("błąd"))
+        if (violations or errors) and not opts["unsafe"]:
+            raise CommandError(f"Naruszenia limitów/kolizje: {len(violations)}, nieudane rezerwacje: {errors}")
+        if not violations:
+            self.stdout.write(self.style.SUCCESS("✓ Limity i brak kolizji zachowane."))
+
+    # -------------------- scenariusz --------------------
+
+    def _scenario(self, opts):
+        """Przyszły tydzień, gorący zastępcy (najwięcej pasujących zajęć) i pule par do rezerwacji."""
+        week_start, week_end = week_bounds(timezone.now() + timedelta(days=7))
+        sessions = list(ClassSession.objects.filter(start__gte=week_start, start__lt=week_end)
+                        .values_list("id", "subject_id", "lecturer_id"))
+        through = Lecturer.subjects.through
+        teaches = defaultdict(set)
+        for lid, sid in through.objects.values_list("lecturer_id", "subject_id"):
+            teaches[lid].add(sid)
+        matching = defaultdict(list)
+        for session_id, subject_id, owner_id in sessions:
+            for lid, subjects in teaches.items():
+                if lid != owner_id and subject_id in subjects:
+                    matching[lid].append(session_id)
+        hot = sorted(matching, key=lambda lid: -len(matching[lid]))[:opts["hot"]]
+        if not hot:
+            raise CommandError("Brak par (zajęcia, zastępca) w docelowym tygodniu – zwiększ --sessions.")
+        Lecturer.objects.filter(id__in=hot).update(max_substitutions_per_week=opts["limit"])
+
+        rnd = random.Random(opts["seed"])
+        pool = [(sid, lid) for lid in hot for sid in matching[lid]]
+        pairs = [rnd.choice(pool) for _ in range(opts["attempts"])]
+        self.stdout.write(f"Tydzień {week_start:%Y-%m-%d}: {len(sessions)} zajęć, gorący zastępcy {hot}, "
+                          f"{len(pool)} możliwych par, limit {opts['limit']}/tydz.")
+        return week_start, week_end, hot, pairs
+
+    def _run(self, pairs, opts):
+        work = queue.Queue()
+        for pair in pairs:
+            work.put(pair)
+        outcomes = Counter()
+        lock = threading.Lock()
+        start_line = threading.Barrier(opts["threads"])
+        book = self._book_unsafe if opts["unsafe"] else self._book
+
+        def worker():
+            seen = Counter()
+            try:
+                start_line.wait()
+                while True:
+                    try:
+                        session_id, lecturer_id = work.get_nowait()
+                    except queue.Empty:
+                        break
+                    try:
+                        seen[book(session_id, lecturer_id)] += 1
+                    except Exception as exc:  # błąd w raporcie, a nie ubity wątek
+                        seen[f"błąd:{type(exc).__name__}:{exc}"] += 1
+            finally:
+                connection.close()  # połączenia są per wątek
+                with lock:
+                    outcomes.update(seen)
+
+        threads = [threading.Thread(target=worker) for _ in range(opts["threads"])]
+        t0 = _time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return outcomes, _time.perf_counter() - t0
+
+    @staticmethod
+    def _book(session_id, lecturer_id):
+        return "zapisane" if book_substitution(session_id, lecturer_id)["ok"] else "odrzucone"
+
+    @staticmethod
+    def _book_unsafe(session_id, lecturer_id):
+        # sprawdzenie poza transakcją, zapis w osobnej – jak przed blokadami: między nimi inne wątki
+        # rezerwują tę samą osobę. Sam zapis bierze blokadę od razu i ponawia się, żeby SQLite
+        # zamiast wyścigu o limity nie pokazywał tylko „database is locked”.
+        session = ClassSession.objects.select_related("subject", "lecturer", "substitution").get(id=session_id)
+        lecturer = Lecturer.objects.get(id=lecturer_id)
+        if not EligibilityEngine(session).evaluate(lecturer)["ok"]:
+            return "odrzucone"
+
+        def write():
+            with transaction.atomic():
+                take_write_lock(ClassSession, session_id)
+                Substitution.objects.update_or_create(session=session, defaults={"substitute_lecturer": lecturer})
+
+        with_conflict_retries(write)
+        return "zapisane"
+
+    # -------------------- weryfikacja --------------------
+
+    def _snapshot(self, hot, week_start, week_end):
+        """{lecturer_id: (liczba zastępstw, godziny, nakładające się pary)} w tygodniu."""
+        loads = compute_loads(week_start, week_end, lecturer_ids=hot)
+        intervals = defaultdict(list)
+        for start, end, lid in busy_intervals(week_start, week_end, lecturer_ids=hot):
+            intervals[lid].append((start, end))
+        snap = {}
+        for lid in hot:
+            own, taken, subs = loads.get(lid, (0.0, 0.0, 0))
+            spans = sorted(intervals[lid])
+            clashes = sum(1 for a, b in zip(spans, spans[1:]) if b[0] < a[1])
+            snap[lid] = (subs, own + taken, clashes)
+        return snap
+
+    def _check(self, hot, before, after, week_start, week_end):
+        problems = []
+        limits = {l.id: l for l in Lecturer.objects.filter(id__in=hot)}
+        monday = week_start_of(week_start)
+        stored = {
+            r.lecturer_id: (r.own_hours, r.taken_hours, r.subs_count)
+            for r in LecturerWeekLoad.objects.filter(lecturer_id__in=hot, week_start=monday)
+        }
+        fresh = compute_loads(week_start, week_end, lecturer_ids=hot)
+        for lid in hot:
+            subs, hours, clashes = after[lid]
+            subs0, hours0, clashes0 = before[lid]
+            l = limits[lid]
+            if l.max_substitutions_per_week and subs > max(l.max_substitutions_per_week, subs0):
+                problems.append(f"wykładowca {lid}: {subs} zastępstw > limit {l.max_substitutions_per_week}")
+            if l.max_hours_per_week and hours > max(l.max_hours_per_week, hours0) + 1e-6:
+                problems.append(f"wykładowca {lid}: {hours:.2f} h > limit {l.max_hours_per_week}")
+            if clashes > clashes0:
+                problems.append(f"wykładowca {lid}: {clashes - clashes0} nowych kolizji")
+            if stored.get(lid, (0.0, 0.0, 0)) != fresh.get(lid, (0.0, 0.0, 0)):
+                problems.append(f"wykładowca {lid}: LecturerWeekLoad rozjechane z zajęciami")
+        return problems
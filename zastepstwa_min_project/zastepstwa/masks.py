@@ -0,0 +1,94 @@
+"""
+Uprawnienia jako bitmaski: kwalifikacje wykładowcy, kwalifikacje wymagane przez przedmiot
+i przedmioty prowadzone przez wykładowcę to liczby całkowite, w których jeden bit oznacza
+jedną kwalifikację/przedmiot. Pozycje bitów są gęste – build_masks numeruje id kolejno od 0 –
+więc długość maski zależy od liczby przedmiotów, a nie od największego id (po latach usuwania
+i dodawania id idą w dziesiątki tysięcy). Sprawdzenie kandydata to jedno AND – bez zapytań
+i zbiorów na każdą parę (wykładowca, przedmiot).
+
+Maski całej bazy budujemy czterema zapytaniami i trzymamy w cache pod kluczem z wersją
+"masks" (DataVersion, zob. refdata.versioned_cache). Sygnały (m2m_changed, usunięcia, zmiana
+nazwy przedmiotu) podbijają wersję, więc każdy proces przy następnym odczycie buduje maski od nowa. Operacje masowe z
+pominięciem sygnałów (bulk_create tabel pośrednich) muszą same wywołać
+`bump_data_version(MASKS_VERSION)`.
+"""
+from collections import defaultdict
+
+from .models import Lecturer, Subject
+from .refdata import versioned_cache
+
+MASKS_VERSION = "masks"
+
+
+def bits(mask):
+    """Pozycje ustawionych bitów, rosnąco – po jednym kroku na ustawiony bit (nie na każdą pozycję)."""
+    found = []
+    while mask:
+        low = mask & -mask
+        found.append(low.bit_length() - 1)
+        mask ^= low
+    return found
+
+
+class Masks:
+    __slots__ = ("lecturer_quals", "lecturer_subjects", "subject_required", "subject_labels", "subject_codes",
+                 "subject_bits")
+
+    def __init__(self, lecturer_quals, lecturer_subjects, subject_required, subject_labels, subject_codes,
+                 subject_bits):
+        self.lecturer_quals = lecturer_quals          # {lecturer_id: maska kwalifikacji}
+        self.lecturer_subjects = lecturer_subjects    # {lecturer_id: maska przedmiotów}
+        self.subject_required = subject_required      # {subject_id: maska wymaganych kwalifikacji}
+        self.subject_labels = subject_labels          # [pozycja bitu przedmiotu: "KOD – nazwa"]
+        self.subject_codes = subject_codes            # [pozycja bitu przedmiotu: kod]
+        self.subject_bits = subject_bits              # {subject_id: pozycja bitu}
+
+    def can_teach(self, lecturer_id, subject_id) -> bool:
+        bit = self.subject_bits.get(subject_id)
+        return bit is not None and bool(self.lecturer_subjects.get(lecturer_id, 0) >> bit & 1)
+
+    def has_required(self, lecturer_id, subject_id) -> bool:
+        required = self.subject_required.get(subject_id, 0)
+        return self.lecturer_quals.get(lecturer_id, 0) & required == required
+
+    def teachers_of(self, subject_id):
+        if subject_id not in self.subject_bits:
+            return []
+        bit = 1 << self.subject_bits[subject_id]
+        return [lid for lid, mask in self.lecturer_subjects.items() if mask & bit]
+
+    def subject_names(self, lecturer_id):
+        """Przedmioty wykładowcy jako "KOD – nazwa", posortowane po kodzie."""
+        return sorted(self.subject_labels[bit] for bit in bits(self.lecturer_subjects.get(lecturer_id, 0)))
+
+    def subject_codes_of(self, lecturer_id):
+        """Same kody przedmiotów wykładowcy, posortowane (lista wykładowców)."""
+        return sorted(self.subject_codes[bit] for bit in bits(self.lecturer_subjects.get(lecturer_id, 0)))
+
+
+def build_masks() -> Masks:
+    def fold(pairs, positions):
+        # pozycja bitu = kolejny numer id (setdefault nadaje nowym id następną wolną pozycję)
+        masks = defaultdict(int)
+        for owner_id, item_id in pairs:
+            masks[owner_id] |= 1 << positions.setdefault(item_id, len(positions))
+        return dict(masks)
+
+    subjects = list(Subject.objects.values_list("id", "code", "name"))
+    subject_bits = {sid: bit for bit, (sid, _, _) in enumerate(subjects)}
+    qual_bits = {}
+    return Masks(
+        fold(Lecturer.qualifications.through.objects.values_list("lecturer_id", "qualification_id"), qual_bits),
+        # wiersze pośrednie bez przedmiotu (usunięty w międzyczasie) pomijamy
+        fold(((lid, sid) for lid, sid in Lecturer.subjects.through.objects.values_list("lecturer_id", "subject_id")
+              if sid in subject_bits), subject_bits),
+        fold(Subject.required_qualifications.through.objects.values_list("subject_id", "qualification_id"), qual_bits),
+        [f"{code} – {name}" for _, code, name in subjects],
+        [code for _, code, _ in subjects],
+        subject_bits,
+    )
+
+
+def get_masks() -> Masks:
+    """Aktualne maski: jedno zapytanie o wersję, budowa tylko po zmianie."""
+    return versioned_cache(MASKS_VERSION, build_masks)
@@ -0,0 +1,293 @@
+"""
+Metryki żądań: czas odpowiedzi, liczba zapytań SQL i łączny czas SQL – osobno dla każdej nazwy
+URL (np. "zastepstwa:api_substitutions"). Porównanie czasu żądania z czasem SQL pokazuje, czy
+wolny zapis stoi na bazie, czy na Pythonie.
+
+Włączenie w ustawieniach (domyślnie wyłączone – middleware zgłasza MiddlewareNotUsed i znika
+z łańcucha, więc koszt jest zerowy):
+
+    ZASTEPSTWA_METRICS = True
+    ZASTEPSTWA_SLOW_QUERY_MS = 200     # zapytania wolniejsze trafiają do logu "zastepstwa.metrics"
+
+Rejestr żyje w pamięci procesu; przy kilku procesach (gunicorn -w N) każdy wystawia własne
+/metrics – Prometheus zbiera je osobno, a sumuje się w zapytaniach PromQL.
+"""
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.utils import timezone
+
+logger = logging.getLogger("zastepstwa.metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+SLOW_SAMPLES = 50
+
+
+def metrics_enabled() -> bool:
+    return getattr(settings, "ZASTEPSTWA_METRICS", False)
+
+
+class Histogram:
+    """Skumulowany histogram w stylu Prometheusa (liczniki kubełków + suma + liczba)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # ostatni = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for le, n in zip(self.buckets + (float("inf"),), self.counts):
+            total += n
+            yield le, total
+
+    def quantile(self, q):
+        """Przybliżony kwantyl: górna granica kubełka (None = powyżej ostatniej granicy)."""
+        target = q * self.count
+        for le, total in self.cumulative():
+            if total >= target and self.count:
+                return le if le != float("inf") else None
+        return None
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}       # (widok, metoda, klasa statusu) -> liczba
+        self.latency = {}        # (widok, metoda) -> Histogram [s]
+        self.queries = {}        # (widok, metoda) -> Histogram [liczba zapytań]
+        self.sql_time = {}       # (widok, metoda) -> Histogram [s]
+        self.slow_total = 0
+        self.slow_samples = deque(maxlen=SLOW_SAMPLES)
+
+    def record(self, view, method, status, seconds, queries, sql_seconds):
+        key = (view, method)
+        with self._lock:
+            status_key = key + (f"{status // 100}xx",)
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            self._hist(self.latency, key, LATENCY_BUCKETS).observe(seconds)
+            self._hist(self.queries, key, QUERY_BUCKETS).observe(queries)
+            self._hist(self.sql_time, key, LATENCY_BUCKETS).observe(sql_seconds)
+
+    def record_slow(self, view, sql, seconds):
+        with self._lock:
+            self.slow_total += 1
+            self.slow_samples.append({
+                "view": view, "ms": round(seconds * 1000, 1), "sql": sql, "at": timezone.now().isoformat(),
+            })
+
+    @staticmethod
+    def _hist(table, key, buckets):
+        hist = table.get(key)
+        if hist is None:
+            hist = table[key] = Histogram(buckets)
+        return hist
+
+    def reset(self):
+        self.__init__()
+
+    # -------------------- eksport --------------------
+
+    def prometheus(self) -> str:
+        """Format tekstowy Prometheusa (text/plain; version=0.0.4)."""
+        out = []
+        with self._lock:
+            out += [
+                "# HELP zastepstwa_requests_total Liczba żądań wg widoku, metody i klasy statusu.",
+                "# TYPE zastepstwa_requests_total counter",
+            ]
+            for (view, method, status), n in sorted(self.requests.items()):
+                out.append(f'zastepstwa_requests_total{{view="{view}",method="{method}",status="{status}"}} {n}')
+            for name, help_text, table in (
+                ("zastepstwa_request_duration_seconds", "Czas obsługi żądania.", self.latency),
+                ("zastepstwa_request_db_queries", "Liczba zapytań SQL na żądanie.", self.queries),
+                ("zastepstwa_request_db_seconds", "Łączny czas zapytań SQL na żądanie.", self.sql_time),
+            ):
+                out += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+                for (view, method), hist in sorted(table.items()):
+                    labels = f'view="{view}",method="{method}"'
+                    for le, total in hist.cumulative():
+                        le = "+Inf" if le == float("inf") else f"{le:g}"
+                        out.append(f'{name}_bucket{{{labels},le="{le}"}} {total}')
+                    out.append(f"{name}_sum{{{labels}}} {hist.sum:.6f}")
+                    out.append(f"{name}_count{{{labels}}} {hist.count}")
+            out += [
+                "# HELP zastepstwa_slow_queries_total Zapytania wolniejsze niż ZASTEPSTWA_SLOW_QUERY_MS.",
+                "# TYPE zastepstwa_slow_queries_total counter",
+                f"zastepstwa_slow_queries_total {self.slow_total}",
+            ]
+        return "\n".join(out) + "\n"
+
+    def summary(self) -> dict:
+        """Podsumowanie dla strony JSON: średnie i przybliżone p50/p95 per widok + próbki wolnego SQL."""
+        views = []
+        with self._lock:
+            for key, hist in sorted(self.latency.items()):
+                queries, sql = self.queries.get(key), self.sql_time.get(key)
+                views.append({
+                    "view": key[0],
+                    "method": key[1],
+                    "count": hist.count,
+                    "avg_ms": round(hist.sum / hist.count * 1000, 2),
+                    "p50_ms_le": _ms(hist.quantile(0.5)),
+                    "p95_ms_le": _ms(hist.quantile(0.95)),
+                    "avg_queries": round(queries.sum / queries.count, 2) if queries and queries.count else None,
+                    "avg_sql_ms": round(sql.sum / sql.count * 1000, 2) if sql and sql.count else None,
+                    "sql_share": round(sql.sum / hist.sum, 3) if sql and hist.sum else None,
+                })
+            return {
+                "views": views,
+                "statuses": [{"view": v, "method": m, "status": s, "count": n}
+                             for (v, m, s), n in sorted(self.requests.items())],
+                "slow_query_ms": getattr(settings, "ZASTEPSTWA_SLOW_QUERY_MS", 200),
+                "slow_total": self.slow_total,
+                "slow_samples": list(self.slow_samples),
+            }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+registry = Registry()
+
+
+class RequestStats:
+    __slots__ = ("request", "count", "seconds")
+
+    def __init__(self, request):
+        self.request = request
+        self.count = 0
+        self.seconds = 0.0
+
+    @property
+    def view(self):
+        # resolver_match jest ustawiane przed wywołaniem widoku, więc SQL widoku zna już nazwę
+        match = getattr(self.request, "resolver_match", None)
+        return match.view_name if match else "<unresolved>"
+
+
+# statystyki bieżącego żądania; asgiref przenosi kontekst do wątków sync_to_async, więc SQL
+# wykonany przez widok synchroniczny pod ASGI też trafia do właściwego żądania
+_current = ContextVar("zastepstwa_request_stats", default=None)
+
+
+def timed_execute(execute, sql, params, many, context):
+    """Wrapper zapytań (`connection.execute_wrappers`) – poza żądaniem nic nie robi."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stats.count += 1
+        stats.seconds += elapsed
+        if elapsed * 1000 >= getattr(settings, "ZASTEPSTWA_SLOW_QUERY_MS", 200):
+            logger.warning("Wolne zapytanie (%.1f ms, %s): %s", elapsed * 1000, stats.view, sql)
+            registry.record_slow(stats.view, sql, elapsed)
+
+
+def install_wrapper(sender=None, connection=None, **kwargs):
+    """Odbiornik connection_created – wrapper na stałe w każdym nowym połączeniu."""
+    if timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(timed_execute)
+
+
+class MetricsMiddleware:
+    """Czas żądania + zapytania SQL per nazwa URL; wyłączony = usunięty z łańcucha middleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not metrics_enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats, start = RequestStats(request), time.perf_counter()
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats, start = RequestStats(request), time.perf_counter()
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, start)
+
+    def _finish(self, request, response, stats, start):
+        recorded = False
+
+        def record():
+            nonlocal recorded
+            if not recorded:
+                recorded = True
+                registry.record(stats.view, request.method, response.status_code,
+                                time.perf_counter() - start, stats.count, stats.seconds)
+
+        if response.streaming:
+            # api_events strumieniuje wiersze – SQL wykonuje się dopiero przy wysyłaniu treści; zapis
+            # po wyczerpaniu strumienia albo przy zamknięciu odpowiedzi (klient rozłączył się wcześniej)
+            measured = self._measured_async if response.is_async else self._measured
+            response.streaming_content = measured(response.streaming_content, stats, record)
+            close = response.close
+
+            def close_and_record():
+                try:
+                    close()
+                finally:
+                    record()
+
+            response.close = close_and_record
+        else:
+            record()
+        return response
+
+    @staticmethod
+    def _measured(content, stats, record):
+        token = _current.set(stats)
+        try:
+            yield from content
+        finally:
+            _current.reset(token)
+            record()
+
+    @staticmethod
+    async def _measured_async(content, stats, record):
+        token = _current.set(stats)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            _current.reset(token)
+            record()
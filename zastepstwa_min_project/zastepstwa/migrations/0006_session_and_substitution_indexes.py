@@ -0,0 +1,23 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zastepstwa', '0005_qualification_lecturerunavailability_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='classsession',
+            index=models.Index(fields=['lecturer', 'start', 'end'], name='session_lecturer_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='classsession',
+            index=models.Index(fields=['start', 'end'], name='session_range_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='substitution',
+            index=models.Index(fields=['substitute_lecturer', 'session'], name='subst_lecturer_session_idx'),
+        ),
+    ]
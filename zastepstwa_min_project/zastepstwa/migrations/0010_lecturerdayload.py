@@ -0,0 +1,62 @@
+from django.db import migrations, models
+from django.db.models import Count, DateField, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+import django.db.models.deletion
+
+
+def fill_loads(apps, schema_editor):
+    # istniejące zajęcia – ta sama agregacja co `manage.py rebuild_loads`, tylko na modelach historycznych
+    ClassSession = apps.get_model("zastepstwa", "ClassSession")
+    LecturerDayLoad = apps.get_model("zastepstwa", "LecturerDayLoad")
+    db = schema_editor.connection.alias
+    duration = ExpressionWrapper(F("end") - F("start"), output_field=DurationField())
+    taken = Q(substitution__substitute_lecturer__isnull=False)
+    rows = (
+        ClassSession.objects.using(db)
+        .filter(Q(substitution__isnull=True) | taken)
+        .annotate(teacher_id=Coalesce("substitution__substitute_lecturer_id", "lecturer_id"),
+                  bucket=TruncDate("start", output_field=DateField(), tzinfo=timezone.get_current_timezone()))
+        .values("teacher_id", "bucket")
+        .annotate(own=Sum(duration, filter=~taken), taken=Sum(duration, filter=taken),
+                  subs=Count("id", filter=taken))
+    )
+    LecturerDayLoad.objects.using(db).bulk_create([
+        LecturerDayLoad(lecturer_id=r["teacher_id"], day=r["bucket"], own_hours=_hours(r["own"]),
+                        taken_hours=_hours(r["taken"]), subs_count=r["subs"])
+        for r in rows.iterator()
+    ], batch_size=2000)
+
+
+def _hours(td):
+    return td.total_seconds() / 3600.0 if td else 0.0
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zastepstwa', '0009_change_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LecturerDayLoad',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('own_hours', models.FloatField(default=0.0)),
+                ('taken_hours', models.FloatField(default=0.0)),
+                ('subs_count', models.IntegerField(default=0)),
+                ('lecturer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_loads', to='zastepstwa.lecturer')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='lecturerdayload',
+            index=models.Index(fields=['day'], name='day_load_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='lecturerdayload',
+            constraint=models.UniqueConstraint(fields=('lecturer', 'day'), name='day_load_unique'),
+        ),
+        migrations.RunPython(fill_loads, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zastepstwa', '0010_lecturerdayload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lecturerunavailability',
+            name='reason',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='lecturerunavailability',
+            name='lecturer',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='unavailabilities', to='zastepstwa.lecturer'),
+        ),
+        migrations.AddIndex(
+            model_name='lecturerunavailability',
+            index=models.Index(fields=['lecturer', 'start', 'end'], name='unavail_lecturer_range_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zastepstwa', '0011_lecturerunavailability_reason_and_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('freq', models.CharField(choices=[('daily', 'Codziennie'), ('weekly', 'Co tydzień')], default='weekly', max_length=10)),
+                ('interval', models.PositiveSmallIntegerField(default=1)),
+                ('until', models.DateField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('lecturer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_sessions', to='zastepstwa.lecturer')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='zastepstwa.subject')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RecurrenceException',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_start', models.DateTimeField()),
+                ('reason', models.CharField(blank=True, max_length=200)),
+                ('series', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exceptions', to='zastepstwa.recurringsession')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='classsession',
+            name='series',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='materialized', to='zastepstwa.recurringsession'),
+        ),
+        migrations.AddField(
+            model_name='classsession',
+            name='occurrence_start',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recurringsession',
+            index=models.Index(fields=['until', 'start'], name='series_range_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recurrenceexception',
+            constraint=models.UniqueConstraint(fields=('series', 'original_start'), name='series_exception_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='classsession',
+            constraint=models.UniqueConstraint(fields=('series', 'occurrence_start'), name='session_occurrence_unique'),
+        ),
+    ]
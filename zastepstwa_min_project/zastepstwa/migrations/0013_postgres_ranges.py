@@ -0,0 +1,115 @@
+from django.db import IntegrityError, migrations
+
+# Tylko PostgreSQL (zob. zastepstwa/pgranges.py); na SQLite migracja nic nie robi.
+
+FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    """
+    ALTER TABLE zastepstwa_classsession
+        ADD COLUMN span tstzrange GENERATED ALWAYS AS (tstzrange("start", "end", '[)')) STORED,
+        ADD COLUMN teacher_id bigint
+    """,
+    """
+    ALTER TABLE zastepstwa_lecturerunavailability
+        ADD COLUMN span tstzrange GENERATED ALWAYS AS (tstzrange("start", "end", '[)')) STORED
+    """,
+    "CREATE INDEX session_span_gist ON zastepstwa_classsession USING gist (span)",
+    "CREATE INDEX unavail_lecturer_span_gist ON zastepstwa_lecturerunavailability USING gist (lecturer_id, span)",
+    # prowadzący: zastępca, gdy jest wpis zastępstwa (NULL = oddane), inaczej właściciel
+    """
+    CREATE FUNCTION zastepstwa_teacher_of(p_session_id bigint, p_owner_id bigint) RETURNS bigint AS $$
+        SELECT CASE WHEN EXISTS (SELECT 1 FROM zastepstwa_substitution WHERE session_id = p_session_id)
+                    THEN (SELECT substitute_lecturer_id FROM zastepstwa_substitution WHERE session_id = p_session_id)
+                    ELSE p_owner_id END
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE FUNCTION zastepstwa_session_teacher() RETURNS trigger AS $$
+    BEGIN
+        NEW.teacher_id := zastepstwa_teacher_of(NEW.id, NEW.lecturer_id);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER session_teacher BEFORE INSERT OR UPDATE OF lecturer_id ON zastepstwa_classsession
+        FOR EACH ROW EXECUTE FUNCTION zastepstwa_session_teacher()
+    """,
+    """
+    CREATE FUNCTION zastepstwa_substitution_teacher() RETURNS trigger AS $$
+    BEGIN
+        UPDATE zastepstwa_classsession SET teacher_id = zastepstwa_teacher_of(id, lecturer_id)
+        WHERE id IN (
+            CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.session_id END,
+            CASE WHEN TG_OP = 'INSERT' THEN NULL ELSE OLD.session_id END
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER substitution_teacher AFTER INSERT OR UPDATE OR DELETE ON zastepstwa_substitution
+        FOR EACH ROW EXECUTE FUNCTION zastepstwa_substitution_teacher()
+    """,
+    "UPDATE zastepstwa_classsession SET teacher_id = zastepstwa_teacher_of(id, lecturer_id)",
+]
+
+ADD_CONSTRAINT = (
+    "ALTER TABLE zastepstwa_classsession ADD CONSTRAINT session_teacher_no_overlap "
+    "EXCLUDE USING gist (teacher_id WITH =, span WITH &&) WHERE (teacher_id IS NOT NULL)"
+)
+CLASHES = (
+    "SELECT a.teacher_id, a.id, b.id FROM zastepstwa_classsession a "
+    "JOIN zastepstwa_classsession b ON a.teacher_id = b.teacher_id AND a.id < b.id AND a.span && b.span "
+    "ORDER BY a.teacher_id, a.id LIMIT 20"
+)
+
+BACKWARD = [
+    "DROP TRIGGER IF EXISTS substitution_teacher ON zastepstwa_substitution",
+    "DROP TRIGGER IF EXISTS session_teacher ON zastepstwa_classsession",
+    "DROP FUNCTION IF EXISTS zastepstwa_substitution_teacher()",
+    "DROP FUNCTION IF EXISTS zastepstwa_session_teacher()",
+    "DROP FUNCTION IF EXISTS zastepstwa_teacher_of(bigint, bigint)",
+    "ALTER TABLE zastepstwa_classsession DROP CONSTRAINT IF EXISTS session_teacher_no_overlap",
+    "DROP INDEX IF EXISTS session_span_gist",
+    "DROP INDEX IF EXISTS unavail_lecturer_span_gist",
+    "ALTER TABLE zastepstwa_classsession DROP COLUMN IF EXISTS span, DROP COLUMN IF EXISTS teacher_id",
+    "ALTER TABLE zastepstwa_lecturerunavailability DROP COLUMN IF EXISTS span",
+]
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in FORWARD:
+        schema_editor.execute(sql)
+    # bez ograniczenia baza nie gwarantuje braku podwójnych rezerwacji – przy kolizjach w danych
+    # migracja się wycofuje (cała, PostgreSQL ma transakcyjne DDL) i trzeba je najpierw usunąć
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(CLASHES)
+        clashes = cursor.fetchall()
+    if clashes:
+        listed = "\n".join(f"  wykładowca {t}: zajęcia {a} i {b}" for t, a, b in clashes)
+        raise IntegrityError(
+            "Nie można założyć session_teacher_no_overlap – w danych są nakładające się zajęcia "
+            f"(pierwsze {len(clashes)}):\n{listed}\nUsuń kolizje (zmień termin lub zastępcę) i uruchom migrate ponownie."
+        )
+    schema_editor.execute(ADD_CONSTRAINT)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for sql in BACKWARD:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zastepstwa', '0012_recurring_sessions'),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.30 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+# PostgreSQL: indeksy trigramowe pod istartswith (UPPER(pole::text) LIKE UPPER(%s)) – zob. zastepstwa/listing.py
+TRGM_INDEXES = {
+    "lecturer_first_name_trgm": ("zastepstwa_lecturer", "first_name"),
+    "lecturer_last_name_trgm": ("zastepstwa_lecturer", "last_name"),
+    "lecturer_email_trgm": ("zastepstwa_lecturer", "email"),
+    "subject_code_trgm": ("zastepstwa_subject", "code"),
+    "subject_name_trgm": ("zastepstwa_subject", "name"),
+}
+
+
+def forwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, (table, column) in TRGM_INDEXES.items():
+        schema_editor.execute(f'CREATE INDEX {name} ON {table} USING gin (UPPER("{column}"::text) gin_trgm_ops)')
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name in TRGM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('zastepstwa', '0013_postgres_ranges'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='lecturer',
+            index=models.Index(fields=['last_name', 'first_name', 'id'], name='lecturer_name_idx'),
+        ),
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -36,16 +36,95 @@ class Lecturer(models.Model):
     max_substitutions_per_week = models.IntegerField(default=3)
     max_hours_per_week = models.FloatField(default=20.0)
 
+    class Meta:
+        indexes = [
+            # listy i wyszukiwarka: kolejność alfabetyczna, strony po kluczu (zastepstwa/listing.py)
+            models.Index(fields=["last_name", "first_name", "id"], name="lecturer_name_idx"),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
 
+class LecturerUnavailability(models.Model):
+    # nieobecności i stałe blokady (np. etat częściowy) – wykluczają z zastępstw w tym czasie
+    lecturer = models.ForeignKey(Lecturer, on_delete=models.CASCADE, related_name="unavailabilities")
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    reason = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["lecturer", "start", "end"], name="unavail_lecturer_range_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.lecturer} unavailable from {self.start} to {self.end}"
+
+
+class RecurringSession(models.Model):
+    """Cykl zajęć (np. co tydzień przez semestr) – pojedyncze terminy rozwijane leniwie."""
+    DAILY = "daily"
+    WEEKLY = "weekly"
+    FREQ_CHOICES = [(DAILY, "Codziennie"), (WEEKLY, "Co tydzień")]
+
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    lecturer = models.ForeignKey(Lecturer, on_delete=models.CASCADE, related_name="recurring_sessions")
+    # pierwszy termin; kolejne mają tę samą godzinę lokalną i czas trwania
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    freq = models.CharField(max_length=10, choices=FREQ_CHOICES, default=WEEKLY)
+    interval = models.PositiveSmallIntegerField(default=1)
+    until = models.DateField()  # ostatni możliwy dzień (włącznie)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["until", "start"], name="series_range_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} | {self.lecturer} | {self.get_freq_display()} do {self.until}"
+
+
+class RecurrenceException(models.Model):
+    # odwołany termin cyklu (zmieniony termin to zmaterializowane ClassSession z series/occurrence_start)
+    series = models.ForeignKey(RecurringSession, on_delete=models.CASCADE, related_name="exceptions")
+    original_start = models.DateTimeField()
+    reason = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["series", "original_start"], name="series_exception_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.series} – odwołane {self.original_start:%Y-%m-%d %H:%M}"
+
+
 class ClassSession(models.Model):
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
     lecturer = models.ForeignKey(Lecturer, on_delete=models.CASCADE)
     start = models.DateTimeField()
     end = models.DateTimeField()
     needs_substitution = models.BooleanField(default=False)
+    # termin cyklu zapisany jako osobny wiersz (np. bo dostał zastępstwo)
+    series = models.ForeignKey(RecurringSession, on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name="materialized")
+    occurrence_start = models.DateTimeField(null=True, blank=True)
+    # śledzenie zmian dla synchronizacji kalendarza (api/events/changes)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.BigIntegerField(default=0, db_index=True)
+
+    class Meta:
+        indexes = [
+            # zapytania o nakładanie się terminów (lecturer + start/end)
+            models.Index(fields=["lecturer", "start", "end"], name="session_lecturer_range_idx"),
+            models.Index(fields=["start", "end"], name="session_range_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["series", "occurrence_start"], name="session_occurrence_unique"),
+        ]
 
     def __str__(self):
         return f"{self.subject} | {self.lecturer} | {self.start:%Y-%m-%d %H:%M}"
@@ -63,7 +142,77 @@ class Substitution(models.Model):
         related_name='taken_substitutions'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["substitute_lecturer", "session"], name="subst_lecturer_session_idx"),
+        ]
 
     def __str__(self):
         target = self.substitute_lecturer or "BRAK"
-        return f"Zastępstwo({self.session_id}) → {target}"
\ No newline at end of file
+        return f"Zastępstwo({self.session_id}) → {target}"
+
+class SessionTombstone(models.Model):
+    # ślad po usuniętych zajęciach – żeby klient synchronizujący zmiany mógł je zdjąć z kalendarza
+    session_id = models.BigIntegerField()
+    version = models.BigIntegerField(db_index=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"usunięte zajęcia {self.session_id} (v{self.version})"
+
+
+class LecturerWeekLoad(models.Model):
+    # zmaterializowane obciążenie wykładowcy w tygodniu (pon-ndz, lokalna strefa);
+    # utrzymywane sygnałami (zastepstwa/signals.py), odbudowa: manage.py rebuild_loads
+    lecturer = models.ForeignKey(Lecturer, on_delete=models.CASCADE, related_name="week_loads")
+    week_start = models.DateField()
+    own_hours = models.FloatField(default=0.0)
+    taken_hours = models.FloatField(default=0.0)
+    subs_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["lecturer", "week_start"], name="week_load_unique"),
+        ]
+
+    @property
+    def hours(self):
+        return self.own_hours + self.taken_hours
+
+    def __str__(self):
+        return f"{self.lecturer_id} @ {self.week_start}: {self.hours:.2f} h, {self.subs_count} zast."
+
+
+class DataVersion(models.Model):
+    # monotoniczny licznik zmian danych (np. "events" – wszystko, co widać w kalendarzu);
+    # podbijany w sygnałach, służy do ETag/Last-Modified
+    key = models.CharField(max_length=40, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.key}@{self.version}"
+
+
+class LecturerDayLoad(models.Model):
+    # dzienne podsumowanie obciążenia (wg lokalnej daty początku zajęć) – źródło dla statystyk;
+    # utrzymywane razem z LecturerWeekLoad
+    lecturer = models.ForeignKey(Lecturer, on_delete=models.CASCADE, related_name="day_loads")
+    day = models.DateField()
+    own_hours = models.FloatField(default=0.0)
+    taken_hours = models.FloatField(default=0.0)
+    subs_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["lecturer", "day"], name="day_load_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["day"], name="day_load_day_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.lecturer_id} @ {self.day}: {self.own_hours + self.taken_hours:.2f} h"
@@ -0,0 +1,81 @@
+"""
+Tryb PostgreSQL: zakresy czasu jako tstzrange z indeksami GiST.
+
+Migracja 0013 (tylko na PostgreSQL) dodaje do tabel kolumny spoza modeli Django:
+  - zastepstwa_classsession.span – tstzrange(start, end, '[)'), kolumna generowana,
+  - zastepstwa_classsession.teacher_id – kto realnie prowadzi zajęcia (zastępca, właściciel albo
+    NULL dla oddanych), utrzymywana wyzwalaczami na zajęciach i zastępstwach,
+  - zastepstwa_lecturerunavailability.span + indeks GiST (lecturer_id, span),
+oraz ograniczenie wykluczające EXCLUDE USING gist (teacher_id WITH =, span WITH &&): baza sama
+odrzuca podwójną rezerwację wykładowcy – także przy równoległych zapisach, bez blokad w aplikacji.
+Terminy cykli nie mają wierszy, więc ograniczenie ich nie obejmuje (sprawdza je aplikacja).
+
+Zapytania o dostępność (busy_intervals) i zakres kalendarza używają wtedy `span && tstzrange(...)`
+zamiast par porównań start/end. SQLite i pozostałe bazy zostają przy dotychczasowych zapytaniach.
+Wyłączenie zapytań po zakresach: ZASTEPSTWA_PG_RANGES = False.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import BigIntegerField, BooleanField
+from django.db.models.expressions import RawSQL
+
+from .models import ClassSession
+
+EXCLUSION_VIOLATION = "23P01"  # SQLSTATE exclusion_violation
+CONSTRAINT_NAME = "session_teacher_no_overlap"
+
+ADD_CONSTRAINT_SQL = (
+    f"ALTER TABLE zastepstwa_classsession ADD CONSTRAINT {CONSTRAINT_NAME} "
+    "EXCLUDE USING gist (teacher_id WITH =, span WITH &&) WHERE (teacher_id IS NOT NULL)"
+)
+
+
+def range_mode() -> bool:
+    return connection.vendor == "postgresql" and getattr(settings, "ZASTEPSTWA_PG_RANGES", True)
+
+
+def _column(model, name):
+    return f'{connection.ops.quote_name(model._meta.db_table)}."{name}"'
+
+
+def overlaps(model, start, end):
+    """Warunek dla filter(): `span && [start, end)` – sonda po indeksie GiST."""
+    return RawSQL(f"{_column(model, 'span')} && tstzrange(%s, %s, '[)')", (start, end),
+                  output_field=BooleanField())
+
+
+def teacher():
+    """Kolumna teacher_id zajęć (do annotate)."""
+    return RawSQL(_column(ClassSession, "teacher_id"), (), output_field=BigIntegerField())
+
+
+def taught_by(lecturer_ids=None):
+    """Warunek dla filter(): zajęcia realnie prowadzone (przez któregoś z podanych wykładowców)."""
+    if lecturer_ids is None:
+        return RawSQL(f"{_column(ClassSession, 'teacher_id')} IS NOT NULL", (), output_field=BooleanField())
+    return RawSQL(f"{_column(ClassSession, 'teacher_id')} = ANY(%s)", ([int(i) for i in lecturer_ids],),
+                  output_field=BooleanField())
+
+
+def is_exclusion_violation(exc) -> bool:
+    """IntegrityError z ograniczenia wykluczającego (psycopg 3: sqlstate, psycopg2: pgcode)."""
+    cause = exc.__cause__
+    return (getattr(cause, "sqlstate", None) or getattr(cause, "pgcode", None)) == EXCLUSION_VIOLATION
+
+
+def double_bookings(limit=50):
+    """Pary nakładających się zajęć tego samego prowadzącego: [(teacher_id, id_a, id_b), ...]."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT a.teacher_id, a.id, b.id FROM zastepstwa_classsession a "
+            "JOIN zastepstwa_classsession b ON a.teacher_id = b.teacher_id AND a.id < b.id AND a.span && b.span "
+            "ORDER BY a.teacher_id, a.id LIMIT %s",
+            [limit],
+        )
+        return cursor.fetchall()
+
+
+def constraint_installed() -> bool:
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", [CONSTRAINT_NAME])
+        return cursor.fetchone() is not None
@@ -0,0 +1,383 @@
+"""
+Planer zastępstw na dzień/zakres nieobecności.
+
+Wszystkie zajęcia z `needs_substitution` (jeszcze bez zastępcy) przydzielamy naraz:
+macierz kwalifikowalności wykładowca × zajęcia budujemy jednym kompletem zapytań,
+a przydział liczymy jako przepływ o minimalnym koszcie:
+
+    źródło → zajęcia (1) → (wykładowca, tydzień) → ujście
+
+Pojemność węzła (wykładowca, tydzień) to pozostały limit zastępstw w tym tygodniu, a każda
+kolejna jednostka jest droższa – obciążenie rozkłada się równomiernie. Limit godzin i kolizje
+między przydzielanymi zajęciami nie dają się wyrazić przepływem, więc po każdym rozwiązaniu
+naprawiamy je: konfliktową parę zakazujemy i liczymy ponownie.
+
+Reguły są te same co w EligibilityEngine (przedmiot z `Lecturer.subjects`, dostępność z zajęć
+realnie prowadzonych i nieobecności, limity tygodniowe; 0 = bez limitu).
+"""
+from collections import defaultdict, deque
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import pgranges
+from .intervals import IntervalIndex
+from .masks import get_masks
+from .models import ClassSession, Lecturer, LecturerUnavailability, LecturerWeekLoad, Substitution
+from .recurrence import OccurrenceConflict, materialize, virtual_occurrences
+from .services import (
+    EligibilityEngine, bump_data_version, local_date, take_write_lock, week_start_of, with_conflict_retries,
+)
+
+QUALIFICATION_PENALTY = 200   # brak wymaganych kwalifikacji: dopuszczalny, ale mniej pożądany
+HOURS_WEIGHT = 10             # koszt za każdą godzinę, którą kandydat już ma w tym tygodniu
+REPEAT_STEP = 100             # dopłata za każde kolejne zastępstwo tej samej osoby w tygodniu
+
+
+class PlanConflict(Exception):
+    """Plan nie daje się zapisać (dane zmieniły się od wyliczenia propozycji)."""
+
+    def __init__(self, problems):
+        super().__init__("; ".join(f"{sid}: {msg}" for sid, msg in problems))
+        self.problems = problems
+
+
+# -------------------- przepływ o minimalnym koszcie --------------------
+
+class MinCostFlow:
+    """Najkrótsze ścieżki powiększające (SPFA) – wystarcza dla setek zajęć i wykładowców."""
+
+    def __init__(self, n):
+        self.graph = [[] for _ in range(n)]
+
+    def add_edge(self, u, v, cap, cost):
+        # krawędź: [cel, pojemność, koszt, indeks krawędzi odwrotnej]
+        self.graph[u].append([v, cap, cost, len(self.graph[v])])
+        self.graph[v].append([u, 0, -cost, len(self.graph[u]) - 1])
+        return u, len(self.graph[u]) - 1
+
+    def flow(self, s, t):
+        total_flow = total_cost = 0
+        n = len(self.graph)
+        while True:
+            dist = [None] * n
+            prev = [None] * n
+            in_queue = [False] * n
+            dist[s] = 0
+            queue = deque([s])
+            in_queue[s] = True
+            while queue:
+                u = queue.popleft()
+                in_queue[u] = False
+                for i, (v, cap, cost, _) in enumerate(self.graph[u]):
+                    if cap > 0 and (dist[v] is None or dist[u] + cost < dist[v]):
+                        dist[v] = dist[u] + cost
+                        prev[v] = (u, i)
+                        if not in_queue[v]:
+                            in_queue[v] = True
+                            queue.append(v)
+            if dist[t] is None:
+                return total_flow, total_cost
+            # wszystkie pojemności poza ujściem są 1 – powiększamy o jedną jednostkę
+            v = t
+            while v != s:
+                u, i = prev[v]
+                edge = self.graph[u][i]
+                edge[1] -= 1
+                self.graph[v][edge[3]][1] += 1
+                v = u
+            total_flow += 1
+            total_cost += dist[t]
+
+    def used(self, ref):
+        u, i = ref
+        return self.graph[u][i][1] == 0
+
+
+# -------------------- dane wejściowe --------------------
+
+def sessions_needing_cover(start, end):
+    return (
+        ClassSession.objects
+        .filter(needs_substitution=True, start__gte=start, start__lt=end)
+        .filter(Q(substitution__isnull=True) | Q(substitution__substitute_lecturer__isnull=True))
+        .select_related("subject", "lecturer")
+        .order_by("start", "id")
+    )
+
+
+def _hours(session):
+    return (session.end - session.start).total_seconds() / 3600.0
+
+
+# -------------------- planowanie --------------------
+
+def propose_plan(start, end):
+    """
+    Propozycja przydziału zastępców dla zajęć wymagających zastępstwa w [start, end).
+    Zwraca {"assignments": [...], "unassigned": [...]} gotowe do JSON.
+    """
+    sessions = list(sessions_needing_cover(start, end))
+    if not sessions:
+        return {"assignments": [], "unassigned": []}
+    return _describe(sessions, *_plan(sessions))
+
+
+def _plan(sessions):
+    """Macierz kwalifikowalności i przydział dla listy zajęć: (kandydaci, przydział, wykładowcy, obciążenia)."""
+    span_start = min(s.start for s in sessions)
+    span_end = max(s.end for s in sessions)
+
+    lecturers = {l.id: l for l in Lecturer.objects.only(*EligibilityEngine.LECTURER_FIELDS)}
+    masks = get_masks()
+    teaches = {sid: set(masks.teachers_of(sid)) for sid in {s.subject_id for s in sessions}}
+
+    mondays = {week_start_of(s.start) for s in sessions}
+    loads = {
+        (lid, monday): (own + taken, subs)
+        for lid, monday, own, taken, subs in LecturerWeekLoad.objects.filter(week_start__in=mondays)
+        .values_list("lecturer_id", "week_start", "own_hours", "taken_hours", "subs_count")
+    }
+    busy = IntervalIndex.load(span_start, span_end, exclude_session_ids=[s.id for s in sessions])
+    # nieobecni: właściciele zajęć do obsadzenia nie zastępują nikogo tego samego dnia
+    absent = {(s.lecturer_id, local_date(s.start)) for s in sessions}
+
+    # macierz kwalifikowalności: zajęcia -> [(wykładowca, koszt)]
+    candidates = {}
+    for s in sessions:
+        monday, day, hours = week_start_of(s.start), local_date(s.start), _hours(s)
+        options = []
+        for lid in teaches[s.subject_id]:
+            l = lecturers[lid]
+            if lid == s.lecturer_id or (lid, day) in absent or not busy.is_free(lid, s.start, s.end):
+                continue
+            hours_now, _ = loads.get((lid, monday), (0.0, 0))
+            if l.max_hours_per_week and hours_now + hours > l.max_hours_per_week:
+                continue
+            cost = int(HOURS_WEIGHT * hours_now)
+            if not masks.has_required(lid, s.subject_id):
+                cost += QUALIFICATION_PENALTY
+            options.append((lid, cost))
+        candidates[s.id] = options
+
+    forbidden = set()
+    while True:
+        chosen = _solve(sessions, candidates, lecturers, loads, forbidden)
+        violations = _violations(sessions, chosen, lecturers, loads)
+        if not violations:
+            break
+        forbidden |= violations
+    return candidates, chosen, lecturers, loads
+
+
+def _solve(sessions, candidates, lecturers, loads, forbidden):
+    """Jedno rozwiązanie przepływu: {session_id: lecturer_id}."""
+    nodes = {}
+
+    def node(key):
+        return nodes.setdefault(key, len(nodes))
+
+    source, sink = node("source"), node("sink")
+    for s in sessions:
+        node(("s", s.id))
+    edges, demand = [], defaultdict(int)
+    for s in sessions:
+        for lid, _ in candidates[s.id]:
+            if (s.id, lid) not in forbidden:
+                demand[(lid, week_start_of(s.start))] += 1
+
+    for key in demand:
+        node(("w",) + key)
+    mcf = MinCostFlow(len(nodes))
+    for s in sessions:
+        mcf.add_edge(source, nodes[("s", s.id)], 1, 0)
+        for lid, cost in candidates[s.id]:
+            if (s.id, lid) in forbidden:
+                continue
+            ref = mcf.add_edge(nodes[("s", s.id)], nodes[("w", lid, week_start_of(s.start))], 1, cost)
+            edges.append((ref, s.id, lid))
+    for (lid, monday), count in demand.items():
+        limit = lecturers[lid].max_substitutions_per_week
+        _, subs_now = loads.get((lid, monday), (0.0, 0))
+        room = count if not limit else min(count, limit - subs_now)
+        # każda kolejna jednostka droższa (koszt wypukły = równomierny rozkład)
+        for k in range(max(0, room)):
+            mcf.add_edge(nodes[("w", lid, monday)], sink, 1, REPEAT_STEP * (subs_now + k))
+    mcf.flow(source, sink)
+    return {sid: lid for ref, sid, lid in edges if mcf.used(ref)}
+
+
+def _violations(sessions, chosen, lecturers, loads):
+    """Pary (zajęcia, wykładowca) łamiące limit godzin albo kolidujące z innym przydziałem."""
+    kept = IntervalIndex()
+    added = defaultdict(float)
+    bad = set()
+    for s in sessions:  # posortowane po starcie – przy konflikcie odpada późniejsze
+        lid = chosen.get(s.id)
+        if lid is None:
+            continue
+        key = (lid, week_start_of(s.start))
+        limit = lecturers[lid].max_hours_per_week
+        hours_now, _ = loads.get(key, (0.0, 0))
+        if kept.overlaps(lid, s.start, s.end) or (limit and hours_now + added[key] + _hours(s) > limit):
+            bad.add((s.id, lid))
+            continue
+        kept.add(lid, s.start, s.end)
+        added[key] += _hours(s)
+    return bad
+
+
+def _describe(sessions, candidates, chosen, lecturers, loads):
+    assignments, unassigned = [], []
+    added = defaultdict(lambda: [0.0, 0])
+    for s in sessions:
+        base = {
+            "session_id": s.id,
+            "subject": s.subject.name,
+            "start": s.start.isoformat(),
+            "end": s.end.isoformat(),
+            "lecturer_id": s.lecturer_id,
+            "lecturer_name": f"{s.lecturer.first_name} {s.lecturer.last_name}",
+        }
+        lid = chosen.get(s.id)
+        if lid is None:
+            reason = ("Brak kandydata spełniającego kryteria" if not candidates[s.id]
+                      else "Kandydaci wyczerpani przez inne zajęcia planu")
+            unassigned.append({**base, "reason": reason})
+            continue
+        key = (lid, week_start_of(s.start))
+        added[key][0] += _hours(s)
+        added[key][1] += 1
+        hours_now, subs_now = loads.get(key, (0.0, 0))
+        l = lecturers[lid]
+        assignments.append({
+            **base,
+            "substitute_id": lid,
+            "substitute_name": f"{l.first_name} {l.last_name}",
+            "hours_week_after": round(hours_now + added[key][0], 2),
+            "subs_week_after": subs_now + added[key][1],
+        })
+    return {"assignments": assignments, "unassigned": unassigned}
+
+
+# -------------------- zapis --------------------
+
+def commit_plan(assignments):
+    """
+    Zapisuje plan [(session_id, lecturer_id), ...] w jednej transakcji. Każdy przydział jest
+    ponownie sprawdzany silnikiem (kolejne widzą już poprzednie – sygnały odświeżają obciążenia);
+    przy pierwszym problemie całość jest wycofywana (PlanConflict z listą powodów).
+    Konflikt blokad z równoległą rezerwacją kończy się ponowieniem całej transakcji.
+    """
+    return with_conflict_retries(_commit_plan, dict(assignments))
+
+
+def _commit_plan(pairs):
+    with transaction.atomic():
+        take_write_lock(ClassSession, min(pairs, default=0))
+        sessions = list(
+            ClassSession.objects.select_for_update(of=("self",))
+            .filter(id__in=pairs).select_related("substitution").order_by("start", "id")
+        )
+        # potem zastępcy, po id – stała kolejność blokad, więc równoległe plany się nie zakleszczą
+        lecturers = {l.id: l for l in Lecturer.objects.select_for_update()
+                     .filter(id__in=set(pairs.values())).order_by("id")}
+        problems = [(sid, "Nie ma takich zajęć") for sid in set(pairs) - {s.id for s in sessions}]
+        for s in sessions:
+            lecturer = lecturers.get(pairs[s.id])
+            if lecturer is None:
+                problems.append((s.id, "Nie ma takiego wykładowcy"))
+                continue
+            try:
+                if s.substitution.substitute_lecturer_id is not None:
+                    problems.append((s.id, "Zajęcia mają już zastępcę"))
+                    continue
+            except Substitution.DoesNotExist:
+                pass
+            reason = EligibilityEngine.reason(EligibilityEngine(s).evaluate(lecturer))
+            if reason:
+                problems.append((s.id, reason))
+                continue
+            try:
+                with transaction.atomic():
+                    Substitution.objects.update_or_create(session=s, defaults={"substitute_lecturer": lecturer})
+            except IntegrityError as exc:
+                if not pgranges.is_exclusion_violation(exc):
+                    raise
+                problems.append((s.id, "Kolizja w kalendarzu"))
+        if problems:
+            raise PlanConflict(problems)
+    return len(sessions)
+
+
+# -------------------- nieobecność wykładowcy --------------------
+
+def plan_absence(lecturer_id, start, end, reason="", record_unavailability=True, top=5):
+    """
+    Nieobecność wykładowcy w [start, end): wszystkie jego zajęcia w zakresie oznaczamy jednym
+    UPDATE jako wymagające zastępstwa (terminy cykli najpierw dostają własne wiersze), opcjonalnie
+    zapisujemy LecturerUnavailability, a zastępców dla wszystkich zajęć naraz liczy planer.
+    Zwraca podsumowanie per zajęcia: propozycję i ranking kandydatów (od najtańszego). Zastępstw
+    nie zapisuje – propozycje zatwierdza się przez commit_plan. PlanConflict (nic nie zapisano),
+    gdy termin cyklu nie daje się zapisać, bo PostgreSQL wykrył kolizję z innymi zajęciami.
+    """
+    with transaction.atomic():
+        try:
+            for o in virtual_occurrences(start, end, lecturer_ids=[lecturer_id]):
+                materialize(o.series.id, o.start)
+        except OccurrenceConflict as exc:
+            raise PlanConflict([(exc.key, "Termin cyklu koliduje z innymi zajęciami prowadzącego")])
+        if record_unavailability:
+            LecturerUnavailability.objects.create(lecturer_id=lecturer_id, start=start, end=end, reason=reason)
+        affected = ClassSession.objects.filter(lecturer_id=lecturer_id, start__lt=end, end__gt=start)
+        # update() pomija sygnały – wersję kalendarza ustawiamy w tym samym zapytaniu
+        flagged = affected.filter(needs_substitution=False).update(
+            needs_substitution=True, version=bump_data_version(), updated_at=timezone.now(),
+        )
+
+    sessions = list(affected.select_related("subject", "lecturer", "substitution__substitute_lecturer")
+                    .order_by("start", "id"))
+    covered = {s.id: s.substitution.substitute_lecturer for s in sessions
+               if _substitute_id(s) is not None}
+    open_sessions = [s for s in sessions if s.id not in covered]
+    candidates, chosen, lecturers, loads = _plan(open_sessions) if open_sessions else ({}, {}, {}, {})
+    plan = _describe(open_sessions, candidates, chosen, lecturers, loads)
+    described = {row["session_id"]: row for row in plan["assignments"] + plan["unassigned"]}
+
+    rows = []
+    for s in sessions:
+        if s.id in covered:
+            substitute = covered[s.id]
+            rows.append({
+                "session_id": s.id, "subject": s.subject.name,
+                "start": s.start.isoformat(), "end": s.end.isoformat(),
+                "status": "covered", "substitute_id": substitute.id,
+                "substitute_name": f"{substitute.first_name} {substitute.last_name}",
+            })
+            continue
+        ranked = sorted(candidates[s.id], key=lambda option: (option[1], option[0]))[:top]
+        rows.append({
+            **described[s.id],
+            "status": "proposed" if s.id in chosen else "unassigned",
+            "candidates": [
+                {"lecturer_id": lid, "name": f"{lecturers[lid].first_name} {lecturers[lid].last_name}", "cost": cost}
+                for lid, cost in ranked
+            ],
+        })
+    return {
+        "lecturer_id": lecturer_id,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "flagged": flagged,
+        "sessions": rows,
+        "assignments": [{"session_id": r["session_id"], "lecturer_id": r["substitute_id"]}
+                        for r in rows if r["status"] == "proposed"],
+    }
+
+
+def _substitute_id(session):
+    try:
+        return session.substitution.substitute_lecturer_id
+    except Substitution.DoesNotExist:
+        return None
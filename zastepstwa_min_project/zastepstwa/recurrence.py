@@ -0,0 +1,165 @@
+"""
+Zajęcia cykliczne: reguła w RecurringSession, terminy rozwijane leniwie – tylko dla okna,
+o które pyta kalendarz, obciążenia albo kontrola dostępności.
+
+Termin cyklu staje się zwykłym ClassSession (series + occurrence_start) dopiero wtedy, gdy
+potrzebuje własnego wiersza – np. dostaje zastępstwo. Od tej chwili to on zastępuje termin
+wirtualny; odwołane terminy to RecurrenceException.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import pgranges
+from .models import ClassSession, RecurrenceException, RecurringSession
+
+Occurrence = namedtuple("Occurrence", "key series start end")
+
+
+class OccurrenceConflict(Exception):
+    """Termin cyklu nachodzi na inne zajęcia prowadzącego – PostgreSQL odrzucił wiersz (ograniczenie wykluczające)."""
+
+    def __init__(self, series_id, start):
+        super().__init__(f"{occurrence_key(series_id, start)}: prowadzący ma już inne zajęcia w tym czasie")
+        self.key = occurrence_key(series_id, start)
+
+
+def occurrence_key(series_id, start) -> str:
+    """Identyfikator terminu wirtualnego w API kalendarza, np. "r12-1760000000"."""
+    return f"r{series_id}-{int(start.timestamp())}"
+
+
+def parse_occurrence_key(key):
+    """(series_id, start) albo None dla niepoprawnego klucza."""
+    try:
+        series_id, ts = key[1:].split("-", 1)
+        if key[0] != "r":
+            return None
+        return int(series_id), datetime.fromtimestamp(int(ts), tz=dt_timezone.utc)
+    except (ValueError, IndexError, TypeError):
+        return None
+
+
+def expand(series, window_start=None, window_end=None):
+    """
+    Terminy (start, end) cyklu nachodzące na [window_start, window_end) – bez zapytań do bazy.
+    Godzina lokalna jest stała (zmiana czasu letniego nie przesuwa zajęć).
+    """
+    tz = timezone.get_current_timezone()
+    first = timezone.localtime(series.start, tz)
+    duration = series.end - series.start
+    step = (7 if series.freq == RecurringSession.WEEKLY else 1) * max(1, series.interval)
+
+    k = 0
+    if window_start is not None:
+        # przeskocz terminy na pewno wcześniejsze niż okno (zapas na czas trwania)
+        lead = (timezone.localtime(window_start, tz).date() - first.date()).days - duration.days - 1
+        k = max(0, lead // step)
+    while True:
+        day = first.date() + timedelta(days=k * step)
+        if day > series.until:
+            return
+        start = timezone.make_aware(datetime.combine(day, first.time()), tz)
+        if window_end is not None and start >= window_end:
+            return
+        end = start + duration
+        if window_start is None or end > window_start:
+            yield start, end
+        k += 1
+
+
+def _series_in(window_start, window_end):
+    qs = RecurringSession.objects.all()
+    if window_end is not None:
+        qs = qs.filter(start__lt=window_end)
+    if window_start is not None:
+        qs = qs.filter(until__gte=timezone.localtime(window_start).date() - timedelta(days=1))
+    return qs
+
+
+def virtual_occurrences(window_start=None, window_end=None, lecturer_ids=None):
+    """
+    Terminy cykli nachodzące na okno, pomijając odwołane i zmaterializowane.
+    Jedno zapytanie o cykle (+ po jednym o wyjątki i wiersze zmaterializowane, jeśli są cykle).
+    """
+    series_qs = _series_in(window_start, window_end).select_related("subject", "lecturer")
+    if lecturer_ids is not None:
+        series_qs = series_qs.filter(lecturer_id__in=lecturer_ids)
+    series_list = list(series_qs)
+    if not series_list:
+        return []
+
+    ids = [s.id for s in series_list]
+    window = Q()
+    if window_start is not None:
+        window &= Q(original_start__gte=window_start - timedelta(days=1))
+    if window_end is not None:
+        window &= Q(original_start__lt=window_end)
+    skip = set(RecurrenceException.objects.filter(window, series_id__in=ids)
+               .values_list("series_id", "original_start"))
+    materialized = ClassSession.objects.filter(series_id__in=ids)
+    if window_start is not None:
+        materialized = materialized.filter(occurrence_start__gte=window_start - timedelta(days=1))
+    if window_end is not None:
+        materialized = materialized.filter(occurrence_start__lt=window_end)
+    skip |= set(materialized.values_list("series_id", "occurrence_start"))
+
+    found = []
+    for series in series_list:
+        for start, end in expand(series, window_start, window_end):
+            if (series.id, start) not in skip:
+                found.append(Occurrence(occurrence_key(series.id, start), series, start, end))
+    return found
+
+
+def is_occurrence(series, start) -> bool:
+    return any(s == start for s, _ in expand(series, start, start + timedelta(seconds=1)))
+
+
+def find_occurrence(series_id, start):
+    """
+    Termin wirtualny cyklu – tylko odczyt; None, jeśli taki termin nie istnieje, został odwołany
+    albo ma już własny wiersz.
+    """
+    series = RecurringSession.objects.select_related("subject", "lecturer").filter(id=series_id).first()
+    if series is None or not is_occurrence(series, start):
+        return None
+    if (RecurrenceException.objects.filter(series=series, original_start=start).exists()
+            or ClassSession.objects.filter(series=series, occurrence_start=start).exists()):
+        return None
+    return Occurrence(occurrence_key(series.id, start), series, start, start + (series.end - series.start))
+
+
+def materialize(series_id, start):
+    """
+    Zapisuje termin cyklu jako ClassSession (idempotentnie) i go zwraca;
+    None, jeśli taki termin nie istnieje albo został odwołany. OccurrenceConflict, gdy wiersz
+    odrzuci ograniczenie wykluczające (PostgreSQL) – transakcja wywołującego zostaje nietknięta.
+    """
+    with transaction.atomic():
+        series = RecurringSession.objects.select_for_update().filter(id=series_id).first()
+        if series is None or not is_occurrence(series, start):
+            return None
+        if RecurrenceException.objects.filter(series=series, original_start=start).exists():
+            return None
+        try:
+            session, _ = ClassSession.objects.get_or_create(
+                series=series, occurrence_start=start,
+                defaults={"subject_id": series.subject_id, "lecturer_id": series.lecturer_id,
+                          "start": start, "end": start + (series.end - series.start)},
+            )
+        except IntegrityError as exc:
+            if not pgranges.is_exclusion_violation(exc):
+                raise
+            raise OccurrenceConflict(series_id, start) from exc
+    return session
+
+
+def cancel_occurrence(series_id, start, reason=""):
+    """Odwołuje termin cyklu (no-op, gdy cykl już nie istnieje)."""
+    if RecurringSession.objects.filter(id=series_id).exists():
+        RecurrenceException.objects.get_or_create(series_id=series_id, original_start=start,
+                                                  defaults={"reason": reason})
@@ -0,0 +1,65 @@
+"""
+Dane słownikowe w cache: przedmioty – to, czego potrzebują formularze widoków (checkboxy
+przedmiotów wykładowcy, lista przedmiotów przy zajęciach). Zmieniają się rzadko, a czytane są
+przy każdym wejściu na te strony. Wykładowców tu nie ma: listy i wybór w kalendarzu/formularzu zastępstwa
+czytają ich stronami i przez wyszukiwarkę (zastepstwa/listing.py).
+
+Każdy zestaw ma własny klucz w DataVersion ("refdata", "masks"); sygnały podbijają wersję przy
+zmianie tabel, a odczyt sprawdza ją jednym zapytaniem i przebudowuje dane tylko po zmianie.
+Operacje masowe z pominięciem sygnałów muszą same wywołać `bump_data_version(...)`.
+"""
+import threading
+from typing import NamedTuple
+
+from django.core.cache import cache
+
+from .models import DataVersion, Subject
+
+REFDATA_VERSION = "refdata"
+CACHE_TIMEOUT = 24 * 3600
+
+_local = threading.local()  # {klucz: (znacznik wersji, dane)} – bez odpakowywania z cache co żądanie
+
+
+def versioned_cache(key, build):
+    """Wynik `build()` ważny dla bieżącej wersji `key`: pamięć wątku → cache Django → budowa."""
+    # czas zmiany w znaczniku: po flush licznik startuje od nowa, a stare dane nie mogą wrócić
+    version, updated_at = (DataVersion.objects.filter(key=key)
+                           .values_list("version", "updated_at").first() or (0, None))
+    stamp = f"{version}:{updated_at.timestamp() if updated_at else 0}"
+    held = getattr(_local, "data", None)
+    if held is None:
+        held = _local.data = {}
+    if key in held and held[key][0] == stamp:
+        return held[key][1]
+    cache_key = f"zastepstwa:{key}:{stamp}"
+    data = cache.get(cache_key)
+    if data is None:
+        data = build()
+        cache.set(cache_key, data, CACHE_TIMEOUT)
+    held[key] = (stamp, data)
+    return data
+
+
+class SubjectRow(NamedTuple):
+    id: int
+    code: str
+    name: str
+
+    def __str__(self):
+        return f"{self.code}: {self.name}"  # jak Subject.__str__
+
+
+class RefData(NamedTuple):
+    subjects: tuple             # SubjectRow po kodzie i nazwie
+
+
+def build_refdata() -> RefData:
+    return RefData(
+        subjects=tuple(SubjectRow(*row) for row in Subject.objects.order_by("code", "name")
+                       .values_list("id", "code", "name")),
+    )
+
+
+def get_refdata() -> RefData:
+    return versioned_cache(REFDATA_VERSION, build_refdata)
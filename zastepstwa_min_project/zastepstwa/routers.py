@@ -0,0 +1,137 @@
+"""
+Odczyty z repliki, zapisy na bazę główną.
+
+Ponad 95% ruchu to odczyty (api/events, kalendarz, statystyki, listy). Z repliką skonfigurowaną
+w DATABASES żądania GET/HEAD czytają z niej, a wszystko inne – zapisy, odczyty wewnątrz
+transakcji (rezerwacje pod SELECT … FOR UPDATE, plany) i każde zapytanie poza żądaniem HTTP
+(komendy, sygnały) – idzie do "default":
+
+    DATABASES = {"default": {...}, "replica": {...}}
+    DATABASE_ROUTERS = ["zastepstwa.routers.PrimaryReplicaRouter"]
+    MIDDLEWARE = [..., "zastepstwa.routers.ReplicaRoutingMiddleware", ...]
+    ZASTEPSTWA_REPLICA_DB = "replica"
+    ZASTEPSTWA_REPLICA_STICKY_SECONDS = 10
+
+Czytaj-co-zapisałeś: po udanym żądaniu, które coś zapisało na bazie głównej (POST
+api/substitutions, formularze, ale też GET materializujący termin cyklu), klient dostaje ciasteczko, z którym przez ZASTEPSTWA_REPLICA_STICKY_SECONDS czyta z bazy głównej –
+opóźnienie replikacji nie cofnie mu właśnie zapisanego zastępstwa. Bez aliasu repliki
+w DATABASES middleware znika z łańcucha, a router kieruje wszystko do "default".
+"""
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+STICKY_COOKIE = "zastepstwa_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+class RequestRouting:
+    """Stan bieżącego żądania: czy może czytać z repliki i czy już coś zapisało."""
+
+    __slots__ = ("use_replica", "wrote")
+
+    def __init__(self, use_replica):
+        self.use_replica = use_replica
+        self.wrote = False
+
+
+# stan bieżącego żądania (None poza żądaniem); asgiref przenosi kontekst do sync_to_async,
+# a obiekt jest współdzielony, więc zapis w wątku widoku widzi też middleware
+_routing = ContextVar("zastepstwa_routing", default=None)
+
+
+def replica_alias():
+    """Alias repliki z ustawień albo None, gdy nie ma jej w DATABASES."""
+    alias = getattr(settings, "ZASTEPSTWA_REPLICA_DB", "replica")
+    return alias if alias and alias != DEFAULT_DB_ALIAS and alias in settings.DATABASES else None
+
+
+class PrimaryReplicaRouter:
+    """Router Django: odczyty na replikę tylko w żądaniach oznaczonych przez middleware."""
+
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        # po zapisie w tym samym żądaniu czytamy już z bazy głównej
+        if (state is None or not state.use_replica or state.wrote
+                or transaction.get_connection(DEFAULT_DB_ALIAS).in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return replica_alias() or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replika to kopia tej samej bazy
+        return True
+
+
+class ReplicaRoutingMiddleware:
+    """Oznacza żądania, które mogą czytać z repliki (bez ciasteczka po zapisie), i ustawia to ciasteczko po zapisie."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if replica_alias() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def _reads_replica(request):
+        return request.method in SAFE_METHODS and STICKY_COOKIE not in request.COOKIES
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        state = RequestRouting(self._reads_replica(request))
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._finish(response, state)
+
+    async def __acall__(self, request):
+        state = RequestRouting(self._reads_replica(request))
+        token = _routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._finish(response, state)
+
+    def _finish(self, response, state):
+        # o ciasteczku decyduje zapis, a nie metoda – nie każdy POST coś zapisuje (np. odrzucona rezerwacja)
+        if state.wrote and response.status_code < 400:
+            response.set_cookie(STICKY_COOKIE, "1", max_age=getattr(settings, "ZASTEPSTWA_REPLICA_STICKY_SECONDS", 10),
+                                httponly=True, samesite="Lax")
+        if response.streaming:
+            # api/events strumieniuje wiersze – zapytania wykonują się dopiero przy wysyłaniu treści
+            wrap = self._streamed_async if response.is_async else self._streamed
+            response.streaming_content = wrap(response.streaming_content, state)
+        return response
+
+    @staticmethod
+    def _streamed(content, state):
+        token = _routing.set(state)
+        try:
+            yield from content
+        finally:
+            _routing.reset(token)
+
+    @staticmethod
+    async def _streamed_async(content, state):
+        token = _routing.set(state)
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            _routing.reset(token)
@@ -1,154 +1,659 @@
 
+import random
+import time as _time
+from collections import defaultdict
 from datetime import datetime, date, time, timedelta
 from typing import Tuple
+from asgiref.sync import sync_to_async
 from django.utils import timezone
-from django.db.models import Q, Sum, F, ExpressionWrapper, DurationField
-from .models import ClassSession, Lecturer, Subject, Substitution
-from django.core.exceptions import FieldError
-
-def week_bounds(dt):
-    # tydzień pon-ndz [start, end)
-    monday = dt - timedelta(days=dt.weekday())
-    start = timezone.make_aware(timezone.datetime(monday.year, monday.month, monday.day, 0,0,0))
-    end = start + timedelta(days=7)
-    return start, end
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, OperationalError, transaction
+from django.db.models import (
+    Q, Sum, Count, F, Min, Max, ExpressionWrapper, DurationField, DateField, FilteredRelation,
+)
+from django.db.models.functions import Coalesce, TruncDate, TruncWeek
+from .broadcast import get_broadcaster
+from .masks import get_masks
+from . import pgranges
+from .recurrence import virtual_occurrences
+from .models import (
+    ClassSession, Lecturer, Subject, Substitution, LecturerWeekLoad, LecturerDayLoad,
+    LecturerUnavailability, DataVersion, SessionTombstone,
+)
 
 def overlaps(a_start, a_end, b_start, b_end) -> bool:
     return max(a_start, b_start) < min(a_end, b_end)
 
 def has_qualifications(lecturer: Lecturer, subject: Subject) -> bool:
-    required = set(subject.required_qualifications.values_list("id", flat=True))
-    if not required:
-        return True
-    have = set(lecturer.qualifications.values_list("id", flat=True))
-    return required.issubset(have)
+    return get_masks().has_required(lecturer.id, subject.id)
 
-def has_time_conflict(lecturer: Lecturer, start, end) -> bool:
+def has_time_conflict(lecturer: Lecturer, start, end, exclude_session_id=None) -> bool:
     # czy ma inne zajecia (swoje lub w zastępstwie) w tym czasie
-    own = ClassSession.objects.filter(lecturer=lecturer, start__lt=end, end__gt=start)
-    as_sub = ClassSession.objects.filter(substitutions__substitute=lecturer, start__lt=end, end__gt=start)
-    return own.exists() or as_sub.exists()
+    return not is_free(lecturer, start, end, exclude_session_id=exclude_session_id)
 
 def weekly_counts(lecturer: Lecturer, when):
-    ws, we = week_bounds(when)
-    subs = Substitution.objects.filter(substitute=lecturer, session__start__gte=ws, session__start__lt=we).count()
-    duration = ExpressionWrapper(F('end') - F('start'), output_field=DurationField())
-    own_hours = ClassSession.objects.filter(lecturer=lecturer, start__gte=ws, start__lt=we).aggregate(total=Sum(duration))['total'] or timezone.timedelta()
-    sub_hours = ClassSession.objects.filter(substitutions__substitute=lecturer, start__gte=ws, start__lt=we).aggregate(total=Sum(duration))['total'] or timezone.timedelta()
-    return subs, (own_hours + sub_hours)
+    hours, subs = weekly_load(lecturer, when)
+    return subs, timedelta(hours=hours)
 
 def can_take_substitution(lecturer: Lecturer, session: ClassSession) -> Tuple[bool, str]:
-    if not has_qualifications(lecturer, session.subject):
-        return False, "Brak kwalifikacji do tego przedmiotu."
-    if has_time_conflict(lecturer, session.start, session.end):
-        return False, "Kolizja w grafiku – inne zajęcia w tym czasie."
-    subs_count, total_hours = weekly_counts(lecturer, session.start)
-    duration = (session.end - session.start)
-    if subs_count + 1 > lecturer.max_substitutions_per_week:
-        return False, f"Przekroczysz limit zastępstw na tydzień ({lecturer.max_substitutions_per_week})."
-    hours_num = (total_hours + duration).total_seconds() / 3600
-    if hours_num > lecturer.max_hours_per_week:
-        return False, f"Przekroczysz limit godzin na tydzień ({lecturer.max_hours_per_week}h)."
-    return True, "OK"
-
-def _week_bounds(dt):
+    result = EligibilityEngine(session).evaluate(lecturer)
+    return result["ok"], EligibilityEngine.reason(result) or "OK"
+
+def week_start_of(dt) -> date:
+    """Poniedziałek (data) tygodnia zawierającego `dt` w lokalnej strefie."""
+    dt_local = timezone.localtime(dt, timezone.get_current_timezone())
+    return dt_local.date() - timedelta(days=dt_local.weekday())
+
+def week_bounds(dt):
     """Zwraca poniedziałek 00:00 i początek następnego poniedziałku w lokalnej strefie."""
-    tz = timezone.get_current_timezone()
-    dt_local = timezone.localtime(dt, tz)
-    monday = dt_local.date() - timedelta(days=dt_local.weekday())
-    start = timezone.make_aware(datetime.combine(monday, time(0, 0)), tz)
-    end = start + timedelta(days=7)
-    return start, end
+    return _week_bounds_of(week_start_of(dt))
+
+def _week_bounds_of(monday: date):
+    start = timezone.make_aware(datetime.combine(monday, time(0, 0)), timezone.get_current_timezone())
+    return start, start + timedelta(days=7)
 
 def _overlap_q(start, end):
     # A.start < B.end AND A.end > B.start
     return Q(start__lt=end, end__gt=start)
 
-def evaluate_substitution(lecturer, session):
+
+# -------------------- Dostępność (zapytania ograniczone indeksami) --------------------
+
+def _duration():
+    return ExpressionWrapper(F("end") - F("start"), output_field=DurationField())
+
+
+def _taught_q(lecturer_ids=None):
     """
-    Zwraca szczegóły walidacji kandydata dla danego zastępstwa:
-    - kwalifikacje
-    - dostępność czasową
-    - limity: liczba zastępstw/tydzień i godziny/tydzień (po dodaniu tego zastępstwa)
+    Zajęcia, które ktoś realnie prowadzi: własne bez wpisu zastępstwa albo przejęte przez zastępcę.
+    Oddane zajęcia nie liczą się właścicielowi. Opcjonalnie zawężone do podanych wykładowców.
     """
-    # 1) kwalifikacje
-    req_ids = set(session.subject.required_qualifications.values_list("id", flat=True))
-    have_ids = set(lecturer.qualifications.values_list("id", flat=True))
-    has_required = req_ids.issubset(have_ids)
+    if lecturer_ids is None:
+        return Q(substitution__isnull=True) | Q(substitution__substitute_lecturer__isnull=False)
+    return (Q(lecturer_id__in=lecturer_ids, substitution__isnull=True)
+            | Q(substitution__substitute_lecturer_id__in=lecturer_ids))
 
-    # 2) wolny termin (własne zajęcia + te, gdzie już zastępuje)
-    try:
-        conflict_qs = ClassSession.objects.filter(
-            Q(lecturer=lecturer) | Q(substitutions__substitute=lecturer)
-        )
-    except FieldError:
-        # fallback na ewentualne related_name='substitution'
-        conflict_qs = ClassSession.objects.filter(
-            Q(lecturer=lecturer) | Q(substitution__substitute=lecturer)
-        )
 
-    conflict = conflict_qs.filter(_overlap_q(session.start, session.end))\
-                          .exclude(id=session.id)\
-                          .exists()
-    is_free = not conflict
-
-    # 3) granice tygodnia wg terminu TEGO zastępstwa
-    week_start, week_end = _week_bounds(session.start)
-
-    # 4) liczba zastępstw w tygodniu (po dodaniu tego)
-    subs_week = Substitution.objects.filter(
-        substitute=lecturer,
-        session__start__gte=week_start,
-        session__start__lt=week_end,
-    ).count()
-    subs_week_after = subs_week + 1
-    subs_limit = int(lecturer.max_substitutions_per_week or 0)
-    subs_ok = (subs_limit == 0) or (subs_week_after <= subs_limit)
-
-    # 5) godziny/tydzień (własne + przyjęte zastępstwa)
-    try:
-        week_sessions = ClassSession.objects.filter(
-            Q(lecturer=lecturer) | Q(substitutions__substitute=lecturer),
-            start__gte=week_start, start__lt=week_end
-        ).distinct()
-    except FieldError:
-        week_sessions = ClassSession.objects.filter(
-            Q(lecturer=lecturer) | Q(substitution__substitute=lecturer),
-            start__gte=week_start, start__lt=week_end
-        ).distinct()
-
-    def hours_sum(qs):
-        total = 0.0
-        for s in qs:
-            total += (s.end - s.start).total_seconds() / 3600.0
-        return total
-
-    hours_week_now = hours_sum(week_sessions)
-    this_hours = (session.end - session.start).total_seconds() / 3600.0
-    hours_week_after = hours_week_now + this_hours
-    hours_limit = float(lecturer.max_hours_per_week or 0)
-    hours_ok = (hours_limit == 0.0) or (hours_week_after <= hours_limit)
-
-    qualifications = list(lecturer.qualifications.values_list("code", flat=True))
-    required_codes = list(session.subject.required_qualifications.values_list("code", flat=True))
-
-    ok = has_required and is_free and subs_ok and hours_ok
+def busy_intervals(start, end, lecturer_ids=None, exclude_session_ids=()):
+    """
+    Lista (start, end, lecturer_id) wszystkiego, co blokuje wykładowcę w [start, end): zajęcia
+    realnie prowadzone (zastępca albo właściciel) UNION ALL nieobecności – jedno zapytanie, oba
+    człony korzystają z indeksów (lecturer, start, end) – plus terminy cykli rozwinięte dla okna.
+    Na PostgreSQL (pgranges) – `span && [start, end)` po indeksach GiST i kolumna teacher_id
+    zamiast złączenia z zastępstwami.
+    """
+    if pgranges.range_mode():
+        sessions = (ClassSession.objects.filter(pgranges.overlaps(ClassSession, start, end))
+                    .filter(pgranges.taught_by(lecturer_ids)))
+        teacher = pgranges.teacher()
+        absences = LecturerUnavailability.objects.filter(pgranges.overlaps(LecturerUnavailability, start, end))
+    else:
+        sessions = ClassSession.objects.filter(_overlap_q(start, end)).filter(_taught_q(lecturer_ids))
+        teacher = Coalesce("substitution__substitute_lecturer_id", "lecturer_id")
+        absences = LecturerUnavailability.objects.filter(_overlap_q(start, end))
+    if exclude_session_ids:
+        sessions = sessions.exclude(id__in=exclude_session_ids)
+    sessions = sessions.annotate(teacher_id=teacher).values_list("start", "end", "teacher_id")
+    if lecturer_ids is not None:
+        absences = absences.filter(lecturer_id__in=lecturer_ids)
+    # po obu stronach kolumny w tej samej kolejności: pola, potem adnotacja
+    absences = absences.annotate(teacher_id=F("lecturer_id")).values_list("start", "end", "teacher_id")
+    rows = list(sessions.union(absences, all=True))
+    rows += [(o.start, o.end, o.series.lecturer_id) for o in virtual_occurrences(start, end, lecturer_ids)]
+    return rows
+
 
+def busy_lecturer_ids(start, end, lecturer_ids=None, exclude_session_id=None):
+    """Id wykładowców zajętych w [start, end) – zajęcia lub nieobecność (jedno zapytanie)."""
+    exclude = () if exclude_session_id is None else (exclude_session_id,)
+    return {lid for _, _, lid in busy_intervals(start, end, lecturer_ids, exclude)}
+
+
+def _teacher_rows(qs):
+    # grupowanie po faktycznie prowadzącym (zastępca albo właściciel)
+    return (
+        qs.annotate(teacher_id=Coalesce("substitution__substitute_lecturer_id", "lecturer_id"))
+        .values("teacher_id")
+    )
+
+
+def _load_sums():
+    taken = Q(substitution__substitute_lecturer__isnull=False)
     return {
-        "ok": ok,
-        "qualifications": qualifications,
-        "required": required_codes,
-        "has_required": has_required,
-        "is_free": is_free,
-
-        "subs_week_now": subs_week,
-        "subs_week_after": subs_week_after,
-        "subs_limit": subs_limit,
-        "subs_ok": subs_ok,
-
-        "hours_week_now": round(hours_week_now, 2),
-        "hours_week_after": round(hours_week_after, 2),
-        "hours_limit": hours_limit,
-        "hours_ok": hours_ok,
-        "this_hours": round(this_hours, 2),
+        "own": Sum(_duration(), filter=~taken),
+        "taken": Sum(_duration(), filter=taken),
+        "subs": Count("id", filter=taken),
     }
+
+
+def _hours(td):
+    return (td or timedelta()).total_seconds() / 3600.0
+
+
+def compute_loads(range_start, range_end, lecturer_ids=None):
+    """
+    Liczone od zera {lecturer_id: (godziny_własne, godziny_przejęte, liczba_zastępstw)}
+    dla zajęć zaczynających się w [range_start, range_end) – jedno zapytanie grupujące
+    (+ rozwinięcie cykli). Oddane zajęcia nie liczą się właścicielowi.
+    """
+    qs = (
+        ClassSession.objects
+        .filter(start__gte=range_start, start__lt=range_end)
+        .filter(_taught_q(lecturer_ids))
+    )
+    rows = _teacher_rows(qs).annotate(**_load_sums())
+    loads = {r["teacher_id"]: (_hours(r["own"]), _hours(r["taken"]), int(r["subs"] or 0)) for r in rows}
+    # terminy cykli bez własnego wiersza są zawsze własne (zastępstwo wymaga materializacji)
+    for o in virtual_occurrences(range_start, range_end, lecturer_ids):
+        if o.start >= range_start:
+            own, taken, subs = loads.get(o.series.lecturer_id, (0.0, 0.0, 0))
+            loads[o.series.lecturer_id] = (own + _hours(o.end - o.start), taken, subs)
+    return loads
+
+
+def is_free(lecturer: Lecturer, start, end, exclude_session_id=None) -> bool:
+    """Czy wykładowca jest wolny w [start, end) – bez zajęć i bez zgłoszonej nieobecności?"""
+    return lecturer.id not in busy_lecturer_ids(
+        start, end, lecturer_ids=[lecturer.id], exclude_session_id=exclude_session_id
+    )
+
+
+def weekly_load(lecturer: Lecturer, when):
+    """(godziny, liczba_zastępstw) w tygodniu zawierającym `when` – odczyt z LecturerWeekLoad."""
+    return week_loads(week_start_of(when), [lecturer.id]).get(lecturer.id, (0.0, 0))
+
+
+# -------------------- Obciążenia zmaterializowane (LecturerWeekLoad / LecturerDayLoad) --------------------
+
+def local_date(dt) -> date:
+    """Data `dt` w lokalnej strefie – klucz dziennych podsumowań."""
+    return timezone.localtime(dt, timezone.get_current_timezone()).date()
+
+
+def _day_bounds_of(day: date):
+    tz = timezone.get_current_timezone()
+    return (timezone.make_aware(datetime.combine(day, time(0, 0)), tz),
+            timezone.make_aware(datetime.combine(day + timedelta(days=1), time(0, 0)), tz))
+
+
+def _monday_of(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+# (model, pole kubełka, dzień -> kubełek, kubełek -> zakres czasu, funkcja grupująca)
+_ROLLUPS = (
+    (LecturerWeekLoad, "week_start", _monday_of, _week_bounds_of, TruncWeek),
+    (LecturerDayLoad, "day", lambda day: day, _day_bounds_of, TruncDate),
+)
+
+
+def week_loads(monday: date, lecturer_ids):
+    """{lecturer_id: (godziny, liczba_zastępstw)} z tabeli obciążeń – jedno zapytanie po kluczu."""
+    rows = (LecturerWeekLoad.objects.filter(week_start=monday, lecturer_id__in=lecturer_ids)
+            .values_list("lecturer_id", "own_hours", "taken_hours", "subs_count"))
+    return {lid: (own + taken, subs) for lid, own, taken, subs in rows}
+
+
+def _refresh_bucket(model, field, bucket, ids, fresh):
+    existing = {
+        row.lecturer_id: row
+        for row in model.objects.filter(**{field: bucket, "lecturer_id__in": ids})
+    }
+    missing = []
+    for lid in ids:
+        own, taken, subs = fresh.get(lid, (0.0, 0.0, 0))
+        row = existing.get(lid)
+        if row is None:
+            if lid in fresh:
+                missing.append(model(lecturer_id=lid, own_hours=own, taken_hours=taken, subs_count=subs,
+                                     **{field: bucket}))
+        elif (row.own_hours, row.taken_hours, row.subs_count) != (own, taken, subs):
+            row.own_hours, row.taken_hours, row.subs_count = own, taken, subs
+            row.save(update_fields=["own_hours", "taken_hours", "subs_count"])
+    # wykładowca mógł zostać usunięty w tej samej transakcji
+    live = set(Lecturer.objects.filter(id__in=[r.lecturer_id for r in missing]).values_list("id", flat=True))
+    model.objects.bulk_create([r for r in missing if r.lecturer_id in live])
+
+
+def refresh_loads(keys):
+    """
+    Przelicza obciążenia dla kluczy (lecturer_id, lokalna data zajęć) – dzienne i tygodniowe,
+    jedno zapytanie agregujące na kubełek. Wołane z sygnałów po każdej zmianie zajęć/zastępstw
+    oraz po operacjach masowych.
+    """
+    with transaction.atomic():
+        for model, field, bucket_of, bounds_of, _ in _ROLLUPS:
+            by_bucket = defaultdict(set)
+            for lecturer_id, day in keys:
+                if lecturer_id is not None:
+                    by_bucket[bucket_of(day)].add(lecturer_id)
+            for bucket, ids in by_bucket.items():
+                fresh = compute_loads(*bounds_of(bucket), lecturer_ids=ids)
+                _refresh_bucket(model, field, bucket, ids, fresh)
+
+
+def rollup_sums(sessions, trunc):
+    """
+    {(lecturer_id, kubełek): [godziny_własne, godziny_przejęte, liczba_zastępstw]} dla zajęć z `sessions`
+    zgrupowanych po `trunc("start")` w lokalnej strefie – jedno zapytanie.
+    """
+    rows = (
+        sessions.filter(_taught_q())
+        .annotate(teacher_id=Coalesce("substitution__substitute_lecturer_id", "lecturer_id"),
+                  bucket=trunc("start", output_field=DateField(), tzinfo=timezone.get_current_timezone()))
+        .values("teacher_id", "bucket")
+        .annotate(**_load_sums())
+    )
+    return {
+        (r["teacher_id"], r["bucket"]): [_hours(r["own"]), _hours(r["taken"]), int(r["subs"] or 0)]
+        for r in rows.iterator()
+    }
+
+
+def rebuild_loads(batch_size=2000):
+    """Pełna odbudowa obu tabel obciążeń (po jednym zapytaniu grupującym na tabelę + cykle)."""
+    occurrences = virtual_occurrences()
+    built = {}
+    for model, field, bucket_of, _, trunc in _ROLLUPS:
+        sums = rollup_sums(ClassSession.objects.all(), trunc)
+        for o in occurrences:
+            key = (o.series.lecturer_id, bucket_of(local_date(o.start)))
+            sums.setdefault(key, [0.0, 0.0, 0])[0] += _hours(o.end - o.start)
+        built[model] = [
+            model(lecturer_id=lid, own_hours=own, taken_hours=taken, subs_count=subs, **{field: bucket})
+            for (lid, bucket), (own, taken, subs) in sums.items()
+        ]
+    with transaction.atomic():
+        for model, objs in built.items():
+            model.objects.all().delete()
+            model.objects.bulk_create(objs, batch_size=batch_size)
+    return {model.__name__: len(objs) for model, objs in built.items()}
+
+
+def period_loads(start_day: date, end_day: date):
+    """
+    Obciążenie wszystkich wykładowców w dniach [start_day, end_day) z dziennych podsumowań –
+    jedno zapytanie (LEFT JOIN na LecturerDayLoad), wykładowcy bez zajęć mają zera.
+    """
+    window = FilteredRelation("day_loads", condition=Q(day_loads__day__gte=start_day, day_loads__day__lt=end_day))
+    return (
+        Lecturer.objects.order_by("last_name", "first_name")
+        .annotate(window=window)
+        .values("id", "first_name", "last_name")
+        .annotate(
+            own=Coalesce(Sum("window__own_hours"), 0.0),
+            taken=Coalesce(Sum("window__taken_hours"), 0.0),
+            subs=Coalesce(Sum("window__subs_count"), 0),
+        )
+    )
+
+
+def load_date_range():
+    """(pierwszy, ostatni) dzień z zajęciami albo None – z podsumowań, cache'owane per wersja danych."""
+    key = f"zastepstwa:load-range:{data_version()[0]}"
+    found = cache.get(key)
+    if found is None:
+        agg = LecturerDayLoad.objects.aggregate(first=Min("day"), last=Max("day"))
+        found = (agg["first"], agg["last"]) if agg["first"] else ()
+        cache.set(key, found, 3600)
+    return found or None
+
+
+def current_substitute_id(session: ClassSession):
+    # korzysta z select_related("substitution"), jeśli było
+    try:
+        return session.substitution.substitute_lecturer_id
+    except Substitution.DoesNotExist:
+        return None
+
+
+# -------------------- Wersja danych (ETag / synchronizacja kalendarza) --------------------
+
+EVENTS_VERSION = "events"
+SERIES_VERSION = "series"   # wersja ostatniej zmiany cykli – terminy wirtualne nie mają własnych wierszy
+
+
+def data_version(key=EVENTS_VERSION):
+    """(wersja, czas ostatniej zmiany) – jedno zapytanie po kluczu głównym."""
+    row = DataVersion.objects.filter(key=key).values_list("version", "updated_at").first()
+    return row or (0, None)
+
+
+def bump_data_version(key=EVENTS_VERSION, using=DEFAULT_DB_ALIAS) -> int:
+    """Atomowo podbija licznik i zwraca nową wartość (UPDATE blokuje wiersz do końca transakcji)."""
+    versions = DataVersion.objects.using(using)
+    with transaction.atomic(using=using):
+        now = timezone.now()
+        if not versions.filter(key=key).update(version=F("version") + 1, updated_at=now):
+            versions.get_or_create(key=key)
+            versions.filter(key=key).update(version=F("version") + 1, updated_at=now)
+        version = versions.filter(key=key).values_list("version", flat=True).get()
+    # powiadom otwarte kalendarze (SSE) dopiero po zatwierdzeniu zmian
+    transaction.on_commit(lambda: get_broadcaster().publish({"key": key, "version": version}), using=using)
+    return version
+
+
+def mark_series_changed() -> int:
+    """Zmiana cyklu/wyjątku: nowa wersja kalendarza + znacznik, że delta nie wystarczy."""
+    with transaction.atomic():
+        version = bump_data_version()
+        DataVersion.objects.update_or_create(key=SERIES_VERSION, defaults={"version": version})
+    return version
+
+
+def touch_sessions(sessions, version=None):
+    """
+    Oznacza zajęcia jako zmienione (nowa wersja) – dla zmian, które nie przechodzą przez save(),
+    np. nazwisko wykładowcy albo operacje masowe. Licznik i wiersze w jednej transakcji. Zwraca użytą wersję.
+    """
+    with transaction.atomic():
+        version = version or bump_data_version()
+        sessions.update(version=version, updated_at=timezone.now())
+    return version
+
+
+def stamp_after_commit(sessions=(), substitutions=(), removed=(), using=DEFAULT_DB_ALIAS):
+    """
+    Zmiany zapisane przez save()/delete() (sygnały) dostają wersję dopiero po zatwierdzeniu swojej
+    transakcji – w osobnej, krótkiej: podbicie licznika, UPDATE wersji wierszy i nagrobki usuniętych
+    zajęć zatwierdzają się razem. Dzięki temu:
+    - kto odczytał wersję v, widzi już każdy wiersz z wersją <= v (przy podbiciu przed zapisem
+      wiersza, np. w autocommit, api/events/changes mogło zmianę pominąć na zawsze),
+    - rezerwacje nie trzymają blokady wspólnego wiersza DataVersion do końca swojej transakcji,
+      więc rezerwacje różnych osób nie czekają na siebie.
+    Zmiany z jednej transakcji dostają jedną wersję. Po wycofanej transakcji zebrane id dostaną
+    wersję przy najbliższym zatwierdzeniu (klient pobierze je ponownie – nieszkodliwe); nagrobki
+    tylko dla zajęć, których faktycznie nie ma.
+    """
+    connection = transaction.get_connection(using)
+    pending = getattr(connection, "_zastepstwa_stamps", None)
+    if pending is None:
+        pending = connection._zastepstwa_stamps = {"sessions": set(), "substitutions": set(), "removed": set()}
+    pending["sessions"].update(sessions)
+    pending["substitutions"].update(substitutions)
+    pending["removed"].update(removed)
+    # poza transakcją (autocommit) wykona się od razu – wiersz jest już zapisany
+    transaction.on_commit(lambda: with_conflict_retries(_flush_stamps, using), using=using)
+
+
+def _flush_stamps(using):
+    connection = transaction.get_connection(using)
+    pending = getattr(connection, "_zastepstwa_stamps", None)
+    if not pending or not any(pending.values()):
+        return
+    sessions = ClassSession.objects.using(using)
+    with transaction.atomic(using=using):
+        version, now = bump_data_version(using=using), timezone.now()
+        sessions.filter(id__in=pending["sessions"]).update(version=version, updated_at=now)
+        Substitution.objects.using(using).filter(id__in=pending["substitutions"]).update(version=version)
+        alive = set(sessions.filter(id__in=pending["removed"]).values_list("id", flat=True))
+        SessionTombstone.objects.using(using).bulk_create([SessionTombstone(session_id=sid, version=version)
+                                                           for sid in pending["removed"] - alive])
+    connection._zastepstwa_stamps = None
+
+
+def changes_since(since, limit=None):
+    """
+    (zmienione zajęcia, id usuniętych zajęć) o wersji > since.
+    Zwraca None, gdy zmian jest więcej niż `limit` (klientowi taniej pobrać wszystko od nowa)
+    albo gdy zmienił się któryś cykl (jego terminy nie mają wierszy, więc nie ma czego wysłać).
+    """
+    if data_version(SERIES_VERSION)[0] > since:
+        return None
+    changed = ClassSession.objects.filter(version__gt=since).order_by("version")
+    removed = SessionTombstone.objects.filter(version__gt=since).values_list("session_id", flat=True)
+    if limit is not None and changed.count() + removed.count() > limit:
+        return None
+    return changed, list(removed)
+
+
+# -------------------- Silnik kwalifikowalności --------------------
+
+async def alist(qs):
+    return [row async for row in qs]
+
+
+class EligibilityEngine:
+    """
+    Jedno źródło prawdy o tym, czy wykładowca może przejąć dane zajęcia.
+
+    Uprawnienie do przedmiotu wynika z `Lecturer.subjects` (kwalifikacje są tylko informacyjne),
+    dostępność liczymy z zajęć realnie prowadzonych i zgłoszonych nieobecności, obciążenie – z zajęć
+    (oddane nie obciążają właściciela),
+    a same oceniane zajęcia nie wliczają się ani do kolizji, ani do limitów.
+    Dane wejściowe są zapamiętywane w instancji (= na żądanie): zajętość i obciążenie każdego
+    wykładowcy ładujemy najwyżej raz, więc rank + evaluate + reason nie powtarzają zapytań.
+    Po zapisie zastępstwa oceniaj nową instancją.
+    """
+
+    LECTURER_FIELDS = ("id", "first_name", "last_name",
+                       "max_substitutions_per_week", "max_hours_per_week")
+
+    def __init__(self, session: ClassSession):
+        self.session = session
+        self.this_hours = (session.end - session.start).total_seconds() / 3600.0
+        self.monday = week_start_of(session.start)
+        self._teacher = None
+        self._masks = None
+        self._busy, self._loads, self._loaded = set(), {}, set()
+
+    # ---- dane wejściowe (po jednym zapytaniu na grupę) ----
+
+    def _current_teacher(self):
+        """(id faktycznie prowadzącego te zajęcia, czy jako zastępca) – do odjęcia ich z limitów."""
+        if self._teacher is None:
+            try:
+                sub = self.session.substitution
+                self._teacher = (sub.substitute_lecturer_id, True)
+            except Substitution.DoesNotExist:
+                self._teacher = (self.session.lecturer_id, False)
+        return self._teacher
+
+    def _week_loads(self, ids):
+        return self._discount_current(week_loads(self.monday, ids))
+
+    def _discount_current(self, loads):
+        teacher_id, as_substitute = self._current_teacher()
+        if teacher_id in loads:
+            # oceniane zajęcia nie mogą obciążać kandydata, który już je prowadzi
+            hours, subs = loads[teacher_id]
+            loads[teacher_id] = (hours - self.this_hours, subs - (1 if as_substitute else 0))
+        return loads
+
+    def _missing(self, ids):
+        return [i for i in dict.fromkeys(ids) if i not in self._loaded]
+
+    def _remember(self, ids, busy, loads):
+        self._busy |= busy
+        self._loads.update(loads)
+        self._loaded.update(ids)
+
+    def _load(self, ids):
+        # przedmioty i kwalifikacje z bitmasek (cache) – zapytania tylko o zajętość i obciążenie
+        # wykładowców, których ta instancja jeszcze nie widziała
+        if self._masks is None:
+            self._masks = get_masks()
+        missing = self._missing(ids)
+        if missing:
+            busy = busy_lecturer_ids(self.session.start, self.session.end,
+                                     lecturer_ids=missing, exclude_session_id=self.session.id)
+            self._remember(missing, busy, self._week_loads(missing))
+        return self._masks, self._busy, self._loads
+
+    # ---- ocena ----
+
+    def evaluate_many(self, lecturers):
+        """Ocena wielu kandydatów naraz – stała liczba zapytań niezależnie od ich liczby."""
+        lecturers = list(lecturers)
+        ids = [l.id for l in lecturers]
+        if not ids:
+            return []
+        return self._results(lecturers, *self._load(ids))
+
+    async def aevaluate_many(self, lecturers):
+        """
+        Async wersja evaluate_many – te same zapytania, kolejno. Async ORM i sync_to_async
+        (thread_sensitive) wykonują je i tak po kolei w jednym wątku, więc gather niczego by nie
+        zrównoleglił; zysk jest tylko ten, że czekanie na bazę nie blokuje pętli zdarzeń.
+        Zapytania bez async API (UNION z terminami cykli, maski) idą przez sync_to_async.
+        """
+        lecturers = [l async for l in lecturers] if hasattr(lecturers, "__aiter__") else list(lecturers)
+        ids = [l.id for l in lecturers]
+        if not ids:
+            return []
+        if self._masks is None:
+            self._masks = await sync_to_async(get_masks)()
+        missing = self._missing(ids)
+        if missing:
+            busy = await sync_to_async(busy_lecturer_ids)(self.session.start, self.session.end,
+                                                          lecturer_ids=missing, exclude_session_id=self.session.id)
+            self._remember(missing, busy, await self._aweek_loads(missing))
+        return self._results(lecturers, self._masks, self._busy, self._loads)
+
+    async def _aweek_loads(self, ids):
+        rows = await alist(LecturerWeekLoad.objects.filter(week_start=self.monday, lecturer_id__in=ids)
+                           .values_list("lecturer_id", "own_hours", "taken_hours", "subs_count"))
+        await sync_to_async(self._current_teacher)()
+        loads = {lid: (own + taken, subs) for lid, own, taken, subs in rows}
+        return self._discount_current(loads)
+
+    def _results(self, lecturers, masks, busy, loads):
+        subject_id = self.session.subject_id
+        results = []
+        for l in lecturers:
+            hours_now, subs_now = loads.get(l.id, (0.0, 0))
+            hours_after = hours_now + self.this_hours
+            subs_after = subs_now + 1
+
+            subs_limit = l.max_substitutions_per_week or 0
+            hours_limit = l.max_hours_per_week or 0.0
+            subs_ok = (subs_limit == 0) or (subs_after <= subs_limit)
+            hours_ok = (hours_limit == 0) or (hours_after <= hours_limit)
+            can_teach = masks.can_teach(l.id, subject_id)
+            free = l.id not in busy
+
+            results.append({
+                "lecturer_id": l.id,
+                "name": f"{l.first_name} {l.last_name}",
+                "subjects": masks.subject_names(l.id),
+                "can_teach": can_teach,
+                "has_required": masks.has_required(l.id, subject_id),
+                "is_free": free,
+                "subs_week_after": subs_after,
+                "subs_limit": subs_limit,
+                "subs_ok": subs_ok,
+                "hours_week_after": round(hours_after, 2),
+                "hours_limit": hours_limit,
+                "hours_ok": hours_ok,
+                "ok": can_teach and free and subs_ok and hours_ok,
+            })
+        return results
+
+    def evaluate(self, lecturer: Lecturer):
+        return self.evaluate_many([lecturer])[0]
+
+    async def aevaluate(self, lecturer: Lecturer):
+        return (await self.aevaluate_many([lecturer]))[0]
+
+    def _candidates(self):
+        return (Lecturer.objects.exclude(id=self.session.lecturer_id)
+                .only(*self.LECTURER_FIELDS)
+                .order_by("last_name", "first_name"))
+
+    def rank(self, lecturers=None):
+        """Ranking kandydatów (domyślnie wszyscy poza prowadzącym) – najlepsi na początku."""
+        return self._sorted(self.evaluate_many(self._candidates() if lecturers is None else lecturers))
+
+    async def arank(self, lecturers=None):
+        return self._sorted(await self.aevaluate_many(self._candidates() if lecturers is None else lecturers))
+
+    @staticmethod
+    def _sorted(results):
+        # najpierw spełniający wszystkie kryteria, potem najmniej obciążeni
+        results.sort(key=lambda r: (
+            not r["ok"], not r["can_teach"], not r["is_free"],
+            r["hours_week_after"], r["subs_week_after"],
+        ))
+        return results
+
+    @staticmethod
+    def reason(result):
+        """Powód odrzucenia (tekst dla użytkownika) albo None, gdy kandydat jest OK."""
+        if not result["can_teach"]:
+            return "Ten wykładowca nie prowadzi tego przedmiotu"
+        if not result["is_free"]:
+            return "Kolizja w kalendarzu"
+        if not result["subs_ok"]:
+            return "Przekroczony limit zastępstw w tygodniu"
+        if not result["hours_ok"]:
+            return "Przekroczony limit godzin w tygodniu"
+        return None
+
+
+# -------------------- Rezerwacja zastępstw --------------------
+
+CONFLICT_RETRIES = 8
+
+
+def with_conflict_retries(fn, *args, retries=CONFLICT_RETRIES, **kwargs):
+    """
+    Wywołuje `fn` (która sama otwiera transakcję) i ponawia ją po konflikcie blokad:
+    SQLite zgłasza „database is locked”, gdy dwie transakcje chcą naraz pisać,
+    PostgreSQL – zakleszczenie lub błąd serializacji. Odstęp rośnie wykładniczo, z losowym rozrzutem.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except OperationalError:
+            # w zewnętrznej transakcji ponowienie nic nie da – błąd musi ją wycofać
+            if attempt == retries or transaction.get_connection().in_atomic_block:
+                raise
+            _time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+
+def take_write_lock(model, pk):
+    """
+    SQLite: nie ma SELECT … FOR UPDATE, a transakcja zaczyna się jako odroczona – dwie, które
+    najpierw czytały, przy pierwszym zapisie wzajemnie się blokują i jedna od razu dostaje
+    „database is locked”. Pusty UPDATE na starcie bierze blokadę zapisu od razu (jak BEGIN
+    IMMEDIATE), więc następne transakcje czekają w kolejce (timeout), zamiast się wywracać.
+    Na innych bazach nic nie robi – tam wystarcza select_for_update().
+    """
+    if transaction.get_connection().vendor == "sqlite":
+        model.objects.filter(pk=pk).update(id=F("id"))
+
+
+def _book_substitution(session_id, lecturer_id):
+    with transaction.atomic():
+        take_write_lock(ClassSession, session_id)
+        # kolejność blokad jak w planner.commit_plan: najpierw zajęcia, potem wykładowca
+        session = (
+            ClassSession.objects.select_for_update(of=("self",))
+            .select_related("subject", "lecturer", "substitution").get(id=session_id)
+        )
+        lecturer = (Lecturer.objects.select_for_update()
+                    .only(*EligibilityEngine.LECTURER_FIELDS).get(id=lecturer_id))
+        # ocena dopiero pod blokadą – widzi zatwierdzone wcześniej rezerwacje tej osoby
+        result = EligibilityEngine(session).evaluate(lecturer)
+        if result["ok"]:
+            try:
+                with transaction.atomic():
+                    Substitution.objects.update_or_create(session=session, defaults={"substitute_lecturer": lecturer})
+            except IntegrityError as exc:
+                # PostgreSQL: ograniczenie wykluczające wykryło kolizję, której silnik nie widział
+                if not pgranges.is_exclusion_violation(exc):
+                    raise
+                result.update(is_free=False, ok=False)
+        return result
+
+
+def book_substitution(session_id, lecturer_id, retries=CONFLICT_RETRIES):
+    """
+    Sprawdza i zapisuje zastępstwo w jednej transakcji. Blokowane są wiersze zajęć i zastępcy
+    (SELECT … FOR UPDATE), więc dwie rezerwacje tej samej osoby idą po kolei i nie przekroczą
+    jej limitów, a rezerwacje różnych osób – równolegle (obciążenia odświeżają sygnały w tej
+    samej transakcji, a wersję kalendarza stamp_after_commit już po niej, bez blokady wspólnego
+    licznika DataVersion na czas rezerwacji). Zwraca wynik EligibilityEngine.evaluate(); przy ok=False nic nie zapisano.
+    Nieistniejące zajęcia/wykładowca: ClassSession.DoesNotExist / Lecturer.DoesNotExist.
+    """
+    return with_conflict_retries(_book_substitution, session_id, lecturer_id, retries=retries)
@@ -0,0 +1,253 @@
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from django.db import transaction
+
+from .models import (
+    ClassSession, Substitution, Lecturer, Subject, Qualification, RecurringSession,
+    RecurrenceException, LecturerWeekLoad, LecturerDayLoad,
+)
+from .masks import MASKS_VERSION
+from .refdata import REFDATA_VERSION
+from .recurrence import cancel_occurrence, expand
+from .services import (
+    bump_data_version, local_date, mark_series_changed, refresh_loads, stamp_after_commit, touch_sessions,
+)
+
+
+# -------------------- Pomocnicze --------------------
+
+# pola z tytułów wydarzeń kalendarza (views.EVENT_FIELDS)
+TITLE_FIELDS = {Lecturer: ("first_name", "last_name"), Subject: ("name",)}
+
+
+def _session_keys(session_id=None, lecturer_id=None, start=None):
+    """Klucze (wykładowca, dzień), na które wpływają zajęcia: właściciel i ewentualny zastępca."""
+    if session_id is not None and (lecturer_id is None or start is None):
+        row = ClassSession.objects.filter(id=session_id).values_list("lecturer_id", "start").first()
+        if row is None:
+            return set()
+        lecturer_id, start = row
+    day = local_date(start)
+    keys = {(lecturer_id, day)}
+    if session_id is not None:
+        sub = Substitution.objects.filter(session_id=session_id).values_list("substitute_lecturer_id", flat=True).first()
+        keys.add((sub, day))
+    return keys
+
+
+# -------------------- ClassSession --------------------
+
+@receiver(pre_save, sender=ClassSession)
+def _session_pre_save(sender, instance, raw=False, **kwargs):
+    # zapamiętaj poprzedni stan, żeby po zapisie przeliczyć też stary kubełek
+    instance._old_load_keys = _session_keys(session_id=instance.pk) if instance.pk and not raw else set()
+
+
+@receiver(post_save, sender=ClassSession)
+def _session_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    keys = getattr(instance, "_old_load_keys", set())
+    keys |= _session_keys(instance.pk, instance.lecturer_id, instance.start)
+    refresh_loads(keys)
+
+
+@receiver(post_delete, sender=ClassSession)
+def _session_post_delete(sender, instance, **kwargs):
+    # zastępstwo znika kaskadowo wcześniej – jego kubełek przelicza handler Substitution
+    refresh_loads({(instance.lecturer_id, local_date(instance.start))})
+
+
+# -------------------- Substitution --------------------
+
+def _substitution_keys(substitution):
+    row = ClassSession.objects.filter(id=substitution.session_id).values_list("lecturer_id", "start").first()
+    if row is None:
+        return set()
+    owner_id, start = row
+    day = local_date(start)
+    return {(owner_id, day), (substitution.substitute_lecturer_id, day)}
+
+
+@receiver(pre_save, sender=Substitution)
+def _substitution_pre_save(sender, instance, raw=False, **kwargs):
+    old = Substitution.objects.filter(pk=instance.pk).first() if instance.pk and not raw else None
+    instance._old_load_keys = _substitution_keys(old) if old else set()
+    instance._old_session_id = old.session_id if old else None
+
+
+@receiver(post_save, sender=Substitution)
+def _substitution_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    refresh_loads(getattr(instance, "_old_load_keys", set()) | _substitution_keys(instance))
+
+
+@receiver(post_delete, sender=Substitution)
+def _substitution_post_delete(sender, instance, **kwargs):
+    # przy kaskadzie zastępstwa są usuwane przed zajęciami, więc wiersz zajęć jeszcze istnieje
+    refresh_loads(_substitution_keys(instance))
+
+
+# -------------------- Cykle zajęć --------------------
+
+def _series_terms(series):
+    """(wykładowca, dzień, długość) każdego terminu cyklu – tylko to wpływa na obciążenia."""
+    return {(series.lecturer_id, local_date(start), end - start) for start, end in expand(series)}
+
+
+def _day_keys(terms):
+    return {(lecturer_id, day) for lecturer_id, day, _ in terms}
+
+
+@receiver(pre_save, sender=RecurringSession)
+def _series_pre_save(sender, instance, raw=False, **kwargs):
+    old = RecurringSession.objects.filter(pk=instance.pk).first() if instance.pk and not raw else None
+    instance._old_terms = _series_terms(old) if old else set()
+
+
+@receiver(post_save, sender=RecurringSession)
+def _series_post_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # tylko dni, w których termin zniknął, doszedł albo zmienił długość/prowadzącego –
+    # np. przedłużenie `until` przelicza same nowe dni, zmiana przedmiotu żadnego
+    changed = getattr(instance, "_old_terms", set()) ^ _series_terms(instance)
+    refresh_loads(_day_keys(changed))
+    mark_series_changed()
+
+
+@receiver(post_delete, sender=RecurringSession)
+def _series_post_delete(sender, instance, **kwargs):
+    refresh_loads(_day_keys(_series_terms(instance)))
+    mark_series_changed()
+
+
+@receiver(post_save, sender=RecurrenceException)
+@receiver(post_delete, sender=RecurrenceException)
+def _series_exception_changed(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    lecturer_id = RecurringSession.objects.filter(id=instance.series_id).values_list("lecturer_id", flat=True).first()
+    if lecturer_id is not None:
+        refresh_loads({(lecturer_id, local_date(instance.original_start))})
+    mark_series_changed()
+
+
+@receiver(post_delete, sender=ClassSession)
+def _occurrence_deleted(sender, instance, **kwargs):
+    # usunięcie zmaterializowanego terminu = odwołanie go (inaczej wróciłby jako wirtualny);
+    # po zatwierdzeniu, bo cykl może być usuwany w tej samej operacji
+    if instance.series_id and instance.occurrence_start:
+        series_id, start = instance.series_id, instance.occurrence_start
+        transaction.on_commit(lambda: cancel_occurrence(series_id, start))
+
+
+# -------------------- Wersja danych kalendarza / śledzenie zmian --------------------
+
+@receiver(post_save, sender=ClassSession)
+def _session_stamp(sender, instance, raw=False, **kwargs):
+    # każda zmiana dostaje kolejny numer wersji (ETag api/events + api/events/changes) – po zatwierdzeniu
+    if not raw:
+        stamp_after_commit(sessions=[instance.pk])
+
+
+@receiver(post_delete, sender=ClassSession)
+def _session_tombstone(sender, instance, **kwargs):
+    stamp_after_commit(removed=[instance.pk])
+
+
+@receiver(post_save, sender=Substitution)
+def _substitution_stamp(sender, instance, raw=False, **kwargs):
+    # wydarzenie w kalendarzu to zajęcia – zmiana zastępstwa zmienia ich opis
+    if not raw:
+        ids = {instance.session_id, getattr(instance, "_old_session_id", None)} - {None}
+        stamp_after_commit(sessions=ids, substitutions=[instance.pk])
+
+
+@receiver(post_delete, sender=Substitution)
+def _substitution_deleted_stamp(sender, instance, **kwargs):
+    stamp_after_commit(sessions=[instance.session_id])
+
+
+@receiver(pre_delete, sender=Lecturer)
+def _lecturer_pre_delete(sender, instance, **kwargs):
+    # zastępstwa tego wykładowcy zostaną wyzerowane (SET_NULL, bez sygnałów) – zapamiętaj zajęcia
+    instance._substituted_session_ids = list(
+        Substitution.objects.filter(substitute_lecturer=instance).values_list("session_id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Lecturer)
+def _lecturer_post_delete(sender, instance, **kwargs):
+    # kaskada usuwa zajęcia po tabelach obciążeń, a ich sygnały zdążyły dopisać wiersze tej osoby
+    LecturerWeekLoad.objects.filter(lecturer_id=instance.pk).delete()
+    LecturerDayLoad.objects.filter(lecturer_id=instance.pk).delete()
+    touch_sessions(ClassSession.objects.filter(id__in=getattr(instance, "_substituted_session_ids", [])))
+
+
+@receiver(pre_save, sender=Lecturer)
+@receiver(pre_save, sender=Subject)
+def _remember_title_fields(sender, instance, raw=False, **kwargs):
+    # pola widoczne w tytułach wydarzeń – zajęcia oznaczamy tylko wtedy, gdy się zmieniły
+    fields = TITLE_FIELDS[sender]
+    old = sender.objects.filter(pk=instance.pk).values_list(*fields).first() if instance.pk and not raw else None
+    instance._old_title = old
+
+
+def _title_changed(sender, instance):
+    old = getattr(instance, "_old_title", None)
+    return old is not None and old != tuple(getattr(instance, f) for f in TITLE_FIELDS[sender])
+
+
+@receiver(post_save, sender=Lecturer)
+def _lecturer_touch_sessions(sender, instance, created=False, raw=False, **kwargs):
+    # nazwisko jest w tytułach wydarzeń; zmiana samych limitów nie rusza historii zajęć
+    if not raw and not created and _title_changed(sender, instance):
+        touch_sessions(ClassSession.objects.filter(
+            Q(lecturer=instance) | Q(substitution__substitute_lecturer=instance)
+        ))
+
+
+@receiver(post_save, sender=Subject)
+def _subject_touch_sessions(sender, instance, created=False, raw=False, **kwargs):
+    if not raw and not created and _title_changed(sender, instance):
+        touch_sessions(ClassSession.objects.filter(subject=instance))
+
+
+# -------------------- Dane słownikowe i bitmaski uprawnień --------------------
+
+@receiver(m2m_changed, sender=Lecturer.qualifications.through)
+@receiver(m2m_changed, sender=Lecturer.subjects.through)
+def _masks_lecturer_m2m_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_data_version(MASKS_VERSION)
+
+
+@receiver(m2m_changed, sender=Subject.required_qualifications.through)
+def _masks_subject_m2m_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump_data_version(MASKS_VERSION)
+
+
+@receiver(post_save, sender=Subject)
+def _subject_saved(sender, instance, raw=False, **kwargs):
+    # kod i nazwa przedmiotu są też w etykietach masek
+    if not raw:
+        bump_data_version(MASKS_VERSION)
+        bump_data_version(REFDATA_VERSION)
+
+
+@receiver(post_delete, sender=Lecturer)
+@receiver(post_delete, sender=Qualification)
+def _masks_owner_deleted(sender, instance, **kwargs):
+    # kaskada czyści tabele pośrednie bez m2m_changed
+    bump_data_version(MASKS_VERSION)
+
+
+@receiver(post_delete, sender=Subject)
+def _subject_deleted(sender, instance, **kwargs):
+    bump_data_version(MASKS_VERSION)
+    bump_data_version(REFDATA_VERSION)
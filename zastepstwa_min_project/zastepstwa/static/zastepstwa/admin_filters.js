@@ -0,0 +1,17 @@
+'use strict';
+// AutocompleteFilter (zastepstwa/adminlist.py): wybór w polu select2 = przejście do listy z filtrem
+{
+    const $ = django.jQuery;
+
+    $(document).on('change', 'select.zastepstwa-autocomplete-filter', function() {
+        const params = new URLSearchParams(window.location.search);
+        // numer strony, kursor i znacznik błędu dotyczą poprzedniego filtra
+        ['p', 'after', 'e'].forEach((name) => params.delete(name));
+        if (this.value) {
+            params.set(this.dataset.param, this.value);
+        } else {
+            params.delete(this.dataset.param);
+        }
+        window.location.search = params.toString();
+    });
+}
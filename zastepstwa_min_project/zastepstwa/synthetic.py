@@ -0,0 +1,196 @@
+"""
+Generator syntetycznych danych do pomiarów wydajności (seed_synthetic, run_benchmarks,
+bench_query_plans).
+
+Rozkłady są zbliżone do prawdziwej uczelni: kilka kwalifikacji na osobę, przedmioty wymagające
+1–2 kwalifikacji, nierówne obciążenie (kilku wykładowców prowadzi dużo, większość średnio),
+zajęcia tylko w dni robocze w stałych blokach i bez kolizji u jednego wykładowcy. Nieobecność
+dotyczy całego dnia – wszystkie zajęcia nieobecnego mają `needs_substitution`, a część z nich
+ma już zastępcę wybranego spośród wolnych osób uczących tego przedmiotu.
+
+Ten sam `seed` daje te same dane (poza id), więc wyniki pomiarów da się porównywać między commitami.
+Wszystkie rekordy mają prefiks SYN / domenę SYNTHETIC_DOMAIN – `clear()` usuwa tylko je.
+"""
+import random
+from collections import defaultdict
+from itertools import islice
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ClassSession, Lecturer, Qualification, SessionTombstone, Subject, Substitution
+from .masks import MASKS_VERSION
+from .refdata import REFDATA_VERSION
+from .services import bump_data_version, rebuild_loads, touch_sessions
+
+SYNTHETIC_DOMAIN = "synthetic.example"
+
+SLOTS = [(time(8, 0), time(9, 30)), (time(9, 45), time(11, 15)), (time(11, 30), time(13, 0)),
+         (time(13, 30), time(15, 0)), (time(15, 15), time(16, 45)), (time(17, 0), time(18, 30))]
+
+FIRST_NAMES = ["Anna", "Piotr", "Katarzyna", "Tomasz", "Magdalena", "Krzysztof", "Agnieszka", "Marcin",
+               "Ewa", "Paweł", "Joanna", "Michał", "Barbara", "Andrzej", "Zofia", "Jakub"]
+LAST_NAMES = ["Nowak", "Kowalski", "Wiśniewski", "Wójcik", "Kamiński", "Lewandowski", "Zieliński",
+              "Szymański", "Woźniak", "Dąbrowski", "Kozłowski", "Jankowski", "Mazur", "Krawczyk"]
+
+
+def _zipf_weights(n, s=1.1):
+    # kilka „popularnych” elementów i długi ogon
+    return [1.0 / (i + 1) ** s for i in range(n)]
+
+
+def clear(batch=5000):
+    """
+    Usuwa dane syntetyczne i zwraca liczbę usuniętych zajęć. Zajęcia i zastępstwa kasujemy
+    masowo, bez sygnałów per wiersz (jak przy generowaniu) – nagrobki dla synchronizacji
+    kalendarza zapisujemy jedną wersją, obciążenia odbudowujemy na końcu.
+    """
+    lecturers = Lecturer.objects.filter(email__endswith="@" + SYNTHETIC_DOMAIN)
+    sessions = ClassSession.objects.filter(Q(lecturer__in=lecturers) | Q(subject__code__startswith="SYN-"))
+    with transaction.atomic():
+        version = bump_data_version()
+        ids = sessions.values_list("id", flat=True).iterator(chunk_size=batch)
+        while chunk := list(islice(ids, batch)):
+            SessionTombstone.objects.bulk_create([SessionTombstone(session_id=i, version=version) for i in chunk])
+        for qs in (Substitution.objects.filter(session__in=sessions), sessions):
+            deleted = qs._raw_delete(qs.db)
+        lecturers.delete()
+        Subject.objects.filter(code__startswith="SYN-").delete()
+        Qualification.objects.filter(code__startswith="SYN-").delete()
+    rebuild_loads()
+    return deleted
+
+
+def generate(lecturers=200, sessions=20000, subjects=None, qualifications=None, weeks=None,
+             absence_rate=0.03, cover_rate=0.7, seed=42, batch=5000, progress=None):
+    """
+    Tworzy dane syntetyczne i odbudowuje tabele obciążeń. Zajęcia leżą w `weeks` tygodniach
+    wokół bieżącego (połowa w przeszłości – statystyki, połowa w przyszłości – kalendarz/planer).
+    Zwraca słownik z liczbą utworzonych rekordów.
+    """
+    rnd = random.Random(seed)
+    subjects = subjects or max(10, lecturers // 2)
+    qualifications = qualifications or max(5, lecturers // 10)
+    # średnio ~10 zajęć tygodniowo na osobę, ale nie mniej niż semestr
+    weeks = weeks or max(15, -(-sessions // (lecturers * 10)))
+    say = progress or (lambda msg: None)
+
+    with transaction.atomic():
+        quals = Qualification.objects.bulk_create(
+            [Qualification(code=f"SYN-Q{i:04d}", name=f"Kwalifikacja {i}") for i in range(qualifications)],
+            batch_size=batch,
+        )
+        subs = Subject.objects.bulk_create(
+            [Subject(code=f"SYN-S{i:05d}", name=f"Przedmiot {i}") for i in range(subjects)],
+            batch_size=batch,
+        )
+        qual_weights = _zipf_weights(len(quals))
+        required = {s.id: set(rnd.choices(quals, qual_weights, k=rnd.randint(1, 2))) for s in subs}
+        Subject.required_qualifications.through.objects.bulk_create([
+            Subject.required_qualifications.through(subject_id=sid, qualification_id=q.id)
+            for sid, qs in required.items() for q in qs
+        ], batch_size=batch)
+
+        people = Lecturer.objects.bulk_create([
+            Lecturer(
+                first_name=rnd.choice(FIRST_NAMES), last_name=f"{rnd.choice(LAST_NAMES)}-{i}",
+                email=f"syn{i}@{SYNTHETIC_DOMAIN}",
+                max_substitutions_per_week=rnd.choice([2, 3, 3, 4, 5]),
+                max_hours_per_week=rnd.choice([12.0, 16.0, 20.0, 20.0, 24.0, 30.0]),
+            ) for i in range(lecturers)
+        ], batch_size=batch)
+
+        # kwalifikacje osób, przedmioty: głównie te, do których mają kwalifikacje
+        has_quals, teaches = {}, defaultdict(list)
+        subj_weights = _zipf_weights(len(subs))
+        for l in people:
+            has_quals[l.id] = set(rnd.choices(quals, qual_weights, k=rnd.randint(1, 3)))
+            matching = [s for s in subs if required[s.id] <= has_quals[l.id]]
+            picked = set(rnd.sample(matching, min(len(matching), rnd.randint(1, 4))))
+            picked |= set(rnd.choices(subs, subj_weights, k=rnd.randint(1, 2)))
+            teaches[l.id] = sorted(picked, key=lambda s: s.id)
+        Lecturer.qualifications.through.objects.bulk_create([
+            Lecturer.qualifications.through(lecturer_id=lid, qualification_id=q.id)
+            for lid, qs in has_quals.items() for q in qs
+        ], batch_size=batch)
+        Lecturer.subjects.through.objects.bulk_create([
+            Lecturer.subjects.through(lecturer_id=lid, subject_id=s.id)
+            for lid, ss in teaches.items() for s in ss
+        ], batch_size=batch)
+    say(f"  {len(people)} wykładowców, {len(subs)} przedmiotów, {len(quals)} kwalifikacji")
+
+    # obciążenie: rozkład log-normalny (kilka osób z dużą liczbą godzin)
+    load_weights = [rnd.lognormvariate(0, 0.6) for _ in people]
+    today = timezone.localtime().date()
+    first_day = today - timedelta(days=today.weekday() + 7 * (weeks // 2))
+    workdays = [first_day + timedelta(days=d) for d in range(weeks * 7) if d % 7 < 5]
+    capacity = len(workdays) * len(SLOTS)
+    tz = timezone.get_current_timezone()
+
+    if sessions > capacity * len(people):
+        raise ValueError(f"{sessions} zajęć nie zmieści się w {weeks} tygodniach bez kolizji")
+
+    taken = set()                     # (lecturer_id, dzień, blok) – bez kolizji u jednej osoby
+    per_lecturer = defaultdict(int)
+    absences = {}                     # (lecturer_id, dzień) -> nieobecny cały dzień?
+    teachers_of = defaultdict(list)
+    for lid, ss in teaches.items():
+        for s in ss:
+            teachers_of[s.id].append(lid)
+
+    def absent(lid, day):
+        key = (lid, day)
+        if key not in absences:
+            absences[key] = rnd.random() < absence_rate
+        return absences[key]
+
+    made = uncovered = covered = 0
+    while made < sessions:
+        chunk, plan = [], []
+        while len(chunk) < min(batch, sessions - made):
+            l = rnd.choices(people, load_weights)[0]
+            if per_lecturer[l.id] >= capacity:
+                continue
+            day, slot = rnd.choice(workdays), rnd.randrange(len(SLOTS))
+            if (l.id, day, slot) in taken:
+                continue
+            taken.add((l.id, day, slot))
+            per_lecturer[l.id] += 1
+            a, b = SLOTS[slot]
+            chunk.append(ClassSession(
+                subject=rnd.choice(teaches[l.id]), lecturer=l,
+                start=timezone.make_aware(datetime.combine(day, a), tz),
+                end=timezone.make_aware(datetime.combine(day, b), tz),
+                needs_substitution=absent(l.id, day),
+            ))
+            plan.append((day, slot))
+        with transaction.atomic():
+            created = ClassSession.objects.bulk_create(chunk)
+            covers = []
+            for s, (day, slot) in zip(created, plan):
+                if not s.needs_substitution:
+                    continue
+                free = [lid for lid in teachers_of[s.subject_id]
+                        if lid != s.lecturer_id and (lid, day, slot) not in taken and not absent(lid, day)]
+                if free and rnd.random() < cover_rate:
+                    lid = rnd.choice(free)
+                    taken.add((lid, day, slot))
+                    covers.append(Substitution(session=s, substitute_lecturer_id=lid))
+                else:
+                    uncovered += 1
+            Substitution.objects.bulk_create(covers, batch_size=batch)
+        made += len(chunk)
+        covered += len(covers)
+        say(f"  {made}/{sessions} zajęć")
+
+    # bulk_create nie wysyła sygnałów – obciążenia odbudowujemy, wersje kalendarza i słowników podbijamy raz
+    rebuild_loads()
+    touch_sessions(ClassSession.objects.filter(version=0))
+    bump_data_version(MASKS_VERSION)
+    bump_data_version(REFDATA_VERSION)
+    return {
+        "lecturers": len(people), "subjects": len(subs), "qualifications": len(quals),
+        "sessions": made, "substitutions": covered, "uncovered": uncovered, "weeks": weeks,
+    }
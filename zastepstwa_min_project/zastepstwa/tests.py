@@ -0,0 +1,135 @@
+import threading
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    ClassSession, Lecturer, LecturerUnavailability, LecturerWeekLoad, RecurringSession, Subject, Substitution,
+)
+from .services import book_substitution, week_bounds, week_start_of
+
+
+# -------------------- Rezerwacje równoległe --------------------
+
+class ConcurrentBookingTests(TransactionTestCase):
+    """
+    Wiele wątków naraz rezerwuje tego samego zastępcę (każdy wątek na własnym połączeniu):
+    blokady w book_substitution muszą utrzymać limit tygodniowy i wykluczyć kolizje terminów.
+    """
+    THREADS = 8
+
+    def setUp(self):
+        self.subject = Subject.objects.create(code="MAT", name="Matematyka")
+        self.owner = Lecturer.objects.create(first_name="Anna", last_name="Nowak")
+        self.substitute = Lecturer.objects.create(first_name="Jan", last_name="Kowalski",
+                                                  max_substitutions_per_week=2, max_hours_per_week=100)
+        self.substitute.subjects.add(self.subject)
+        self.week_start, _ = week_bounds(timezone.now() + timedelta(days=7))
+
+    def _sessions(self, starts):
+        return [ClassSession.objects.create(subject=self.subject, lecturer=self.owner,
+                                            start=start, end=start + timedelta(minutes=90)).id
+                for start in starts]
+
+    def _book_all(self, session_ids):
+        barrier = threading.Barrier(len(session_ids))
+        results, errors = [], []
+
+        def worker(session_id):
+            try:
+                barrier.wait()
+                results.append(book_substitution(session_id, self.substitute.id)["ok"])
+            except Exception as exc:  # błąd wątku ma oblać test, a nie zniknąć
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(sid,)) for sid in session_ids]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def test_weekly_limit_holds(self):
+        # rozłączne terminy w jednym tygodniu – zatrzymać może tylko limit zastępstw
+        sessions = self._sessions([self.week_start + timedelta(days=i % 5, hours=8 + 2 * (i // 5))
+                                   for i in range(self.THREADS)])
+        results = self._book_all(sessions)
+
+        self.assertEqual(results.count(True), 2)
+        self.assertEqual(Substitution.objects.filter(substitute_lecturer=self.substitute).count(), 2)
+        load = LecturerWeekLoad.objects.get(lecturer=self.substitute, week_start=week_start_of(self.week_start))
+        self.assertEqual(load.subs_count, 2)
+        self.assertEqual(load.taken_hours, 3.0)
+
+    def test_no_double_booking(self):
+        # wszystkie zajęcia w tym samym czasie – zastępca może przejąć tylko jedne
+        self.substitute.max_substitutions_per_week = 0  # bez limitu
+        self.substitute.save()
+        start = self.week_start + timedelta(days=1, hours=10)
+        sessions = self._sessions([start] * self.THREADS)
+        results = self._book_all(sessions)
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(Substitution.objects.filter(substitute_lecturer=self.substitute).count(), 1)
+
+
+# -------------------- Admin: liczba zapytań list --------------------
+
+class AdminChangelistQueryTests(TestCase):
+    """
+    Listy w adminie mają stałą liczbę zapytań: kolumny z __str__ powiązanych modeli idą przez
+    list_select_related, filtry nie wczytują wszystkich wykładowców, stronicowanie (adminlist)
+    nie liczy COUNT(*) całej tabeli. Dane mają po kilka wierszy na model, więc N+1 podniósłby liczby.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser("admin", "admin@example.com", "haslo")
+        subjects = [Subject.objects.create(code=f"P{i}", name=f"Przedmiot {i}") for i in range(3)]
+        lecturers = [Lecturer.objects.create(first_name=f"Imię{i}", last_name=f"Nazwisko{i}") for i in range(4)]
+        start = timezone.now().replace(microsecond=0) + timedelta(days=1)
+        for i in range(6):
+            subject, owner, substitute = subjects[i % 3], lecturers[i % 2], lecturers[2 + i % 2]
+            begin = start + timedelta(days=20 * i)  # kilka miesięcy: date_hierarchy z MIN/MAX
+            session = ClassSession.objects.create(subject=subject, lecturer=owner,
+                                                  start=begin, end=begin + timedelta(minutes=90))
+            Substitution.objects.create(session=session, substitute_lecturer=substitute)
+            LecturerUnavailability.objects.create(lecturer=owner, start=begin + timedelta(days=30),
+                                                  end=begin + timedelta(days=30, hours=2), reason="urlop")
+            RecurringSession.objects.create(subject=subject, lecturer=owner, start=begin + timedelta(days=60),
+                                            end=begin + timedelta(days=60, minutes=90),
+                                            until=(begin + timedelta(days=120)).date())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def _assert_changelist(self, model, queries):
+        url = reverse(f"admin:zastepstwa_{model}_changelist")
+        with self.assertNumQueries(queries):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_subject(self):
+        self._assert_changelist("subject", 5)
+
+    def test_lecturer(self):
+        self._assert_changelist("lecturer", 5)
+
+    def test_classsession(self):
+        self._assert_changelist("classsession", 5)
+
+    def test_substitution(self):
+        self._assert_changelist("substitution", 4)
+
+    def test_lecturerunavailability(self):
+        self._assert_changelist("lecturerunavailability", 4)
+
+    def test_recurringsession(self):
+        self._assert_changelist("recurringsession", 4)
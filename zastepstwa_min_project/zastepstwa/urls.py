@@ -1,10 +1,19 @@
 # zastepstwa/urls.py
+from django.conf import settings
 from django.urls import path
 from django.views.generic import RedirectView
 from . import views
 
 app_name = "zastepstwa"
 
+
+def _api(name):
+    # ZASTEPSTWA_ASYNC_API = True: endpointy JSON w wersji async (serwer ASGI, np. uvicorn)
+    if getattr(settings, "ZASTEPSTWA_ASYNC_API", False):
+        return getattr(views, f"{name}_async")
+    return getattr(views, name)
+
+
 urlpatterns = [
     # Kalendarz jako strona główna
     path("", views.calendar_view, name="calendar"),
@@ -14,9 +23,16 @@ urlpatterns = [
     path("sessions/new/", views.session_create, name="session_create"),
 
     # API do kalendarza i zastępstw
-    path("api/events", views.api_events, name="api_events"),
-    path("api/substitutions/preview", views.api_substitution_preview, name="api_substitution_preview"),
-    path("api/substitutions", views.api_substitutions, name="api_substitutions"),
+    path("api/events", _api("api_events"), name="api_events"),
+    path("api/events/changes", views.api_event_changes, name="api_event_changes"),
+    path("api/events/stream", views.api_events_stream, name="api_events_stream"),
+    path("api/substitutions/preview", _api("api_substitution_preview"), name="api_substitution_preview"),
+    path("api/substitutions/candidates", _api("api_substitution_candidates"), name="api_substitution_candidates"),
+    path("api/substitutions", _api("api_substitutions"), name="api_substitutions"),
+    path("api/substitutions/plan", views.api_plan_propose, name="api_plan_propose"),
+    path("api/substitutions/plan/commit", views.api_plan_commit, name="api_plan_commit"),
+    path("api/absences", views.api_absence, name="api_absence"),
+    path("api/lecturers/search", views.api_lecturer_search, name="api_lecturer_search"),
 
     # Formularz zastępstwa
     path("substitutions/new", views.substitution_form, name="substitution_new"),
@@ -34,4 +50,8 @@ urlpatterns = [
     path("lecturers/<int:lecturer_id>/delete/", views.lecturer_delete, name="lecturer_delete"),
 
     path("stats/", views.stats_view, name="stats"),
+
+    # Metryki (ZASTEPSTWA_METRICS)
+    path("metrics", views.metrics_view, name="metrics"),
+    path("metrics/summary/", views.metrics_summary, name="metrics_summary"),
 ]
@@ -1,26 +1,51 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import date, datetime, timedelta
+from itertools import chain
+from urllib.parse import urlencode
 
+from asgiref.sync import sync_to_async
 from django import forms
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import IntegrityError, transaction
 from django.db.models import Q 
-from django.db.models import (
-    Sum, Count, F, DurationField, ExpressionWrapper,
-    Min, Max,   # ← DODANE
-)
 
-from django.http import JsonResponse, HttpResponseBadRequest
+from django.core.exceptions import BadRequest
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from django.urls import reverse
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.decorators.http import condition
 from django.utils.dateparse import parse_datetime
 
-from .models import Lecturer, Subject, ClassSession, Substitution
+from . import pgranges
+from .broadcast import get_broadcaster
+from .intervals import IntervalIndex
+from .listing import CURSOR_VAR, InvalidCursor, keyset_page, prefix_q
+from .masks import get_masks
+from .metrics import metrics_enabled, registry
+from .planner import PlanConflict, commit_plan, plan_absence, propose_plan
+from .recurrence import (
+    OccurrenceConflict, expand, find_occurrence, materialize, occurrence_key, parse_occurrence_key, virtual_occurrences,
+)
+from .refdata import get_refdata
+from .models import Lecturer, Subject, ClassSession, Substitution, DataVersion, RecurringSession
+from .services import (
+    EVENTS_VERSION, EligibilityEngine, alist, book_substitution, changes_since, current_substitute_id, data_version,
+    load_date_range, period_loads,
+)
 import json
 
 
 
 # -------------------- Formularze --------------------
 
+OVERLAP_ERROR = "Prowadzący ma już w tym czasie inne zajęcia albo nieobecność."
+
 class SubjectForm(forms.ModelForm):
     class Meta:
         model = Subject
@@ -39,8 +64,55 @@ class LecturerForm(forms.ModelForm):
             "subjects": forms.CheckboxSelectMultiple,
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # etykiety checkboxów z cache słowników – bez zapytania o wszystkie przedmioty
+        self.fields["subjects"].choices = [(s.id, str(s)) for s in get_refdata().subjects]
+
 
 class SessionForm(forms.ModelForm):
+    repeat = forms.ChoiceField(
+        choices=[("", "Nie powtarzaj")] + RecurringSession.FREQ_CHOICES, required=False, label="Powtarzaj",
+    )
+    interval = forms.IntegerField(min_value=1, max_value=52, initial=1, required=False, label="Co ile")
+    until = forms.DateField(required=False, label="Do dnia", widget=forms.DateInput(attrs={"type": "date"}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # lista przedmiotów z cache słowników – bez zapytania o wszystkie przedmioty
+        subject = self.fields["subject"]
+        subject.choices = [("", subject.empty_label)] + [(s.id, str(s)) for s in get_refdata().subjects]
+
+    def clean(self):
+        cleaned = super().clean()
+        start, end = cleaned.get("start"), cleaned.get("end")
+        if start and end and end <= start:
+            self.add_error("end", "Koniec zajęć musi być po początku.")
+        if cleaned.get("repeat"):
+            if not cleaned.get("until"):
+                self.add_error("until", "Podaj datę końca cyklu.")
+            elif start and cleaned["until"] < timezone.localtime(start).date():
+                self.add_error("until", "Koniec cyklu przed pierwszymi zajęciami.")
+        if cleaned.get("lecturer") and not self.errors and self._overlaps(cleaned):
+            self.add_error(None, OVERLAP_ERROR)
+        return cleaned
+
+    def _overlaps(self, cleaned):
+        """Czy któryś termin (pojedynczy albo każdy z cyklu) nachodzi na zajęcia/nieobecność prowadzącego."""
+        terms = [(cleaned["start"], cleaned["end"])]
+        if cleaned.get("repeat"):
+            terms = list(expand(RecurringSession(
+                start=cleaned["start"], end=cleaned["end"], freq=cleaned["repeat"],
+                interval=cleaned.get("interval") or 1, until=cleaned["until"],
+            )))
+        if not terms:
+            return False
+        lecturer_id = cleaned["lecturer"].id
+        exclude = (self.instance.pk,) if self.instance.pk else ()
+        # jedno zapytanie na całe okno, potem wyszukiwanie binarne dla każdego terminu
+        busy = IntervalIndex.load(terms[0][0], terms[-1][1], [lecturer_id], exclude)
+        return any(busy.overlaps(lecturer_id, s, e) for s, e in terms)
+
     class Meta:
         model = ClassSession
         fields = ["subject", "lecturer", "start", "end", "needs_substitution"]
@@ -50,36 +122,18 @@ class SessionForm(forms.ModelForm):
         }
 
 
-# -------------------- Pomocnicze --------------------
-
-def _hours_between(a: datetime, b: datetime) -> float:
-    return (b - a).total_seconds() / 3600.0
-
-
-def _week_bounds(dt: datetime):
-    """Poniedziałek 00:00 -> poniedziałek +7 dni (w lokalnej strefie TZ)."""
-    local = timezone.localtime(dt)
-    week_start_date = local.date() - timedelta(days=local.weekday())
-    week_start = datetime.combine(week_start_date, datetime.min.time(), tzinfo=local.tzinfo)
-    week_end = week_start + timedelta(days=7)
-    return week_start, week_end
-
-
-def _overlaps(a_start, a_end, b_start, b_end) -> bool:
-    return not (a_end <= b_start or b_end <= a_start)
-
-
 # -------------------- Widoki główne --------------------
 
 def calendar_view(request):
-    lecturers = Lecturer.objects.order_by("last_name", "first_name")
+    # wykładowców podpowiada api/lecturers/search – na stronę trafia tylko wybrany
     selected_id = request.GET.get("lecturer_id")
     try:
-        selected_id = int(selected_id) if selected_id else None
+        selected = Lecturer.objects.filter(id=int(selected_id)).first() if selected_id else None
     except ValueError:
-        selected_id = None
+        selected = None
 
-    ctx = {"lecturers": lecturers, "selected_id": selected_id}
+    ctx = {"selected_id": selected.id if selected else None,
+           "selected_label": _lecturer_label(selected) if selected else ""}
     return render(request, "zastepstwa/calendar.html", ctx)
 
 
@@ -87,8 +141,25 @@ def session_create(request):
     if request.method == "POST":
         form = SessionForm(request.POST)
         if form.is_valid():
-            form.save()
-            return redirect("zastepstwa:calendar")
+            if form.cleaned_data.get("repeat"):
+                # cały cykl to jeden wiersz – terminy rozwijane przy odczycie
+                RecurringSession.objects.create(
+                    subject=form.cleaned_data["subject"], lecturer=form.cleaned_data["lecturer"],
+                    start=form.cleaned_data["start"], end=form.cleaned_data["end"],
+                    freq=form.cleaned_data["repeat"], interval=form.cleaned_data["interval"] or 1,
+                    until=form.cleaned_data["until"],
+                )
+                return redirect("zastepstwa:calendar")
+            try:
+                with transaction.atomic():
+                    form.save()
+            except IntegrityError as exc:
+                # PostgreSQL: ograniczenie wykluczające złapało kolizję zapisaną po walidacji formularza
+                if not pgranges.is_exclusion_violation(exc):
+                    raise
+                form.add_error(None, OVERLAP_ERROR)
+            else:
+                return redirect("zastepstwa:calendar")
     else:
         form = SessionForm()
     return render(request, "zastepstwa/session_form.html", {"form": form})
@@ -96,65 +167,204 @@ def session_create(request):
 
 # -------------------- API dla kalendarza --------------------
 
-def api_events(request):
-    """
-    Zwraca wydarzenia dla FullCalendar.
-    GET: start, end (ISO8601 z TZ), opcjonalnie lecturer_id (filtr)
-    """
-    start_str = request.GET.get("start")
-    end_str = request.GET.get("end")
+EVENT_FIELDS = (
+    "id", "start", "end", "subject__name",
+    "lecturer__first_name", "lecturer__last_name",
+    "substitution__substitute_lecturer_id",
+    "substitution__substitute_lecturer__first_name",
+    "substitution__substitute_lecturer__last_name",
+    "series_id", "occurrence_start",
+)
+STREAM_MIN_DAYS = 35        # dłuższe zakresy (miesiąc+, semestr) streamujemy
+STREAM_CHUNK = 2000
+CHANGES_LIMIT = 500         # powyżej – klient odświeża cały widok
+
+
+def _event_from_row(row):
+    title_lines = [
+        f"{row['subject__name']}",
+        f"{row['lecturer__first_name']} {row['lecturer__last_name']}",
+    ]
+    evt = {
+        "id": row["id"],
+        "start": row["start"].isoformat(),
+        "end": row["end"].isoformat(),
+    }
+    if row["substitution__substitute_lecturer_id"]:
+        title_lines.append(
+            f"Zastępstwo: {row['substitution__substitute_lecturer__first_name']} "
+            f"{row['substitution__substitute_lecturer__last_name']}"
+        )
+        evt["color"] = "#10b981"
+    evt["title"] = "\n".join(title_lines)
+    if row.get("series_id") and row.get("occurrence_start"):
+        # zmaterializowany termin cyklu zastępuje w kalendarzu swój odpowiednik wirtualny
+        evt["replaces"] = occurrence_key(row["series_id"], row["occurrence_start"])
+    return evt
+
+
+def _occurrence_row(o):
+    """Termin wirtualny cyklu w kształcie wiersza EVENT_FIELDS."""
+    return {
+        "id": o.key, "start": o.start, "end": o.end, "subject__name": o.series.subject.name,
+        "lecturer__first_name": o.series.lecturer.first_name,
+        "lecturer__last_name": o.series.lecturer.last_name,
+        "substitution__substitute_lecturer_id": None,
+    }
+
+
+def _occurrence_rows(request):
+    start_dt, end_dt = _events_range(request)
     lecturer_id = request.GET.get("lecturer_id")
+    ids = [lecturer_id] if lecturer_id else None
+    return [_occurrence_row(o) for o in virtual_occurrences(start_dt, end_dt, lecturer_ids=ids)]
+
 
+def _events_range(request):
+    start_str = request.GET.get("start")
+    end_str = request.GET.get("end")
     start_dt = parse_datetime(start_str) if start_str else None
     end_dt = parse_datetime(end_str) if end_str else None
+    return start_dt, end_dt
 
-    qs = (
-        ClassSession.objects
-        .select_related("lecturer", "subject", "substitution__substitute_lecturer")
-    )
+
+def _filter_events(qs, request):
+    """Filtry kalendarza: zakres widoku i (opcjonalnie) wykładowca – własne lub przejęte zajęcia."""
+    start_dt, end_dt = _events_range(request)
+    lecturer_id = request.GET.get("lecturer_id")
 
     if start_dt and end_dt:
-        qs = qs.filter(start__lt=end_dt, end__gt=start_dt)
+        if pgranges.range_mode():
+            qs = qs.filter(pgranges.overlaps(ClassSession, start_dt, end_dt))
+        else:
+            qs = qs.filter(start__lt=end_dt, end__gt=start_dt)
 
     if lecturer_id:
         qs = qs.filter(
             Q(lecturer_id=lecturer_id) |
             Q(substitution__substitute_lecturer_id=lecturer_id)
         )
+    return qs
 
-    events = []
-    for sess in qs:
-        sub = getattr(sess, "substitution", None)
-        title_lines = [
-            f"{sess.subject.name}",
-            f"{sess.lecturer.first_name} {sess.lecturer.last_name}",
-        ]
-        color = None
-        if sub and sub.substitute_lecturer_id:
-            sl = sub.substitute_lecturer
-            title_lines.append(f"Zastępstwo: {sl.first_name} {sl.last_name}")
-            color = "#10b981"
-
-        evt = {
-            "id": sess.id,
-            "title": "\n".join(title_lines),
-            "start": sess.start.isoformat(),
-            "end": sess.end.isoformat(),
-        }
-        if color:
-            evt["color"] = color
-        events.append(evt)
 
-    return JsonResponse(events, safe=False)
+def _events_version(request):
+    # jedno zapytanie na żądanie, współdzielone przez ETag i Last-Modified
+    if not hasattr(request, "_events_version"):
+        request._events_version = data_version()
+    return request._events_version
+
+
+def _events_etag(request):
+    return f"events-{_events_version(request)[0]}"
+
+
+def _events_last_modified(request):
+    return _events_version(request)[1]
+
+
+def _stream_json_array(rows):
+    yield "["
+    first = True
+    for row in rows:
+        yield ("" if first else ",") + json.dumps(_event_from_row(row))
+        first = False
+    yield "]"
+
+
+@condition(etag_func=_events_etag, last_modified_func=_events_last_modified)
+def api_events(request):
+    """
+    Zwraca wydarzenia dla FullCalendar (zajęcia + terminy cykli rozwinięte dla zakresu widoku;
+    te ostatnie mają id w postaci "r<cykl>-<timestamp>").
+    GET: start, end (ISO8601 z TZ), opcjonalnie lecturer_id (filtr)
+    ETag/Last-Modified wg licznika wersji danych -> 304, gdy nic się nie zmieniło.
+    """
+    start_dt, end_dt = _events_range(request)
+    rows = _filter_events(ClassSession.objects.order_by("start", "id"), request).values(*EVENT_FIELDS)
+    large = not (start_dt and end_dt) or (end_dt - start_dt) > timedelta(days=STREAM_MIN_DAYS)
+    if large:
+        response = StreamingHttpResponse(
+            _stream_json_array(chain(rows.iterator(chunk_size=STREAM_CHUNK), _occurrence_rows(request))),
+            content_type="application/json",
+        )
+    else:
+        response = JsonResponse([_event_from_row(r) for r in chain(rows, _occurrence_rows(request))], safe=False)
+    # przeglądarka ma zawsze pytać serwer (If-None-Match), ale może użyć kopii przy 304
+    patch_cache_control(response, private=True, no_cache=True)
+    response["X-Data-Version"] = str(_events_version(request)[0])
+    return response
+
+
+def api_event_changes(request):
+    """
+    GET ?since=<wersja>[&start=&end=&lecturer_id=]
+    Zmiany od podanej wersji: {"version", "events": [...], "removed": [id, ...]}
+    albo {"version", "reset": true}, gdy zmian jest tyle, że lepiej pobrać wszystko od nowa.
+    Do "removed" trafiają też zmienione zajęcia, które wypadły z filtra.
+    """
+    try:
+        since = int(request.GET.get("since"))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("bad params")
+
+    # wersję czytamy PRZED zmianami – w najgorszym razie klient dostanie coś dwa razy
+    version = data_version()[0]
+    delta = changes_since(since, limit=CHANGES_LIMIT)
+    if delta is None:
+        return JsonResponse({"version": version, "reset": True})
+
+    changed, removed = delta
+    events = [_event_from_row(r) for r in _filter_events(changed, request).values(*EVENT_FIELDS)]
+    shown = {e["id"] for e in events}
+    removed += [sid for sid in changed.values_list("id", flat=True) if sid not in shown]
+    return JsonResponse({"version": version, "events": events, "removed": removed})
+
+
+SSE_HEARTBEAT = 15  # s – komentarz podtrzymujący połączenie przez proxy
+SSE_MAX_AGE = 300   # s – potem klient łączy się od nowa
+
+
+async def api_events_stream(request):
+    """
+    Server-Sent Events: wypycha numer nowej wersji danych po każdej zmianie.
+    Klient po zdarzeniu "version" dociąga zmiany z api/events/changes.
+    Wymaga serwera ASGI (uvicorn/daphne, serwer/asgi.py) – pod WSGI zwraca 204,
+    a kalendarz zostaje przy odpytywaniu co 30 s.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+
+    broadcaster = get_broadcaster()
+
+    async def stream():
+        queue = broadcaster.subscribe()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + SSE_MAX_AGE
+        try:
+            version = await (DataVersion.objects.filter(key=EVENTS_VERSION)
+                             .values_list("version", flat=True).afirst())
+            yield f"retry: 5000\nid: {version or 0}\nevent: version\ndata: {json.dumps({'version': version or 0})}\n\n"
+            # ograniczony czas życia: zerwane połączenia nie wiszą w nieskończoność,
+            # a EventSource sam łączy się ponownie
+            while loop.time() < deadline:
+                try:
+                    msg = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if msg.get("key") != EVENTS_VERSION:
+                    continue
+                yield f"id: {msg['version']}\nevent: version\ndata: {json.dumps(msg)}\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # nginx: nie buforuj strumienia
+    return response
 
 
 # ----------------- STATYSTYKI -----------------
-from django.db.models import (
-    Sum, Count, F, DurationField, ExpressionWrapper,
-    Min, Max,
-)
-from datetime import datetime, timedelta, date
-import json
 
 def _date_from_str(s: str | None) -> date | None:
     if not s:
@@ -193,15 +403,14 @@ def _period_bounds(request):
         label = f"Zakres {s} – {e}"
 
     elif period == "all":
-        min_start = ClassSession.objects.order_by("start").values_list("start", flat=True).first()
-        max_end   = ClassSession.objects.order_by("-end").values_list("end", flat=True).first()
-        if not min_start or not max_end:
+        bounds = load_date_range()
+        if not bounds:
             start_date = now.date()
             end_date   = start_date + timedelta(days=1)
         else:
-            start_date = timezone.localtime(min_start).date()
-            end_date   = timezone.localtime(max_end).date() + timedelta(days=1)
-        label = f"Cały okres"
+            start_date = bounds[0]
+            end_date   = bounds[1] + timedelta(days=1)
+        label = "Cały okres"
 
     else:  # month
         start_date = now.replace(day=1).date()
@@ -227,67 +436,15 @@ def stats_view(request):
     metric     = request.GET.get("metric") or "hours" # hours | subs
     direction  = request.GET.get("dir") or "desc"
 
-    # słownik z wszystkimi wykładowcami -> start z zerami
-    lecturers = list(Lecturer.objects.order_by("last_name", "first_name")
-                     .values("id", "first_name", "last_name"))
-    data = {
-        l["id"]: {"lecturer_id": l["id"],
-                  "name": f'{l["first_name"]} {l["last_name"]}',
-                  "subs": 0, "hours": 0.0}
-        for l in lecturers
-    }
-
-    dur = ExpressionWrapper(F("end") - F("start"), output_field=DurationField())
+    # jedno zapytanie po dziennych podsumowaniach – wszyscy wykładowcy, także z zerami
+    ranking = []
+    for r in period_loads(start_dt.date(), end_dt.date()):
+        hours = r["taken"] if scope == "subs" else r["own"] + r["taken"]
+        ranking.append({"lecturer_id": r["id"],
+                        "name": f'{r["first_name"]} {r["last_name"]}',
+                        "subs": int(r["subs"]), "hours": round(hours, 2)})
 
-    if scope == "subs":
-        # Tylko zajęcia przejęte w zastępstwie
-        rows = (
-            ClassSession.objects
-            .filter(start__gte=start_dt, start__lt=end_dt,
-                    substitution__substitute_lecturer__isnull=False)
-            .values("substitution__substitute_lecturer_id")
-            .annotate(subs=Count("id"), dur=Sum(dur))
-        )
-        for r in rows:
-            lid = r["substitution__substitute_lecturer_id"]
-            if lid in data:
-                data[lid]["subs"]  = int(r["subs"] or 0)
-                data[lid]["hours"] = round(((r["dur"] or timedelta()).total_seconds() / 3600.0), 2)
-
-    else:  # scope == "all"
-        # Własne nieprzejęte
-        own_rows = (
-            ClassSession.objects
-            .filter(start__gte=start_dt, start__lt=end_dt,
-                    substitution__isnull=True)
-            .values("lecturer_id")
-            .annotate(dur=Sum(dur))
-        )
-        for r in own_rows:
-            lid = r["lecturer_id"]
-            if lid in data:
-                data[lid]["hours"] += (r["dur"] or timedelta()).total_seconds() / 3600.0
-
-        # Godziny i liczba zajęć przejętych jako zastępca
-        taken_rows = (
-            ClassSession.objects
-            .filter(start__gte=start_dt, start__lt=end_dt,
-                    substitution__substitute_lecturer__isnull=False)
-            .values("substitution__substitute_lecturer_id")
-            .annotate(subs=Count("id"), dur=Sum(dur))
-        )
-        for r in taken_rows:
-            lid = r["substitution__substitute_lecturer_id"]
-            if lid in data:
-                data[lid]["subs"]  += int(r["subs"] or 0)
-                data[lid]["hours"] += (r["dur"] or timedelta()).total_seconds() / 3600.0
-
-        # zaokrąglij po zsumowaniu
-        for v in data.values():
-            v["hours"] = round(v["hours"], 2)
-
-    # lista + sortowanie
-    ranking = list(data.values())
+    # sortowanie
     key = "hours" if metric == "hours" else "subs"
     ranking.sort(key=lambda r: r[key], reverse=(direction != "asc"))
 
@@ -313,24 +470,56 @@ def stats_view(request):
 # -------------------- Zastępstwa --------------------
 
 def substitution_form(request):
+    occurrence = request.GET.get("occurrence")
+    if occurrence:
+        return _occurrence_form(request, occurrence)
+
     sid = request.GET.get("session_id")
     session = get_object_or_404(
         ClassSession.objects.select_related("subject", "lecturer"),
         id=sid
     )
-    # kandydaci: wszyscy poza oryginalnym prowadzącym
-    lecturers = Lecturer.objects.exclude(id=session.lecturer_id).order_by("last_name", "first_name")
+    # kandydatów dociąga strona: czołówkę rankingu (api/substitutions/candidates?limit=) i wyszukiwarkę
     return render(
         request,
         "zastepstwa/substitution_new.html",
-        {"session": session, "lecturers": lecturers},
+        {"session": session, "candidates_limit": CANDIDATES_LIMIT},
     )
 
 
+def _occurrence_form(request, key):
+    """
+    Termin cyklu bez własnego wiersza: GET tylko go pokazuje, dopiero POST zapisuje go jako
+    ClassSession (materialize), żeby zastępstwo miało się do czego przypiąć.
+    """
+    parsed = parse_occurrence_key(key)
+    if parsed is None:
+        raise Http404("Nie ma takiego terminu")
+    series_id, start = parsed
+    session_id = (ClassSession.objects.filter(series_id=series_id, occurrence_start=start)
+                  .values_list("id", flat=True).first())
+    error = None
+    if session_id is None and request.method == "POST":
+        try:
+            session = materialize(series_id, start)
+            session_id = session.id if session else None
+        except OccurrenceConflict:
+            error = OVERLAP_ERROR
+    if session_id is not None:
+        return redirect(f"{reverse('zastepstwa:substitution_new')}?session_id={session_id}")
+
+    found = find_occurrence(series_id, start)
+    if found is None:
+        raise Http404("Nie ma takiego terminu")
+    return render(request, "zastepstwa/substitution_new.html", {"occurrence": found, "error": error},
+                  status=409 if error else 200)
+
+
 def api_substitution_preview(request):
     """
     GET ?session_id=&lecturer_id=
-    Zwraca ocenę kandydata (czy prowadzi przedmiot, dostępność, limity).
+    Zwraca ocenę kandydata (czy prowadzi przedmiot, dostępność, limity)
+    + listę przedmiotów, które prowadzi.
     """
     try:
         sid = int(request.GET.get("session_id"))
@@ -344,175 +533,113 @@ def api_substitution_preview(request):
     )
     lecturer = get_object_or_404(Lecturer, id=lid)
 
-    # 1) Czy prowadzi ten przedmiot (uprawnienia przez powiązanie subjects)?
-    can_teach = lecturer.subjects.filter(id=session.subject_id).exists()
-
-    # 2) Dostępność – liczymy realną zajętość
-    def _slots_of(lect: Lecturer):
-        # własne zajęcia BEZ zastępstwa (oddane nie liczą się jako jego obciążenie)
-        qs_normal = ClassSession.objects.filter(
-            lecturer=lect, substitution__isnull=True
-        ).values_list("start", "end")
-        # zajęcia przejęte jako zastępca
-        qs_taken = ClassSession.objects.filter(
-            substitution__substitute_lecturer=lect
-        ).values_list("start", "end")
-        return list(qs_normal) + list(qs_taken)
-
-    is_free = True
-    for a_start, a_end in _slots_of(lecturer):
-        if _overlaps(a_start, a_end, session.start, session.end):
-            is_free = False
-            break
-
-    # 3) Limity tygodniowe – liczymy tylko realne godziny
-    week_start, week_end = _week_bounds(session.start)
-
-    def _week_hours_and_subs(lect: Lecturer):
-        normal = ClassSession.objects.filter(
-            lecturer=lect, start__gte=week_start, start__lt=week_end,
-            substitution__isnull=True
-        )
-        taken = ClassSession.objects.filter(
-            substitution__substitute_lecturer=lect,
-            start__gte=week_start, start__lt=week_end
-        )
-
-        hours = 0.0
-        for s in list(normal) + list(taken):
-            hours += _hours_between(s.start, s.end)
-
-        subs_count = Substitution.objects.filter(
-            substitute_lecturer=lect,
-            session__start__gte=week_start, session__start__lt=week_end
-        ).count()
-        return hours, subs_count
-
-    hours_before, subs_before = _week_hours_and_subs(lecturer)
-    this_hours = _hours_between(session.start, session.end)
-    hours_after = hours_before + this_hours
-    subs_after = subs_before + 1
-
-    subs_limit = lecturer.max_substitutions_per_week or 0
-    hours_limit = lecturer.max_hours_per_week or 0.0
+    # uprawnienia, dostępność i limity – wspólny silnik z zapisem i rankingiem
+    result = EligibilityEngine(session).evaluate(lecturer)
+    return JsonResponse({"empty": False, **result})
 
-    subs_ok = (subs_limit == 0) or (subs_after <= subs_limit)
-    hours_ok = (hours_limit == 0) or (hours_after <= hours_limit)
-    overall_ok = can_teach and is_free and subs_ok and hours_ok
 
-    return JsonResponse({
-        "empty": False,
-        "can_teach": can_teach,
-        "is_free": is_free,
-        "subs_week_after": subs_after,
-        "subs_limit": subs_limit,
-        "subs_ok": subs_ok,
-        "hours_week_after": round(hours_after, 2),
-        "hours_limit": hours_limit,
-        "hours_ok": hours_ok,
-        "ok": overall_ok,
-    })
-
-
-def api_substitution_preview(request):
+def api_substitution_candidates(request):
     """
-    GET ?session_id=&lecturer_id=
-    Zwraca ocenę kandydata (czy prowadzi przedmiot, dostępność, limity)
-    + listę przedmiotów, które prowadzi.
+    GET ?session_id=[&limit=]
+    Zwraca ranking kandydatów na zastępstwo (stała liczba zapytań) – wszystkich albo `limit`
+    najlepszych (obecny zastępca zawsze jest na liście).
     """
     try:
         sid = int(request.GET.get("session_id"))
-        lid = int(request.GET.get("lecturer_id"))
+        limit = _candidates_limit(request)
     except (TypeError, ValueError):
         return HttpResponseBadRequest("bad params")
 
     session = get_object_or_404(
-        ClassSession.objects.select_related("subject", "lecturer"),
+        ClassSession.objects.select_related("subject", "lecturer", "substitution"),
         id=sid
     )
-    lecturer = get_object_or_404(Lecturer, id=lid)
+    current = current_substitute_id(session)
+    return JsonResponse({
+        "session_id": session.id,
+        "current_lecturer_id": current,
+        "candidates": _top_candidates(EligibilityEngine(session).rank(), limit, current),
+    })
 
-    # 1) uprawnienia do TEGO przedmiotu
-    can_teach = lecturer.subjects.filter(id=session.subject_id).exists()
-
-    # 2) dostępność – liczymy realne obciążenie
-    def _slots_of(lect: Lecturer):
-        # własne zajęcia bez zastępstwa
-        qs_normal = ClassSession.objects.filter(
-            lecturer=lect, substitution__isnull=True
-        ).values_list("start", "end")
-        # zajęcia wzięte jako zastępca
-        qs_taken = ClassSession.objects.filter(
-            substitution__substitute_lecturer=lect
-        ).values_list("start", "end")
-        return list(qs_normal) + list(qs_taken)
-
-    is_free = True
-    for a_start, a_end in _slots_of(lecturer):
-        if _overlaps(a_start, a_end, session.start, session.end):
-            is_free = False
-            break
-
-    # 3) limity tygodniowe – tylko realne godziny
-    week_start, week_end = _week_bounds(session.start)
-
-    def _week_hours_and_subs(lect: Lecturer):
-        normal = ClassSession.objects.filter(
-            lecturer=lect, start__gte=week_start, start__lt=week_end,
-            substitution__isnull=True
-        )
-        taken = ClassSession.objects.filter(
-            substitution__substitute_lecturer=lect,
-            start__gte=week_start, start__lt=week_end
-        )
 
-        hours = 0.0
-        for s in list(normal) + list(taken):
-            hours += _hours_between(s.start, s.end)
+def _candidates_limit(request):
+    limit = request.GET.get("limit")
+    return max(1, int(limit)) if limit else None
 
-        subs_count = Substitution.objects.filter(
-            substitute_lecturer=lect,
-            session__start__gte=week_start, session__start__lt=week_end
-        ).count()
-        return hours, subs_count
 
-    hours_before, subs_before = _week_hours_and_subs(lecturer)
-    this_hours = _hours_between(session.start, session.end)
-    hours_after = hours_before + this_hours
-    subs_after = subs_before + 1
+def _top_candidates(ranked, limit, current_id):
+    if limit is None or len(ranked) <= limit:
+        return ranked
+    top = ranked[:limit]
+    if current_id is not None and all(c["lecturer_id"] != current_id for c in top):
+        top += [c for c in ranked[limit:] if c["lecturer_id"] == current_id]
+    return top
 
-    subs_limit = lecturer.max_substitutions_per_week or 0
-    hours_limit = lecturer.max_hours_per_week or 0.0
 
-    subs_ok = (subs_limit == 0) or (subs_after <= subs_limit)
-    hours_ok = (hours_limit == 0) or (hours_after <= hours_limit)
+# -------------------- Wyszukiwarka wykładowców --------------------
 
-    # lista przedmiotów prowadzonych przez kandydata (kod – nazwa)
-    subjects_list = [
-        f"{code} – {name}"
-        for code, name in lecturer.subjects.values_list("code", "name")
-    ]
+CANDIDATES_LIMIT = 20   # formularz zastępstwa: tylu najlepszych kandydatów, resztę znajdzie wyszukiwarka
+SEARCH_LIMIT = 20
+SEARCH_LIMIT_MAX = 50
+LECTURER_ORDERING = ["last_name", "first_name", "id"]  # indeks lecturer_name_idx
+LECTURER_SEARCH_FIELDS = ("first_name", "last_name", "email")
 
-    return JsonResponse({
-        "empty": False,
-        "subjects": subjects_list,    # ← NOWE
-        "can_teach": can_teach,
-        "is_free": is_free,
-        "subs_week_after": subs_after,
-        "subs_limit": subs_limit,
-        "subs_ok": subs_ok,
-        "hours_week_after": round(hours_after, 2),
-        "hours_limit": hours_limit,
-        "hours_ok": hours_ok,
-        "ok": can_teach and is_free and subs_ok and hours_ok,
-    })
+
+def _lecturer_label(lecturer):
+    name = f"{lecturer.first_name} {lecturer.last_name}"
+    return f"{name} ({lecturer.email})" if lecturer.email else name
+
+
+def api_lecturer_search(request):
+    """
+    GET ?q=[&limit=][&exclude=<id>]
+    Podpowiedzi wykładowców (kalendarz, wybór zastępcy): każde słowo `q` to początek imienia,
+    nazwiska albo e-maila; alfabetycznie, najwyżej `limit` (domyślnie 20, maks. 50).
+    """
+    q = request.GET.get("q", "").strip()
+    try:
+        limit = min(max(1, int(request.GET.get("limit") or SEARCH_LIMIT)), SEARCH_LIMIT_MAX)
+        exclude = int(request.GET["exclude"]) if request.GET.get("exclude") else None
+    except ValueError:
+        return HttpResponseBadRequest("bad params")
+
+    qs = Lecturer.objects.filter(prefix_q(q, LECTURER_SEARCH_FIELDS))
+    if exclude is not None:
+        qs = qs.exclude(id=exclude)
+    rows = qs.order_by(*LECTURER_ORDERING).only("id", "first_name", "last_name", "email")[:limit]
+    return JsonResponse({"results": [
+        {"id": l.id, "name": f"{l.first_name} {l.last_name}", "email": l.email, "label": _lecturer_label(l)}
+        for l in rows
+    ]})
 
 
 # -------------------- Listy/CRUD --------------------
 
+LIST_PAGE_SIZE = 50
+SUBJECT_ORDERING = ["code"]  # kod jest unikalny
+SUBJECT_SEARCH_FIELDS = ("code", "name")
+
+
+def _list_page(request, qs, ordering, search_fields):
+    """Strona listy po kluczu (?after=) z wyszukiwaniem po prefiksie (?q=): (wiersze, kontekst linków)."""
+    q = request.GET.get("q", "").strip()
+    cursor = request.GET.get(CURSOR_VAR)
+    try:
+        rows, next_cursor = keyset_page(qs.filter(prefix_q(q, search_fields)), ordering, cursor, LIST_PAGE_SIZE)
+    except InvalidCursor:
+        raise BadRequest("Nieprawidłowy kursor listy")
+    query = {"q": q} if q else {}
+    return rows, {
+        "q": q,
+        "first_url": "?" + urlencode(query) if cursor else None,
+        "next_url": "?" + urlencode({**query, CURSOR_VAR: next_cursor}) if next_cursor else None,
+    }
+
+
 def subjects_list(request):
-    subjects = Subject.objects.order_by("code", "name")
-    return render(request, "zastepstwa/subjects_list.html", {"subjects": subjects})
+    qs = Subject.objects.only("id", "code", "name")
+    subjects, paging = _list_page(request, qs, SUBJECT_ORDERING, SUBJECT_SEARCH_FIELDS)
+    return render(request, "zastepstwa/subjects_list.html", {"subjects": subjects, **paging})
 
 
 def subject_new(request):
@@ -545,8 +672,13 @@ def subject_delete(request, subject_id):
 
 
 def lecturers_list(request):
-    lecturers = Lecturer.objects.prefetch_related("subjects").order_by("last_name", "first_name")
-    return render(request, "zastepstwa/lecturers_list.html", {"lecturers": lecturers})
+    qs = Lecturer.objects.only("id", "first_name", "last_name", "email")
+    lecturers, paging = _list_page(request, qs, LECTURER_ORDERING, LECTURER_SEARCH_FIELDS)
+    # kody przedmiotów z masek uprawnień (cache) – bez zapytania o tabelę pośrednią na stronę
+    masks = get_masks()
+    for l in lecturers:
+        l.subject_codes = masks.subject_codes_of(l.id)
+    return render(request, "zastepstwa/lecturers_list.html", {"lecturers": lecturers, **paging})
 
 
 def lecturer_new(request):
@@ -578,24 +710,6 @@ def lecturer_delete(request, lecturer_id):
     return redirect("zastepstwa:lecturers_list")
 
 
-def _active_slots(lect: Lecturer):
-    """
-    Przedziały czasowe, które dany wykładowca REALNIE prowadzi
-    (własne zajęcia nieprzejęte przez kogoś innego + zajęcia, które sam przejął).
-    """
-    own = ClassSession.objects.filter(
-        lecturer=lect
-    ).filter(
-        Q(substitution__isnull=True) | Q(substitution__substitute_lecturer=lect)
-    ).values_list("start", "end")
-
-    taken = ClassSession.objects.filter(
-        substitution__substitute_lecturer=lect
-    ).values_list("start", "end")
-
-    return list(own) + list(taken)
-
-
 def api_substitutions(request):
     """
     POST JSON:
@@ -621,54 +735,222 @@ def api_substitutions(request):
         Substitution.objects.filter(session=session).delete()
         return JsonResponse({"cleared": True})
 
-    lecturer = get_object_or_404(Lecturer, id=lid)
+    # przedmiot, kolizje i limity tygodniowe sprawdzane pod blokadą, w tej samej transakcji co zapis
+    try:
+        result = book_substitution(session.id, lid)
+    except (ClassSession.DoesNotExist, Lecturer.DoesNotExist):
+        raise Http404("Nie ma takich zajęć lub wykładowcy")
+    if not result["ok"]:
+        return JsonResponse({"ok": False, "reason": EligibilityEngine.reason(result)})
+    return JsonResponse({"ok": True})
 
-    # 1) kandydat musi prowadzić dany przedmiot
-    if not lecturer.subjects.filter(id=session.subject_id).exists():
-        return JsonResponse({"ok": False, "reason": "Ten wykładowca nie prowadzi tego przedmiotu"})
-
-    # 2) brak kolizji z realnie prowadzonymi zajęciami
-    for a_start, a_end in _active_slots(lecturer):
-        if _overlaps(a_start, a_end, session.start, session.end):
-            return JsonResponse({"ok": False, "reason": "Kolizja w kalendarzu"})
-
-    # 3) limity tygodniowe po dodaniu tej pozycji
-    def _week_bounds(dt):
-        local = timezone.localtime(dt)
-        week_start_date = local.date() - timedelta(days=local.weekday())
-        week_start = datetime.combine(week_start_date, datetime.min.time(), tzinfo=local.tzinfo)
-        week_end = week_start + timedelta(days=7)
-        return week_start, week_end
-
-    def _hours_between(a, b):
-        return (b - a).total_seconds() / 3600.0
-
-    week_start, week_end = _week_bounds(session.start)
-
-    hours = 0.0
-    for s_start, s_end in _active_slots(lecturer):
-        # liczymy tylko, jeśli wpada w ten tydzień (wystarczy sprawdzenie nakładania)
-        if not (s_end <= week_start or s_start >= week_end):
-            hours += _hours_between(s_start, s_end)
-    hours += _hours_between(session.start, session.end)
-
-    subs_count = (
-        Substitution.objects.filter(
-            substitute_lecturer=lecturer,
-            session__start__gte=week_start,
-            session__start__lt=week_end,
-        ).count() + 1
-    )
 
-    if lecturer.max_substitutions_per_week and subs_count > lecturer.max_substitutions_per_week:
-        return JsonResponse({"ok": False, "reason": "Przekroczony limit zastępstw w tygodniu"})
 
-    if lecturer.max_hours_per_week and hours > lecturer.max_hours_per_week:
-        return JsonResponse({"ok": False, "reason": "Przekroczony limit godzin w tygodniu"})
+# -------------------- API asynchroniczne (ASGI) --------------------
+# Te same endpointy na async ORM – włączane w urls.py przez ZASTEPSTWA_ASYNC_API = True.
+# Pod ASGI żądanie czekające na bazę nie blokuje pętli zdarzeń. Zapytania czekamy po kolei:
+# async ORM i sync_to_async (thread_sensitive) i tak wykonują je w jednym wątku, jedno po drugim.
+# Zapisy (transakcja + blokady) zostają synchroniczne – w sync_to_async.
+
+async def _aevents_version():
+    row = await DataVersion.objects.filter(key=EVENTS_VERSION).values_list("version", "updated_at").afirst()
+    return row or (0, None)
+
+
+async def api_events_async(request):
+    """Async wersja api_events (ETag/Last-Modified liczone ręcznie – @condition jest tylko sync)."""
+    version, updated_at = await _aevents_version()
+    etag = quote_etag(f"events-{version}")
+    last_modified = int(updated_at.timestamp()) if updated_at else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = await _aevents_response(request)
+        patch_cache_control(response, private=True, no_cache=True)
+        response["X-Data-Version"] = str(version)
+    if request.method in ("GET", "HEAD"):
+        if last_modified and not response.has_header("Last-Modified"):
+            response["Last-Modified"] = http_date(last_modified)
+        response.headers.setdefault("ETag", etag)
+    return response
+
+
+async def _aevents_response(request):
+    start_dt, end_dt = _events_range(request)
+    rows = _filter_events(ClassSession.objects.order_by("start", "id"), request).values(*EVENT_FIELDS)
+    large = not (start_dt and end_dt) or (end_dt - start_dt) > timedelta(days=STREAM_MIN_DAYS)
+    if not large:
+        rows = await alist(rows)
+        occurrences = await sync_to_async(_occurrence_rows)(request)
+        return JsonResponse([_event_from_row(r) for r in chain(rows, occurrences)], safe=False)
+
+    occurrences = await sync_to_async(_occurrence_rows)(request)
+
+    async def stream():
+        yield "["
+        first = True
+        async for row in rows.aiterator(chunk_size=STREAM_CHUNK):
+            yield ("" if first else ",") + json.dumps(_event_from_row(row))
+            first = False
+        for row in occurrences:
+            yield ("" if first else ",") + json.dumps(_event_from_row(row))
+            first = False
+        yield "]"
+
+    return StreamingHttpResponse(stream(), content_type="application/json")
+
+
+async def api_substitution_preview_async(request):
+    try:
+        sid = int(request.GET.get("session_id"))
+        lid = int(request.GET.get("lecturer_id"))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("bad params")
+    try:
+        session = await ClassSession.objects.select_related("subject", "lecturer", "substitution").aget(id=sid)
+        lecturer = await Lecturer.objects.aget(id=lid)
+    except (ClassSession.DoesNotExist, Lecturer.DoesNotExist):
+        raise Http404("Nie ma takich zajęć lub wykładowcy")
+    result = await EligibilityEngine(session).aevaluate(lecturer)
+    return JsonResponse({"empty": False, **result})
 
-    # 4) zapis / aktualizacja
-    Substitution.objects.update_or_create(
-        session=session, defaults={"substitute_lecturer": lecturer}
-    )
+
+async def api_substitution_candidates_async(request):
+    try:
+        sid = int(request.GET.get("session_id"))
+        limit = _candidates_limit(request)
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("bad params")
+    try:
+        session = await ClassSession.objects.select_related("subject", "lecturer", "substitution").aget(id=sid)
+    except ClassSession.DoesNotExist:
+        raise Http404("Nie ma takich zajęć")
+    current = current_substitute_id(session)
+    return JsonResponse({
+        "session_id": session.id,
+        "current_lecturer_id": current,
+        "candidates": _top_candidates(await EligibilityEngine(session).arank(), limit, current),
+    })
+
+
+async def api_substitutions_async(request):
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST only")
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+        sid = int(payload.get("session_id"))
+        lid_raw = payload.get("lecturer_id")
+        lid = None if lid_raw in ("", None) else int(lid_raw)
+    except Exception:
+        return HttpResponseBadRequest("bad json")
+
+    if not await ClassSession.objects.filter(id=sid).aexists():
+        raise Http404("Nie ma takich zajęć")
+    if lid is None:
+        await Substitution.objects.filter(session_id=sid).adelete()
+        return JsonResponse({"cleared": True})
+
+    # rezerwacja pod blokadą w transakcji – transakcje nie mają async API
+    try:
+        result = await sync_to_async(book_substitution)(sid, lid)
+    except (ClassSession.DoesNotExist, Lecturer.DoesNotExist):
+        raise Http404("Nie ma takich zajęć lub wykładowcy")
+    if not result["ok"]:
+        return JsonResponse({"ok": False, "reason": EligibilityEngine.reason(result)})
     return JsonResponse({"ok": True})
 
+
+# -------------------- Planer zastępstw --------------------
+
+def api_plan_propose(request):
+    """
+    GET ?start=YYYY-MM-DD[&end=YYYY-MM-DD]  (end włącznie; domyślnie jeden dzień)
+    Propozycja zastępców dla wszystkich zajęć z needs_substitution w zakresie – nic nie zapisuje.
+    """
+    span = _day_span(request.GET.get("start"), request.GET.get("end"))
+    if span is None:
+        return HttpResponseBadRequest("bad params")
+    return JsonResponse(propose_plan(*span))
+
+
+def _day_span(start_str, end_str):
+    """[początek pierwszego dnia, początek dnia po ostatnim) w strefie lokalnej; None przy błędnych datach."""
+    start_date = _date_from_str(start_str)
+    end_date = _date_from_str(end_str) or start_date
+    if not start_date or end_date < start_date:
+        return None
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(start_date, datetime.min.time()), tz)
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), datetime.min.time()), tz)
+    return start, end
+
+
+def api_plan_commit(request):
+    """
+    POST JSON { "assignments": [ {"session_id": <int>, "lecturer_id": <int>}, ... ] }
+    Zapis całego planu w jednej transakcji – albo wszystko, albo nic (409 z listą problemów).
+    """
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST only")
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+        pairs = [(int(a["session_id"]), int(a["lecturer_id"])) for a in payload["assignments"]]
+    except Exception:
+        return HttpResponseBadRequest("bad json")
+
+    try:
+        saved = commit_plan(pairs)
+    except PlanConflict as exc:
+        return JsonResponse({
+            "ok": False,
+            "problems": [{"session_id": sid, "reason": reason} for sid, reason in exc.problems],
+        }, status=409)
+    return JsonResponse({"ok": True, "saved": saved})
+
+
+def api_absence(request):
+    """
+    POST JSON { "lecturer_id": <int>, "start": "YYYY-MM-DD", "end": "YYYY-MM-DD" (włącznie, opcjonalnie),
+                "reason": "...", "record_unavailability": true, "top": 5 }
+    Nieobecność wykładowcy: oznacza jego zajęcia w zakresie jako wymagające zastępstwa i zwraca
+    propozycje zastępców dla wszystkich naraz ("assignments" można od razu wysłać do plan/commit).
+    """
+    if request.method != "POST":
+        return HttpResponseBadRequest("POST only")
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+        lecturer_id = int(payload["lecturer_id"])
+        top = int(payload.get("top", 5))
+    except Exception:
+        return HttpResponseBadRequest("bad json")
+    span = _day_span(str(payload.get("start") or ""), str(payload.get("end") or ""))
+    if span is None:
+        return HttpResponseBadRequest("bad params")
+    get_object_or_404(Lecturer, id=lecturer_id)
+    try:
+        result = plan_absence(
+            lecturer_id, *span, reason=str(payload.get("reason", "")),
+            record_unavailability=bool(payload.get("record_unavailability", True)), top=max(0, top),
+        )
+    except PlanConflict as exc:
+        return JsonResponse({
+            "ok": False,
+            "problems": [{"session_id": sid, "reason": reason} for sid, reason in exc.problems],
+        }, status=409)
+    return JsonResponse(result)
+
+
+# -------------------- Metryki --------------------
+
+def metrics_view(request):
+    """Metryki żądań w formacie tekstowym Prometheusa (404, gdy ZASTEPSTWA_METRICS wyłączone)."""
+    if not metrics_enabled():
+        raise Http404
+    return HttpResponse(registry.prometheus(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@staff_member_required
+def metrics_summary(request):
+    """Podsumowanie dla obsługi (JSON): czasy i zapytania per widok + ostatnie wolne zapytania."""
+    if not metrics_enabled():
+        raise Http404
+    return JsonResponse(registry.summary(), json_dumps_params={"ensure_ascii": False, "indent": 2})